@@ -5,14 +5,38 @@ from routes.auth import auth as auth_routes
 from routes.users import users as users_routes
 from routes.medications import medications as medications_routes
 from routes.timesheets import timesheets as timesheets_routes
+from routes.metrics import metrics as metrics_routes
 from flask_injector import FlaskInjector
 from injector import singleton
 from services.medication_service import MedicationService
+from services.timesheet_service import TimesheetService
+from services.openai_service import OpenAIService
+from services.file_reader_service import FileReaderService
 from controllers.medications_controller import MedicationsController
+from controllers.timesheets_controller import TimesheetsController
+from services.timesheet_job_service import TimesheetJobService
+from db.timesheets import Timesheets
+from db.medications import Medications
+from db.medication_search import MedicationSearch
+from db.index_registry import IndexRegistry
+from services.json_provider import FastJSONProvider
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.serving import is_running_from_reloader
+import click
 
 app = Flask(__name__)
 app.secret_key = 'supersecretkey'  # Secret key for session management
 
+# Reject request bodies larger than an uploaded document, with room for the multipart headers, before they are read
+app.config['MAX_CONTENT_LENGTH'] = FileReaderService.MAX_FILE_BYTES + 64 * 1024
+
+# Encode responses with orjson when it is installed, including ObjectIds, dates and models
+app.json = FastJSONProvider(app)
+
+# nginx serves the API under /api and strips the prefix, trust its X-Forwarded-Prefix so generated URLs include it,
+# and its X-Forwarded-For so that request.remote_addr is the client's address rather than the proxy's
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_prefix=1)
+
 # Enable Cross-Origin Resource Sharing (CORS) for the app
 CORS(app)
 
@@ -24,6 +48,7 @@ app.register_blueprint(auth_routes, url_prefix='/auth')
 app.register_blueprint(users_routes, url_prefix='/users')
 app.register_blueprint(medications_routes, url_prefix='/medications')
 app.register_blueprint(timesheets_routes, url_prefix='/timesheets')
+app.register_blueprint(metrics_routes, url_prefix='/metrics')
 
 def configure(binder):
     """
@@ -32,8 +57,12 @@ def configure(binder):
     Args:
         binder: The dependency injection binder to bind services and controllers.
     """
+    binder.bind(OpenAIService, to=OpenAIService, scope=singleton)
     binder.bind(MedicationService, to=MedicationService, scope=singleton)
+    binder.bind(TimesheetService, to=TimesheetService, scope=singleton)
     binder.bind(MedicationsController, to=MedicationsController, scope=singleton)
+    binder.bind(TimesheetsController, to=TimesheetsController, scope=singleton)
+    binder.bind(TimesheetJobService, to=TimesheetJobService, scope=singleton)
 
 @app.route('/')
 def home():
@@ -45,9 +74,57 @@ def home():
     """
     return 'Home Page - <a href="/auth/login">Login</a>'
 
+@app.cli.command('compact-timesheets')
+def compact_timesheets():
+    """
+    Migrate the stored timesheets from explicit date lists to compact recurrences.
+
+    Run with `flask --app app compact-timesheets`.
+    """
+    updated_count = Timesheets.compact_dates()
+    print(f"Compacted {updated_count} timesheets")
+
+@app.cli.command('index-medication-search')
+def index_medication_search():
+    """
+    Add the search fields to the stored medications.
+
+    Run with `flask --app app index-medication-search`.
+    """
+    updated_count = MedicationSearch.backfill(Medications.COLLECTION_NAME)
+    print(f"Indexed {updated_count} medications for search")
+
+@app.cli.command('ensure-indexes')
+@click.option('--check', is_flag=True, help='Only report the missing indexes without creating them.')
+def ensure_indexes(check):
+    """
+    Create the indexes declared by the DAO classes that do not exist yet.
+
+    Run with `flask --app app ensure-indexes`.
+    """
+    report = IndexRegistry.apply(create=not check)
+    for collection_name, result in report.items():
+        print(f"{collection_name}: " + ", ".join(f"{status}={names}" for status, names in result.items() if names))
+
 # Integrate Flask with the Injector for dependency injection
-FlaskInjector(app=app, modules=[configure])
+flask_injector = FlaskInjector(app=app, modules=[configure])
+
+def start_job_workers():
+    """
+    Register the timesheet job handlers and start the job workers.
+
+    The handlers are registered by the controllers, so they are created first. Starting the workers at startup resumes
+    the jobs that were pending, or whose lease expired, when the application stopped. WSGI servers that fork workers
+    should call this in each worker process.
+    """
+    flask_injector.injector.get(MedicationsController)
+    flask_injector.injector.get(TimesheetsController)
+    flask_injector.injector.get(TimesheetJobService).start()
 
 # Run the Flask application
 if __name__ == '__main__':
+    IndexRegistry.apply()  # Create the missing indexes, some of them are unique, before serving requests
+    # The reloader runs this module in a watcher process too, only the serving process runs the jobs
+    if is_running_from_reloader():
+        start_job_workers()
     app.run(debug=True)  # Start the Flask development server with debug mode enabled
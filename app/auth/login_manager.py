@@ -1,5 +1,6 @@
 from flask_login import LoginManager, current_user
 from db.users import Users
+from db.user_cache import user_cache
 from functools import wraps
 from flask import redirect, url_for, flash
 from model.roles import Role
@@ -10,7 +11,9 @@ login_manager = LoginManager()
 @login_manager.user_loader
 def load_user(user_id):
     """
-    Load a user from the database by their user ID.
+    Load a user by their user ID.
+
+    The user is served from the in-process user cache when possible and loaded from the database otherwise.
 
     Args:
         user_id (str): The ID of the user to load.
@@ -18,7 +21,11 @@ def load_user(user_id):
     Returns:
         Users: The user object if found, otherwise None.
     """
-    return Users.find(user_id)
+    user = user_cache.get(user_id)
+    if user is None:
+        user = Users.find(user_id)
+        user_cache.put(user)
+    return user
 
 def init_login_manager(app):
     """
@@ -0,0 +1,102 @@
+"""
+Benchmark of the JSON encoding of the timesheet endpoint responses.
+
+Compares Flask's default JSON provider with `FastJSONProvider` on the payloads of `GET /timesheets/timesheet` (one
+timesheet) and `GET /timesheets/timesheets` (a page of timesheets), with every intake date expanded. The time spent
+converting the models to dictionaries is the same for both providers and is measured separately.
+
+Usage::
+
+    python benchmarks/timesheet_json.py [--medications 10] [--days 365] [--timesheets 20] [--repeat 20]
+"""
+from datetime import date, timedelta
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model.timesheet_model import TimeSheetModel, MedicationEntry, Recurrence
+from services.json_provider import FastJSONProvider, orjson
+from bson import ObjectId
+
+def build_timesheet(medication_count, days):
+    """
+    Build a timesheet with medications taken twice a day for a number of days.
+
+    :param medication_count: The number of medications.
+    :type medication_count: int
+    :param days: The number of days of the timesheet.
+    :type days: int
+    :return: The timesheet.
+    :rtype: TimeSheetModel
+    """
+    start = date(2026, 1, 1)
+    end = start + timedelta(days=days - 1)
+    medications = [
+        MedicationEntry(
+            id=str(ObjectId()),
+            name=f"Medication {index}",
+            dosage="1 tablet",
+            advise="Take with food.",
+            recurrence=Recurrence(start.isoformat(), end.isoformat(), ['08:00', '20:00'])
+        )
+        for index in range(medication_count)
+    ]
+    return TimeSheetModel(str(ObjectId()), medications, start.isoformat(), end.isoformat(), _id=ObjectId())
+
+def measure(function, repeat):
+    """
+    Measure the median duration of a function call.
+
+    :param function: The function to call.
+    :type function: callable
+    :param repeat: The number of calls.
+    :type repeat: int
+    :return: The median duration in milliseconds.
+    :rtype: float
+    """
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - started) * 1000)
+    return statistics.median(durations)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--medications', type=int, default=10)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--timesheets', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    timesheets = [build_timesheet(args.medications, args.days) for _ in range(args.timesheets)]
+    payloads = {
+        'GET /timesheets/timesheet': lambda: timesheets[0].expanded_asdict(),
+        'GET /timesheets/timesheets': lambda: [timesheet.expanded_asdict() for timesheet in timesheets],
+    }
+    app = Flask(__name__)
+    providers = {'default': DefaultJSONProvider(app), 'fast': FastJSONProvider(app)}
+
+    print(f"orjson: {'installed' if orjson is not None else 'not installed, using the standard library'}")
+    print(f"{args.medications} medications, {args.days} days, {args.timesheets} timesheets per page")
+    with app.app_context():
+        for endpoint, build_payload in payloads.items():
+            payload = build_payload()
+            size = len(providers['default'].response(payload).get_data())
+            print(f"\n{endpoint} ({size / 1024:.0f} KiB)")
+            print(f"  models to dictionaries: {measure(build_payload, args.repeat):8.2f} ms")
+            durations = {
+                name: measure(lambda: provider.response(payload), args.repeat) for name, provider in providers.items()
+            }
+            for name, duration in durations.items():
+                print(f"  {name + ' provider:':23} {duration:8.2f} ms")
+            print(f"  speedup: {durations['default'] / durations['fast']:.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark of loading and converting timesheet models.
+
+Loads timesheet documents as they are returned by MongoDB into `TimeSheetModel` instances and measures the memory the
+models retain and the time spent in `from_document`, `to_document`, `asdict` and `expanded_asdict`. Half of the
+documents store their medication entries as compact recurrences and half as explicit date lists.
+
+Usage::
+
+    python benchmarks/timesheet_models.py [--timesheets 10000] [--medications 5]
+"""
+from bson import ObjectId
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model.timesheet_model import TimeSheetModel
+
+def build_documents(timesheet_count, medication_count):
+    """
+    Build timesheet documents in their stored form.
+
+    :param timesheet_count: The number of timesheets.
+    :type timesheet_count: int
+    :param medication_count: The number of medication entries of each timesheet.
+    :type medication_count: int
+    :return: The timesheet documents.
+    :rtype: list of dict
+    """
+    documents = []
+    for index in range(timesheet_count):
+        medications = []
+        for _ in range(medication_count):
+            entry = {'id': str(ObjectId()), 'dosage': '1 tablet', 'advise': 'Take with food.', 'name': ''}
+            if index % 2:
+                entry.update(
+                    dates=[],
+                    recurrence={
+                        'start_date': '2026-01-01',
+                        'end_date': '2026-03-31',
+                        'times_of_day': ['08:00', '20:00'],
+                        'interval_days': 1
+                    },
+                    excluded_dates=['2026-01-05T08:00:00'],
+                    extra_dates=[]
+                )
+            else:
+                entry.update(
+                    dates=[f"2026-01-{day:02d}T{time}:00" for day in range(1, 31) for time in ('08:00', '20:00')],
+                    recurrence=None,
+                    excluded_dates=[],
+                    extra_dates=[]
+                )
+            medications.append(entry)
+        documents.append({
+            '_id': ObjectId(),
+            'user_id': str(ObjectId()),
+            'medications': medications,
+            'start_date': '2026-01-01',
+            'end_date': '2026-03-31'
+        })
+    return documents
+
+def measure(label, function):
+    """
+    Measure and print the duration of a function call.
+
+    :param label: The label of the measurement.
+    :type label: str
+    :param function: The function to call.
+    :type function: callable
+    :return: The result of the function.
+    :rtype: Any
+    """
+    gc.collect()
+    started = time.perf_counter()
+    result = function()
+    print(f"  {label + ':':18} {(time.perf_counter() - started) * 1000:8.0f} ms")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--timesheets', type=int, default=10000)
+    parser.add_argument('--medications', type=int, default=5)
+    args = parser.parse_args()
+
+    documents = build_documents(args.timesheets, args.medications)
+    print(f"{args.timesheets} timesheets with {args.medications} medications each")
+
+    timesheets = measure('from_document', lambda: [TimeSheetModel.from_document(document) for document in documents])
+
+    # Measure the memory in a separate load, as tracing allocations slows them down
+    del timesheets
+    gc.collect()
+    tracemalloc.start()
+    timesheets = [TimeSheetModel.from_document(document) for document in documents]
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {'retained memory:':18} {retained / 1024 / 1024:8.1f} MiB")
+
+    measure('to_document', lambda: [timesheet.to_document() for timesheet in timesheets])
+    measure('asdict', lambda: [timesheet.asdict() for timesheet in timesheets])
+    measure('expanded_asdict', lambda: [timesheet.expanded_asdict() for timesheet in timesheets])
+
+if __name__ == '__main__':
+    main()
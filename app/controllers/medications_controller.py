@@ -1,14 +1,21 @@
 from model.medication_model import MedicationModel
+from model.dosage_rule_model import DosageRule
 from db.medications import Medications
+from db.user_medications import UserMedications
+from db.medication_repository import MedicationRepository
+from db.page_cursor import PageCursor
 from flask import jsonify, request, make_response
 from typing import Dict
 from flask_login import current_user, login_required
 from services.medication_service import MedicationService
+from services.file_reader_service import DocumentLimitError
+from services.document_extraction_service import ExtractionOverloadError
 from services.timesheet_service import TimesheetService
+from services.timesheet_job_service import TimesheetJobService
 from db.timesheets import Timesheets
 from model.timesheet_model import TimeSheetModel, MedicationEntry
+from model.timesheet_job_model import TimesheetJobModel
 from injector import inject
-import json
 from pymongo import DESCENDING, ASCENDING
 from model.user_medication_model import UserMedicationModel
 
@@ -16,27 +23,51 @@ class MedicationsController:
     """
     Controller class for managing medication-related operations.
     """
+    UPDATE_USER_TIMESHEETS_JOB = "update_user_timesheets"
+    USER_MEDICATION_FIELDS = ('name', 'contents', 'objective', 'side_effects')
     
     @inject
-    def __init__(self, medication_service: MedicationService, timesheet_service: TimesheetService):
+    def __init__(self, medication_service: MedicationService, timesheet_service: TimesheetService, job_service: TimesheetJobService):
         """
         Initialize the MedicationsController with service instances.
 
+        Registers the handler for the user timesheet update job with the job service.
+
         :param medication_service: The service used to manage medication-related operations.
         :param timesheet_service: The service used to manage timesheet-related operations.
+        :param job_service: The service used to run timesheet generation in the background.
         """
         self.medication_service = medication_service
         self.timesheet_service = timesheet_service
+        self.job_service = job_service
+        self.job_service.register_handler(MedicationsController.UPDATE_USER_TIMESHEETS_JOB, self._run_update_user_timesheets_job)
 
-    def create_medication(self):
+    def create_medication(self, file=None):
         """
-        Create a new medication from JSON data.
+        Create a new medication from JSON data or from an uploaded file.
 
+        :param file: The uploaded file containing medication data, or None to read the medication from the JSON body.
+        :type file: FileStorage, optional
         :return: A response indicating the success or failure of the medication creation.
         :rtype: Response
         :statuscode 201: Medication created successfully
-        :statuscode 400: Bad request (e.g., invalid JSON format or missing required fields)
+        :statuscode 400: Bad request (e.g., invalid JSON or file format or missing required fields)
+        :statuscode 413: The uploaded file is larger than the byte or page limit
+        :statuscode 503: The document extraction queue is full, retry after the Retry-After header
         """
+        if file is not None:
+            try:
+                data: Dict = self.medication_service.parse_medication_data(file)
+            except DocumentLimitError as e:
+                return make_response(jsonify({"error": str(e)}), 413)
+            except ExtractionOverloadError as e:
+                response = make_response(jsonify({"error": str(e)}), 503)
+                response.headers["Retry-After"] = str(e.retry_after)
+                return response
+            except (ValueError, IOError) as e:
+                return make_response(jsonify({"error": str(e)}), 400)
+            return self.__create_medication(data)
+
         try:
             data: Dict = request.get_json()
             if data is None:
@@ -44,23 +75,8 @@ class MedicationsController:
         except Exception as e:
             return make_response(jsonify({"error": f"Failed to parse JSON: {str(e)}"}), 400)
         return self.__create_medication(data)
-    
-    @inject
-    def create_medication(self, file):
-        """
-        Create a new medication from an uploaded file.
-
-        :param file: The uploaded file containing medication data.
-        :type file: FileStorage
-        :return: A response indicating the success or failure of the medication creation.
-        :rtype: Response
-        :statuscode 201: Medication created successfully
-        :statuscode 400: Bad request (e.g., invalid file format or missing required fields)
-        """
-        data: Dict = self.medication_service.parse_medication_data(file)
-        return self.__create_medication(data)
 
-    def get_medications_for_user(self, page, per_page, sort_field=None, sort_direction=None, **filters):
+    def get_medications_for_user(self, page, per_page, sort_field=None, sort_direction=None, after=None, include_count=True, fields=None, **filters):
         """
         Get a list of medications for the current user with optional filters and pagination.
 
@@ -72,12 +88,18 @@ class MedicationsController:
         :type sort_field: str, optional
         :param sort_direction: The direction of sorting (asc or desc).
         :type sort_direction: str, optional
+        :param after: The cursor of the previous page, used instead of the page number if given.
+        :type after: str, optional
+        :param include_count: Whether to count the matching medications, `total_count` is None otherwise.
+        :type include_count: bool, optional
+        :param fields: Comma-separated medication fields to return, the list view fields if not given.
+        :type fields: str, optional
         :param filters: Optional filters for medication attributes.
         :type filters: dict
         :return: A JSON response containing the list of medications and pagination details.
         :rtype: Response
         :statuscode 200: Successfully retrieved medications
-        :statuscode 400: Bad request (e.g., invalid pagination parameters)
+        :statuscode 400: Bad request (e.g., invalid pagination parameters or cursor)
         """
         try:
             page = int(page)
@@ -88,14 +110,19 @@ class MedicationsController:
             return make_response(jsonify({"error": "Pagination parameters must be integers"}), 400)
         
         user_id = str(current_user.id)
-        total_count, medications = Medications.find_by_user_id(
-            user_id, page, per_page, sort_field, sort_direction, filters
-        )
+        try:
+            fields = self._parse_fields(fields)
+            total_count, medications = Medications.find_by_user_id(
+                user_id, page, per_page, sort_field, sort_direction, filters, after, include_count, fields
+            )
+        except ValueError as e:
+            return make_response(jsonify({"error": str(e)}), 400)
         return jsonify({
-            'medications': [json.loads(MedicationModel(**med).to_json()) for med in medications],
+            'medications': [MedicationModel.to_row(med, fields) for med in medications],
             'total_count': total_count,
             'page': page,
-            'per_page': per_page
+            'per_page': per_page,
+            'next_after': self._next_cursor(medications, per_page, sort_field, sort_direction)
         })
 
     def get_medication(self, medication_id):
@@ -111,13 +138,16 @@ class MedicationsController:
         """
         medication = Medications.find(medication_id)
         if medication:
-            return jsonify(json.loads(medication.to_json()))
+            return jsonify(medication)
         return make_response(jsonify({"error": "Medication not found"}), 404)
 
     def delete_medication(self, medication_id):
         """
         Delete a medication by its ID.
 
+        The entry of the medication is removed from the user's timesheets by a background job, whose ID is returned in
+        the response.
+
         :param medication_id: The ID of the medication to delete.
         :type medication_id: str
         :return: A response indicating the success or failure of the deletion.
@@ -127,8 +157,10 @@ class MedicationsController:
         """
         result = Medications.delete(medication_id)
         if result.deleted_count:
-            self.__update_user_timesheet()
-            return jsonify({"deleted_count": result.deleted_count})
+            job = self.job_service.enqueue(
+                str(current_user.id), MedicationsController.UPDATE_USER_TIMESHEETS_JOB, {'removed_medication_id': medication_id}
+            )
+            return jsonify({"deleted_count": result.deleted_count, "timesheet_job_id": job.get_id()})
         return make_response(jsonify({"error": "Medication not found"}), 404)
     
     def __create_medication(self, data: Dict):
@@ -148,17 +180,27 @@ class MedicationsController:
             if field not in data or not data[field]:
                 return make_response(jsonify({"error": f"Missing required field: {field}"}), 400)
         
+        # Keep the dosage rule extracted together with the medication data, it is extracted later if it is invalid
+        try:
+            dosage_rule = DosageRule(**data['dosageRule']) if isinstance(data.get('dosageRule'), dict) else None
+        except (TypeError, ValueError):
+            dosage_rule = None
+
         medication = MedicationModel(
             name=data['name'],
             contents=data['contents'],
             objective=data['objective'],
             side_effects=data['sideEffects'],
             dosage_schedule=data['dosageSchedule'],
-            user_id=str(current_user.id)
+            user_id=str(current_user.id),
+            dosage_rule=dosage_rule
         )
         
         saved_medication = Medications.add(medication)
-        return saved_medication.to_json(), 201
+        self.job_service.enqueue(
+            str(current_user.id), MedicationsController.UPDATE_USER_TIMESHEETS_JOB, {'added_medication_id': saved_medication.get_id()}
+        )
+        return jsonify(saved_medication), 201
 
     def update_medication(self, medication_id):
         """
@@ -209,19 +251,16 @@ class MedicationsController:
         :statuscode 200: Successfully retrieved user medications
         """
         user_id = str(current_user.id)
-        total_count, user_medications = UserMedicationModel.find_by_user_id(user_id)
+        total_count, user_medications = UserMedications.find_by_user_id(user_id)
         
         # Convert to list of UserMedicationModel instances
-        user_medication_models = [UserMedicationModel(**med) for med in user_medications]
+        user_medication_models = [UserMedicationModel.from_document(med) for med in user_medications]
         
         # Get all unique medication IDs
         medication_ids = [med.medication_id for med in user_medication_models]
         
-        # Fetch the actual medication details
-        medications = Medications.find_by_ids(medication_ids)
-        
-        # Create a map of medication details
-        medication_map = {str(med.get_id()): med for med in medications}
+        # Fetch the actual medication details and map them by ID
+        medication_map = MedicationRepository.get_many(medication_ids, MedicationsController.USER_MEDICATION_FIELDS)
         
         # Combine medication details with user-specific medication data
         result = []
@@ -246,48 +285,120 @@ class MedicationsController:
             'total_count': total_count
         })
 
-    def __update_user_timesheet(self):
+    def _run_update_user_timesheets_job(self, job: TimesheetJobModel):
         """
-        Helper method to update or create user's timesheet after medication changes.
+        Update the user's timesheets for a queued update job.
+
+        Jobs for a removed or added medication only update the entry of that medication and the advice of the other
+        entries.
+
+        :param job: The claimed user timesheet update job.
+        :type job: TimesheetJobModel
+        :return: An empty job result.
+        :rtype: dict
+        :raises ValueError: If the job names neither a removed nor an added medication.
         """
-        user_id = str(current_user.id)
-        timesheets = Timesheets.find_by_user_id(user_id)
-        
-        # Get all user's medications
-        medications = Medications.find_by_user_id(user_id)
-        if not medications:
-            # If user has no medications, delete any existing timesheet
-            if timesheets:
-                for ts in timesheets:
-                    Timesheets.delete(ts.id)
-            return
-        medications_dict = [MedicationModel(**med) for med in medications]
-        medication_ids = [str(med.id) for med in medications_dict]
-        
-        if not timesheets:
-            # Create new timesheet if none exists
-            from datetime import datetime, timedelta
-            start_date = datetime.now().date()
-            end_date = start_date + timedelta(days=30)  # Default to 30 days
-            
-            timesheet_data = {
-                'medication_ids': medication_ids,
-                'start_date': start_date.isoformat(),
-                'end_date': end_date.isoformat()
-            }
-            
-            new_timesheet = self._build_timesheet(timesheet_data)
-            Timesheets.add(new_timesheet)
+        if job.payload.get('removed_medication_id'):
+            self.__remove_from_user_timesheets(job.user_id, job.payload['removed_medication_id'])
+        elif job.payload.get('added_medication_id'):
+            self.__add_to_user_timesheets(job.user_id, job.payload['added_medication_id'])
         else:
-            # Update existing timesheet with current medications
-            for timesheet in timesheets:
-                timesheet_data = {
-                    'medication_ids': medication_ids,
+            raise ValueError("The job has neither a removed nor an added medication.")
+        return {}
+
+    def __remove_from_user_timesheets(self, user_id, medication_id):
+        """
+        Remove the entry of a deleted medication from the user's timesheets.
+
+        Timesheets left without entries are deleted. The advice of the remaining entries is regenerated, as it may
+        refer to the removed medication, but their dates are kept.
+
+        :param user_id: The ID of the user whose timesheets should be updated.
+        :type user_id: str
+        :param medication_id: The ID of the deleted medication.
+        :type medication_id: str
+        """
+        for timesheet in Timesheets.find_by_user_id(user_id, medication_id):
+            if not timesheet.medications:
+                continue
+            updated_timesheet = Timesheets.remove_medication_entry(timesheet.get_id(), medication_id)
+            if updated_timesheet is None:
+                continue
+            if not updated_timesheet.medications:
+                Timesheets.delete(updated_timesheet.get_id())
+                continue
+            medications = MedicationRepository.get_many(
+                [med.id for med in updated_timesheet.medications], MedicationRepository.TIMESHEET_FIELDS
+            )
+            self.__update_advice(updated_timesheet, medications)
+
+    def __add_to_user_timesheets(self, user_id, medication_id):
+        """
+        Add the entry of a new medication to the user's timesheets.
+
+        The dates of the new entry are expanded from its dosage rule and the advice of the other entries is
+        regenerated, so only the advice is requested from OpenAI. Timesheets are regenerated if the medication has no
+        dosage rule. Nothing is done if the user has no timesheets, they are only created on request.
+
+        :param user_id: The ID of the user whose timesheets should be updated.
+        :type user_id: str
+        :param medication_id: The ID of the added medication.
+        :type medication_id: str
+        """
+        for timesheet in Timesheets.find_by_user_id(user_id):
+            medication_ids = [med.id for med in timesheet.medications]
+            if medication_id in medication_ids:
+                continue
+            medications = MedicationRepository.get_many(
+                medication_ids + [medication_id], MedicationRepository.TIMESHEET_FIELDS
+            )
+            medication = medications.get(medication_id)
+            if medication is None:
+                return
+            medication_data = self.medication_service.get_timesheet_data(medication)
+            if medication_data['dosage_rule'] is None:
+                # The dates can only be generated by OpenAI together with the other medications
+                updated_timesheet = self._build_timesheet({
+                    'medication_ids': medication_ids + [medication_id],
                     'start_date': timesheet.start_date,
                     'end_date': timesheet.end_date
-                }
-                updated_timesheet = self._build_timesheet(timesheet_data)
+                }, user_id)
+                updated_timesheet.set_id(timesheet.get_id())
                 Timesheets.update(updated_timesheet)
+                continue
+
+            advice = self.__update_advice(timesheet, medications)
+            entry = self.timesheet_service.build_entry(
+                medication_data, timesheet.start_date, timesheet.end_date, advice.get(medication_id, "")
+            )
+            Timesheets.add_medication_entry(timesheet.get_id(), MedicationEntry(
+                id=entry["id"],
+                dosage=entry["dosage"],
+                dates=entry["dates"],
+                advise=entry["advise"]
+            ))
+
+    def __update_advice(self, timesheet: TimeSheetModel, medications):
+        """
+        Regenerate the advice for a set of medications and store the advice of the timesheet entries that changed.
+
+        The advice is cached by the medications it was generated for, so a set of medications that was already
+        advised is not sent to OpenAI again.
+
+        :param timesheet: The timesheet whose entries should be updated.
+        :type timesheet: TimeSheetModel
+        :param medications: The medications to advise on, by ID, including any medication not yet in the timesheet.
+        :type medications: dict
+        :return: A dictionary mapping each medication ID to its advice.
+        :rtype: dict
+        """
+        medications_data = [self.medication_service.get_timesheet_data(med) for med in medications.values()]
+        advice = self.timesheet_service.build_advice(medications_data)
+        changed_advice = {
+            med.id: advice[med.id] for med in timesheet.medications if advice.get(med.id) and advice[med.id] != med.advise
+        }
+        Timesheets.update_advice(timesheet.get_id(), changed_advice)
+        return advice
 
     def _build_timesheet(self, data, user_id=None):
         """
@@ -302,16 +413,12 @@ class MedicationsController:
         end_date = data['end_date']
 
         # Retrieve medications from the database
-        medications = [Medications.find(med_id) for med_id in medication_ids]
+        medications = MedicationRepository.get_many(medication_ids, MedicationRepository.TIMESHEET_FIELDS)
 
         # Prepare data for timesheet service
         medications_data = [
-            {
-                "id": str(med.id),
-                "name": med.name,
-                "dosage_schedule": med.dosage_schedule,
-                "objective": med.objective
-            } for med in medications if med
+            self.medication_service.get_timesheet_data(medications[med_id])
+            for med_id in medication_ids if med_id in medications
         ]
 
         # Generate timesheet using service
@@ -342,10 +449,14 @@ class MedicationsController:
         )
 
     @login_required
-    def get_all_medications(self, page, per_page, sort_field=None, sort_direction=None, **filters):
+    def get_all_medications(self, page, per_page, sort_field=None, sort_direction=None, after=None, include_count=True, fields=None, **filters):
         """
         Get a list of all medications with optional filters and pagination.
 
+        If a cursor is given in `after`, the page following it is returned instead of the page with the given number.
+        Every response contains the cursor of the next page in `next_after`, None on the last page. Filtered results
+        without an explicit sort order are ranked by relevance and are paginated by page number only.
+
         :param page: The page number for pagination.
         :type page: int
         :param per_page: The number of items per page.
@@ -354,27 +465,76 @@ class MedicationsController:
         :type sort_field: str, optional
         :param sort_direction: The direction of sorting (asc or desc).
         :type sort_direction: str, optional
+        :param after: The cursor of the previous page.
+        :type after: str, optional
+        :param include_count: Whether to count the matching medications, `total_count` is None otherwise.
+        :type include_count: bool, optional
+        :param fields: Comma-separated medication fields to return, the list view fields if not given.
+        :type fields: str, optional
         :param filters: Optional filters for medication attributes.
         :type filters: dict
         :return: A JSON response containing the list of medications and pagination details.
         :rtype: Response
         :statuscode 200: Successfully retrieved medications
-        :statuscode 400: Bad request (e.g., invalid pagination parameters)
+        :statuscode 400: Bad request (e.g., invalid pagination parameters or cursor)
         """
         try:
+            fields = self._parse_fields(fields)
             total_count, medications = Medications.find_all(
-                page=page,
+                page=None if after else page,
                 per_page=per_page,
                 sort_field=sort_field,
                 sort_direction=sort_direction,
-                filters=filters
+                filters=filters,
+                after=after,
+                include_count=include_count,
+                fields=fields
             )
         except ValueError as e:
             return make_response(jsonify({"error": str(e)}), 400)
         
         return jsonify({
-            'medications': [json.loads(MedicationModel(**med).to_json()) for med in medications],
+            'medications': [MedicationModel.to_row(med, fields) for med in medications],
             'total_count': total_count,
-            'page': page,
-            'per_page': per_page
+            'page': None if after else page,
+            'per_page': per_page,
+            'next_after': None if Medications.is_ranked(filters, sort_field, sort_direction, after)
+                else self._next_cursor(medications, per_page, sort_field, sort_direction)
         })
+
+    def _parse_fields(self, fields):
+        """
+        Parse the medication fields requested by a list endpoint.
+
+        :param fields: Comma-separated medication fields, or None for the list view fields.
+        :type fields: str or None
+        :return: The requested fields.
+        :rtype: tuple of str
+        :raises ValueError: If a requested field is unknown.
+        """
+        if not fields:
+            return MedicationModel.LIST_FIELDS
+        requested = tuple(dict.fromkeys(field.strip() for field in fields.split(',') if field.strip()))
+        unknown = [field for field in requested if field not in MedicationModel.ROW_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown medication fields: {', '.join(unknown)}")
+        return requested
+
+    def _next_cursor(self, documents, per_page, sort_field, sort_direction):
+        """
+        Build the cursor of the page following a page of documents.
+
+        :param documents: The documents of the current page.
+        :type documents: list of dict
+        :param per_page: The number of items per page.
+        :type per_page: int
+        :param sort_field: The field the results are sorted by.
+        :type sort_field: str or None
+        :param sort_direction: The direction of sorting (asc or desc).
+        :type sort_direction: str or None
+        :return: The cursor, or None if the page is the last one.
+        :rtype: str or None
+        """
+        if not documents or len(documents) < per_page:
+            return None
+        return PageCursor.encode(sort_field, sort_direction, documents[-1])
@@ -1,39 +1,54 @@
-from flask import jsonify, request, make_response
+from flask import jsonify, request, make_response, url_for, current_app, Response, stream_with_context
 from typing import List, Dict
 from flask_login import current_user
 from services.medication_service import MedicationService
 from services.timesheet_service import TimesheetService
+from services.timesheet_job_service import TimesheetJobService
 from db.timesheets import Timesheets
-from db.medications import Medications
+from db.medication_repository import MedicationRepository
 from model.timesheet_model import TimeSheetModel, MedicationEntry
+from model.timesheet_job_model import TimesheetJobModel
 from injector import inject
+from bson.objectid import ObjectId
 from datetime import datetime
 
 class TimesheetsController:
     """
     Controller class for managing timesheet-related operations.
     """
+    CREATE_TIMESHEET_JOB = "create_timesheet"
+    EDIT_TIMESHEET_JOB = "edit_timesheet"
     
     @inject
-    def __init__(self, medication_service: MedicationService, timesheet_service: TimesheetService):
+    def __init__(self, medication_service: MedicationService, timesheet_service: TimesheetService, job_service: TimesheetJobService):
         """
-        Initialize the TimesheetsController with MedicationService and TimesheetService instances.
+        Initialize the TimesheetsController with MedicationService, TimesheetService and TimesheetJobService instances.
+
+        Registers the handlers for the timesheet creation and edit jobs with the job service.
 
         :param medication_service: The service used to manage medication-related operations.
         :type medication_service: MedicationService
         :param timesheet_service: The service used to manage timesheet-related operations.
         :type timesheet_service: TimesheetService
+        :param job_service: The service used to run timesheet generation in the background.
+        :type job_service: TimesheetJobService
         """
         self.medication_service = medication_service
         self.timesheet_service = timesheet_service
+        self.job_service = job_service
+        self.job_service.register_handler(TimesheetsController.CREATE_TIMESHEET_JOB, self._run_create_timesheet_job)
+        self.job_service.register_handler(TimesheetsController.EDIT_TIMESHEET_JOB, self._run_edit_timesheet_job)
 
     def create_timesheet(self):
         """
         Create a new timesheet for the current user based on provided medication IDs and date range.
 
-        :return: A response indicating the success or failure of the timesheet creation.
+        The timesheet is generated by a background job. The response contains the job ID, and the job status can be
+        polled with `get_timesheet_job`.
+
+        :return: A response indicating that the timesheet creation job was queued, or an error.
         :rtype: Response
-        :statuscode 201: Timesheet created successfully
+        :statuscode 202: Timesheet creation job queued
         :statuscode 400: Bad request (e.g., missing required fields or invalid date format)
         """
         data: Dict = request.get_json()
@@ -44,54 +59,94 @@ class TimesheetsController:
             if field not in data or not data[field]:
                 return make_response(jsonify({"error": f"Missing required field: {field}"}), 400)
         
-        # Build and save the new timesheet
-        new_timesheet = self._build_timesheet(data)
+        # Queue the timesheet generation
+        payload = {field: data[field] for field in required_fields}
+        job = self.job_service.enqueue(str(current_user.id), TimesheetsController.CREATE_TIMESHEET_JOB, payload)
+        return self._job_accepted(job)
+
+    def _run_create_timesheet_job(self, job: TimesheetJobModel):
+        """
+        Build and save a new timesheet for a queued creation job.
+
+        :param job: The claimed timesheet creation job.
+        :type job: TimesheetJobModel
+        :return: The job result containing the ID of the new timesheet.
+        :rtype: dict
+        """
+        new_timesheet = self._build_timesheet(job.payload, job.user_id)
         saved_timesheet = Timesheets.add(new_timesheet)
-        return jsonify(saved_timesheet.asdict()), 201
+        return {"timesheet_id": saved_timesheet.get_id()}
 
-    def get_all_timesheets(self):
+    def get_all_timesheets(self, page=None, per_page=None, date_from=None, date_to=None, medication_id=None):
         """
         Get all timesheets for the current user.
 
-        :return: A JSON response containing the list of all timesheets for the user.
+        The timesheets and their medication names are loaded with a single aggregation. Only the intake dates within
+        the requested window are expanded and returned.
+
+        :param page: The page number for pagination, or None for all timesheets.
+        :type page: int, optional
+        :param per_page: The number of timesheets per page.
+        :type per_page: int, optional
+        :param date_from: The first day of the window in 'YYYY-MM-DD' format, or None for no lower bound.
+        :type date_from: str, optional
+        :param date_to: The last day of the window in 'YYYY-MM-DD' format, or None for no upper bound.
+        :type date_to: str, optional
+        :param medication_id: The ID of a medication to limit the timesheets to, or None for all medications.
+        :type medication_id: str, optional
+        :return: A JSON response containing the list of timesheets for the user. When paginated, the total number of
+            timesheets is returned in the X-Total-Count header.
         :rtype: Response
         :statuscode 200: Successfully retrieved timesheets
+        :statuscode 400: Invalid pagination parameters or window
         """
         user_id = str(current_user.id)  # Get the current user's ID
-        timesheets = Timesheets.find_by_user_id(user_id)  # Fetch timesheets for the current user
-        
-        # Fetch medication names and link them to each medication entry
-        for ts in timesheets:
-            medication_ids = [med.id for med in ts.medications]
-            medications = Medications.find_by_ids(medication_ids)
-            medication_dict = {med.id: med.name for med in medications}
-            
-            for med_entry in ts.medications:
-                med_entry.name = medication_dict.get(med_entry.id)  # Link name to each medication entry
-        
-        return jsonify([ts.asdict() for ts in timesheets]), 200
+        try:
+            window_start, window_end = self._parse_window(date_from, date_to)
+            result = Timesheets.find_by_user_id_with_names(user_id, page, per_page, medication_id)
+        except ValueError as e:
+            return make_response(jsonify({"error": str(e)}), 400)
 
-    def get_timesheet_by_id(self, id):
+        if page is None:
+            return jsonify([ts.expanded_asdict(window_start, window_end) for ts in result]), 200
+
+        total_count, timesheets = result
+        response = make_response(jsonify([ts.expanded_asdict(window_start, window_end) for ts in timesheets]), 200)
+        response.headers["X-Total-Count"] = str(total_count)
+        return response
+
+    def get_timesheet_by_id(self, id, date_from=None, date_to=None, medication_id=None):
         """
         Get a timesheet by its ID.
 
+        Only the intake dates within the requested window are expanded and returned.
+
         :param id: The ID of the timesheet to retrieve.
         :type id: str
+        :param date_from: The first day of the window in 'YYYY-MM-DD' format, or None for no lower bound.
+        :type date_from: str, optional
+        :param date_to: The last day of the window in 'YYYY-MM-DD' format, or None for no upper bound.
+        :type date_to: str, optional
+        :param medication_id: The ID of a medication to limit the timesheet to, or None for all medications.
+        :type medication_id: str, optional
         :return: A JSON response containing the timesheet details.
         :rtype: Response
         :statuscode 200: Successfully retrieved timesheet
+        :statuscode 400: Invalid window
         :statuscode 404: Timesheet not found
         """
-        timesheet = Timesheets.find(id)
+        try:
+            window_start, window_end = self._parse_window(date_from, date_to)
+        except ValueError as e:
+            return make_response(jsonify({"error": str(e)}), 400)
+
+        try:
+            timesheet = Timesheets.find(id, medication_id)
+        except ValueError:
+            timesheet = None
         if timesheet:
-            medication_ids = [med.id for med in timesheet.medications]
-            medications = Medications.find_by_ids(medication_ids)
-            medication_dict = {str(med.id): med.name for med in medications}
-            
-            for med_entry in timesheet.medications:
-                med_entry.name = medication_dict.get(med_entry.id)  # Link name to each medication entry
-            
-            return jsonify(timesheet.asdict()), 200
+            self._link_medication_names([timesheet])
+            return jsonify(timesheet.expanded_asdict(window_start, window_end)), 200
         return make_response(jsonify({"error": "Timesheet not found"}), 404)
 
     def delete_timesheet(self, id):
@@ -115,12 +170,18 @@ class TimesheetsController:
         """
         Edit an existing timesheet.
 
+        The timesheet is updated in place by a background job. The response contains the job ID, and the job status can
+        be polled with `get_timesheet_job`. If the request contains the `version` of the timesheet it is based on, the
+        edit is rejected when the timesheet has been updated since.
+
         :param id: The ID of the timesheet to edit.
         :type id: str
-        :return: A response indicating the success or failure of the edit operation.
+        :return: A response indicating that the timesheet edit job was queued, or an error.
         :rtype: Response
-        :statuscode 200: Timesheet updated successfully
+        :statuscode 202: Timesheet edit job queued
+        :statuscode 400: Bad request (e.g., missing required fields or a version that is not an integer)
         :statuscode 404: Timesheet not found
+        :statuscode 409: The timesheet has been updated since the given version
         """
         data = request.get_json()
         # Validate required fields
@@ -128,20 +189,143 @@ class TimesheetsController:
         for field in required_fields:
             if field not in data or not data[field]:
                 return make_response(jsonify({"error": f"Missing required field: {field}"}), 400)
+        if "version" in data and (not isinstance(data["version"], int) or isinstance(data["version"], bool)):
+            return make_response(jsonify({"error": "version must be an integer."}), 400)
 
         # Fetch the existing timesheet
-        existing_timesheet = Timesheets.find(id)
+        try:
+            existing_timesheet = Timesheets.find(id)
+        except ValueError:
+            existing_timesheet = None
         if not existing_timesheet:
             return make_response(jsonify({"error": "Timesheet not found"}), 404)
 
-        # Build a new timesheet with updated data
-        new_timesheet = self._build_timesheet(data, existing_timesheet.user_id)
-        
-        # Save the new timesheet and delete the old one
-        Timesheets.add(new_timesheet)
-        Timesheets.delete(id)
+        version = data.get("version", existing_timesheet.version)
+        if version != existing_timesheet.version:
+            return make_response(jsonify({
+                "error": "The timesheet has been updated since it was loaded.",
+                "version": existing_timesheet.version
+            }), 409)
+
+        # Queue the update of the timesheet
+        payload = {field: data[field] for field in required_fields}
+        payload.update({"timesheet_id": id, "user_id": existing_timesheet.user_id, "version": version})
+        job = self.job_service.enqueue(str(current_user.id), TimesheetsController.EDIT_TIMESHEET_JOB, payload)
+        return self._job_accepted(job)
+
+    def _run_edit_timesheet_job(self, job: TimesheetJobModel):
+        """
+        Update a timesheet in place for a queued edit job.
+
+        The update is written only if the timesheet still has the version the edit is based on.
+
+        :param job: The claimed timesheet edit job.
+        :type job: TimesheetJobModel
+        :return: The job result containing the ID and the new version of the timesheet.
+        :rtype: dict
+        :raises ValueError: If the timesheet does not exist or has been updated since the edit was requested.
+        """
+        timesheet = Timesheets.find(job.payload["timesheet_id"])
+        version = job.payload.get("version", timesheet.version)
+        if timesheet.version != version:
+            raise ValueError("The timesheet has been updated since the edit was requested.")
+
+        edited_timesheet = self._edit_timesheet(timesheet, job.payload)
+        if not Timesheets.update_if_version(edited_timesheet, version):
+            raise ValueError("The timesheet has been updated since the edit was requested.")
+
+        return {"timesheet_id": edited_timesheet.get_id(), "version": edited_timesheet.version}
+
+    def _edit_timesheet(self, timesheet: TimeSheetModel, data):
+        """
+        Apply the requested medications and date range to a timesheet, regenerating only the entries that changed.
+
+        Entries are regenerated for added medications, or for all medications if the date range changed, and their
+        dates are expanded from the dosage rules. The advice is regenerated only if the set of medications changed.
+        The whole timesheet is regenerated if a regenerated entry has no dosage rule.
+
+        :param timesheet: The stored timesheet.
+        :type timesheet: TimeSheetModel
+        :param data: The data containing medication IDs and date range.
+        :type data: dict
+        :return: The edited timesheet, with the ID and version of the stored timesheet.
+        :rtype: TimeSheetModel
+        """
+        medication_ids: List[str] = data['medication_ids']
+        start_date_str = datetime.strptime(data['start_date'], '%Y-%m-%d').date().isoformat()
+        end_date_str = datetime.strptime(data['end_date'], '%Y-%m-%d').date().isoformat()
+
+        existing_entries = {med.id: med for med in timesheet.medications}
+        range_changed = (start_date_str, end_date_str) != (timesheet.start_date, timesheet.end_date)
+        medications_changed = set(medication_ids) != set(existing_entries)
+
+        medications = MedicationRepository.get_many(medication_ids, MedicationRepository.TIMESHEET_FIELDS)
+        medications_data = {
+            med_id: self.medication_service.get_timesheet_data(medications[med_id])
+            for med_id in medication_ids if med_id in medications
+        }
+        changed_ids = [med_id for med_id in medications_data if range_changed or med_id not in existing_entries]
+
+        if any(medications_data[med_id]['dosage_rule'] is None for med_id in changed_ids):
+            # The dates can only be generated by OpenAI together with the other medications
+            rebuilt_timesheet = self._build_timesheet(data, timesheet.user_id)
+            rebuilt_timesheet.set_id(timesheet.get_id())
+            rebuilt_timesheet.version = timesheet.version
+            return rebuilt_timesheet
+
+        advice = self.timesheet_service.build_advice(list(medications_data.values())) if medications_changed else {}
+        medication_entries = []
+        for med_id, medication_data in medications_data.items():
+            existing_entry = existing_entries.get(med_id)
+            advise = advice.get(med_id) or (existing_entry.advise if existing_entry else "")
+            if med_id in changed_ids:
+                entry = self.timesheet_service.build_entry(medication_data, start_date_str, end_date_str, advise)
+                medication_entries.append(
+                    MedicationEntry(id=entry["id"], dosage=entry["dosage"], dates=entry["dates"], advise=entry["advise"])
+                )
+            else:
+                medication_entries.append(existing_entry.with_advise(advise))
+
+        return TimeSheetModel(
+            user_id=timesheet.user_id,
+            medications=medication_entries,
+            start_date=start_date_str,
+            end_date=end_date_str,
+            version=timesheet.version,
+            _id=timesheet.get_id()
+        )
+
+    def get_timesheet_job(self, id):
+        """
+        Get the status of a timesheet generation job queued by the current user.
 
-        return jsonify(new_timesheet.asdict()), 200
+        :param id: The ID of the job.
+        :type id: str
+        :return: A JSON response containing the job status, and its result or error once it has finished.
+        :rtype: Response
+        :statuscode 200: Successfully retrieved the job
+        :statuscode 404: Job not found
+        """
+        try:
+            job = self.job_service.get_job(id)
+        except ValueError:
+            job = None
+        if job is None or job.user_id != str(current_user.id):
+            return make_response(jsonify({"error": "Job not found"}), 404)
+        return jsonify(job.asdict()), 200
+
+    def _job_accepted(self, job: TimesheetJobModel):
+        """
+        Build the response for a queued timesheet job.
+
+        :param job: The queued job.
+        :type job: TimesheetJobModel
+        :return: A 202 response with the job ID and status and a Location header pointing to the job status.
+        :rtype: Response
+        """
+        response = make_response(jsonify({"job_id": job.get_id(), "status": job.status}), 202)
+        response.headers["Location"] = url_for("timesheets.get_timesheet_job", id=job.get_id())
+        return response
 
     def _build_timesheet(self, data, user_id=None):
         """
@@ -155,18 +339,8 @@ class TimesheetsController:
         start_date = datetime.strptime(data['start_date'], '%Y-%m-%d').date()
         end_date = datetime.strptime(data['end_date'], '%Y-%m-%d').date()
 
-        # Retrieve medications from the database
-        medications = [Medications.find(med_id) for med_id in medication_ids]
-
-        # Prepare data for OpenAI
-        medications_data = [
-            {
-                "id": str(med.id),
-                "name": med.name,
-                "dosage_schedule": med.dosage_schedule,
-                "objective": med.objective
-            } for med in medications if med
-        ]
+        # Retrieve medications from the database and prepare data for OpenAI
+        medications_data = self._get_medications_data(medication_ids)
 
         start_date_str = start_date.isoformat() if hasattr(start_date, 'isoformat') else str(start_date)
         end_date_str = end_date.isoformat() if hasattr(end_date, 'isoformat') else str(end_date)
@@ -188,18 +362,131 @@ class TimesheetsController:
             end_date=end_date_str
         )
 
-    def get_timesheet(self):
+    def _get_medications_data(self, medication_ids):
+        """
+        Load the medications of a timesheet and prepare the data sent to the timesheet service.
+
+        :param medication_ids: The IDs of the medications. Unknown IDs are skipped.
+        :type medication_ids: list of str
+        :return: The data of each medication, in the order of the IDs.
+        :rtype: list of dict
+        """
+        medications = MedicationRepository.get_many(medication_ids, MedicationRepository.TIMESHEET_FIELDS)
+        return [
+            self.medication_service.get_timesheet_data(medications[med_id])
+            for med_id in medication_ids if med_id in medications
+        ]
+
+    def stream_timesheet(self):
+        """
+        Create a new timesheet for the current user based on provided medication IDs and date range, streaming each
+        medication entry as server-sent events as soon as it has been generated.
+
+        Unlike `create_timesheet`, the timesheet is generated in the request. A 'medication' event is sent with each
+        entry, with its name and expanded dates, followed by a 'timesheet' event with the ID of the saved timesheet, or an
+        'error' event if the generation fails. The request body must be JSON, so that other sites cannot start a
+        generation without a CORS preflight.
+
+        :return: A 'text/event-stream' response, or an error.
+        :rtype: Response
+        :statuscode 200: Streaming the timesheet
+        :statuscode 400: Bad request (e.g., missing required fields or invalid date format)
+        :statuscode 415: The request body is not JSON
+        """
+        data: Dict = request.get_json()
+        if not isinstance(data, dict):
+            return make_response(jsonify({"error": "The request body must be a JSON object."}), 400)
+        for field in ['medication_ids', 'start_date', 'end_date']:
+            if field not in data or not data[field]:
+                return make_response(jsonify({"error": f"Missing required field: {field}"}), 400)
+        medication_ids = data['medication_ids']
+        if not isinstance(medication_ids, list) or not all(
+            isinstance(med_id, str) and ObjectId.is_valid(med_id) for med_id in medication_ids
+        ):
+            return make_response(jsonify({"error": "medication_ids must be a list of valid medication IDs."}), 400)
+        try:
+            start_date_str = datetime.strptime(str(data['start_date']), '%Y-%m-%d').date().isoformat()
+            end_date_str = datetime.strptime(str(data['end_date']), '%Y-%m-%d').date().isoformat()
+        except ValueError:
+            return make_response(jsonify({"error": "The dates must be in 'YYYY-MM-DD' format."}), 400)
+
+        user_id = str(current_user.id)
+        medications_data = self._get_medications_data(medication_ids)
+        names = {med["id"]: med["name"] for med in medications_data}
+
+        def generate():
+            medication_entries = []
+            try:
+                for med in self.timesheet_service.stream_timesheet(medications_data, start_date_str, end_date_str):
+                    if not med.get("id"):
+                        raise ValueError("A generated medication entry has no ID.")
+                    # Generated entries may lack fields, which must not end the stream without an 'error' event
+                    entry = MedicationEntry(
+                        id=med["id"],
+                        dosage=med.get("dosage", ""),
+                        dates=med.get("dates") or [],
+                        advise=med.get("advise", "")
+                    )
+                    medication_entries.append(entry)
+                    yield self._server_sent_event("medication", entry.with_name(names.get(entry.id)).expanded_asdict())
+                saved_timesheet = Timesheets.add(TimeSheetModel(
+                    user_id=user_id,
+                    medications=medication_entries,
+                    start_date=start_date_str,
+                    end_date=end_date_str
+                ))
+                yield self._server_sent_event(
+                    "timesheet", {"timesheet_id": saved_timesheet.get_id(), "version": saved_timesheet.version}
+                )
+            except (ValueError, TypeError, ConnectionError, IOError) as e:
+                yield self._server_sent_event("error", {"error": str(e)})
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    def _server_sent_event(self, event, data):
+        """
+        Format a server-sent event.
+
+        :param event: The name of the event.
+        :type event: str
+        :param data: The JSON-serializable data of the event.
+        :type data: Any
+        :return: The event in the 'text/event-stream' format.
+        :rtype: str
+        """
+        lines = current_app.json.dumps(data).splitlines() or [""]
+        return f"event: {event}\n" + "".join(f"data: {line}\n" for line in lines) + "\n"
+
+    def get_timesheet(self, date_from=None, date_to=None, medication_id=None):
         """
         Get the single timesheet for the current user.
 
+        Only the intake dates within the requested window are expanded and returned.
+
+        :param date_from: The first day of the window in 'YYYY-MM-DD' format, or None for no lower bound.
+        :type date_from: str, optional
+        :param date_to: The last day of the window in 'YYYY-MM-DD' format, or None for no upper bound.
+        :type date_to: str, optional
+        :param medication_id: The ID of a medication to limit the timesheet to, or None for all medications.
+        :type medication_id: str, optional
         :return: A JSON response containing the timesheet details.
         :rtype: Response
         :statuscode 200: Successfully retrieved timesheet
+        :statuscode 400: Invalid window
         :statuscode 404: No timesheet found
         :statuscode 409: Multiple timesheets found
         """
+        try:
+            window_start, window_end = self._parse_window(date_from, date_to)
+        except ValueError as e:
+            return make_response(jsonify({"error": str(e)}), 400)
+
         user_id = str(current_user.id)  # Get the current user's ID
-        timesheets = Timesheets.find_by_user_id(user_id)  # Fetch timesheets for the current user
+        timesheets = Timesheets.find_by_user_id(user_id, medication_id)  # Fetch timesheets for the current user
         
         if len(timesheets) > 1:
             return make_response(jsonify({"error": "Multiple timesheets found. Only one timesheet allowed per user."}), 409)
@@ -210,11 +497,40 @@ class TimesheetsController:
         timesheet = timesheets[0]
         
         # Fetch medication names and link them to each medication entry
-        medication_ids = [med.id for med in timesheet.medications]
-        medications = Medications.find_by_ids(medication_ids)
-        medication_dict = {str(med.id): med.name for med in medications}
-        
-        for med_entry in timesheet.medications:
-            med_entry.name = medication_dict.get(med_entry.id)  # Link name to each medication entry
+        self._link_medication_names([timesheet])
         
-        return jsonify(timesheet.asdict()), 200
+        return jsonify(timesheet.expanded_asdict(window_start, window_end)), 200
+
+    def _link_medication_names(self, timesheets: List[TimeSheetModel]):
+        """
+        Link the medication names to the medication entries of timesheets with a single lookup.
+
+        :param timesheets: The timesheets whose medication entries should be named.
+        :type timesheets: list of TimeSheetModel
+        """
+        medication_ids = [med.id for ts in timesheets for med in ts.medications]
+        medication_names = MedicationRepository.get_names(medication_ids)
+        for ts in timesheets:
+            # Link name to each medication entry
+            ts.medications = [med.with_name(medication_names.get(med.id)) for med in ts.medications]
+
+    def _parse_window(self, date_from, date_to):
+        """
+        Parse the window of days requested from a timesheet.
+
+        :param date_from: The first day of the window in 'YYYY-MM-DD' format, or None for no lower bound.
+        :type date_from: str or None
+        :param date_to: The last day of the window in 'YYYY-MM-DD' format, or None for no upper bound.
+        :type date_to: str or None
+        :return: The first and last day of the window, each None if not bounded.
+        :rtype: tuple
+        :raises ValueError: If a day is not in 'YYYY-MM-DD' format or the window ends before it starts.
+        """
+        try:
+            window_start = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else None
+            window_end = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else None
+        except ValueError:
+            raise ValueError("The 'from' and 'to' parameters must be dates in 'YYYY-MM-DD' format.")
+        if window_start and window_end and window_end < window_start:
+            raise ValueError("The 'to' date must not be before the 'from' date.")
+        return window_start, window_end
@@ -1,6 +1,8 @@
 from model.user_model import UserModel
 from db.users import Users
+from db.user_cache import user_cache
 from flask import jsonify, request, make_response, redirect, url_for, flash, session
+from services.password_hashing_service import PasswordHashingService, HashingUnavailableError, HashingRateLimitError
 from services.password_encoder import PasswordEncoder
 from flask_login import login_user, logout_user
 from pydantic import ValidationError, EmailStr
@@ -23,6 +25,8 @@ class UsersController:
         :statuscode 201: User created successfully
         :statuscode 400: Bad request (e.g., missing required fields or invalid JSON format)
         :statuscode 422: Unprocessable Entity (e.g., validation error)
+        :statuscode 429: Too many password requests from the caller
+        :statuscode 503: The password hashing queue is full
         """
         try:
             data: Dict = request.get_json()
@@ -62,10 +66,12 @@ class UsersController:
         try:
             user = UserModel(**data)
             user.email = email
-            added_user = Users.add(user)
+            added_user = Users.add(user, ip=request.remote_addr)
             return make_response(jsonify({"inserted_id": str(added_user._id)}), 201)
         except ValidationError as e:
             return make_response(jsonify(e.errors()), 422)
+        except HashingUnavailableError as e:
+            return self._hashing_unavailable(e)
 
     def get_users(self):
         """
@@ -134,6 +140,10 @@ class UsersController:
         """
         Log in a user with their username and password.
 
+        Only the credentials of the user are loaded. A password stored in the legacy Base64-encoded format is converted
+        to the native bcrypt format after it has been verified. The logged in user is added to the user cache, so the
+        next request does not load it again.
+
         :param username: The username of the user.
         :type username: str
         :param password: The password of the user.
@@ -143,13 +153,29 @@ class UsersController:
         :statuscode 200: Successfully logged in
         :statuscode 401: Invalid username or password
         :statuscode 404: User not found
+        :statuscode 429: Too many login attempts for the username or from the caller
+        :statuscode 503: The password hashing queue is full
         """
-        user = Users.find_by_username(username)
+        user = Users.find_credentials(username)
         if user:
-            password_matches = PasswordEncoder.check_password(password, user.password)
+            hashing_service = PasswordHashingService()
+            try:
+                password_matches = hashing_service.check_password(
+                    password, user.password, ip=request.remote_addr, username=username
+                )
+            except HashingUnavailableError as e:
+                return self._hashing_unavailable(e)
             if password_matches:
+                user_id = user.get_id()
+                if hashing_service.needs_rehash(user.password):
+                    hashing_service.rehash_in_background(password, lambda hashed: Users.update_password(user_id, hashed))
+                elif not PasswordEncoder.is_native(user.password):
+                    native_password = PasswordEncoder.to_native(user.password)
+                    Users.update_password(user_id, native_password, expected_password=user.password)
+                    user.password = native_password
                 user_logged_in = login_user(user)
                 if user_logged_in:
+                    user_cache.put(user)
                     return (
                         jsonify({
                             "user_id": str(user.id), 
@@ -169,6 +195,20 @@ class UsersController:
                 )
         return make_response(jsonify({"error": "User not found"}), 404)
 
+    def _hashing_unavailable(self, error: HashingUnavailableError):
+        """
+        Build the response for a password request that was rejected by the password hashing service.
+
+        :param error: The rejection.
+        :type error: HashingUnavailableError
+        :return: A 429 response if the caller is rate limited, otherwise a 503 response, with a Retry-After header.
+        :rtype: Response
+        """
+        status = 429 if isinstance(error, HashingRateLimitError) else 503
+        response = make_response(jsonify({"error": str(error)}), status)
+        response.headers["Retry-After"] = str(error.retry_after)
+        return response
+
     def logout(self):
         """
         Log out the current user.
@@ -0,0 +1,59 @@
+from db.collection_wrapper import CollectionWrapper
+from db.mongo_db_client import MongoDBClient
+import threading
+import logging
+import os
+
+class CollectionRegistry:
+    """
+    A thread-safe, process-wide registry of long-lived collection wrappers.
+
+    Each collection wrapper is created once per process and reused by every DAO call afterwards. The registry is
+    cleared in a forked child so that the child builds its own MongoDB client and handles.
+    """
+    _handles = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, collection_name) -> CollectionWrapper:
+        """
+        Get the collection wrapper for the given collection, creating it on first use.
+
+        :param collection_name: The name of the collection.
+        :type collection_name: str
+        :return: The cached collection wrapper for the collection.
+        :rtype: CollectionWrapper
+        """
+        handle = cls._handles.get(collection_name)
+        if handle is None:
+            with cls._lock:
+                handle = cls._handles.get(collection_name)
+                if handle is None:
+                    handle = CollectionWrapper(collection_name)
+                    cls._handles[collection_name] = handle
+                    logging.info(f"Created collection handle for '{collection_name}' in process {os.getpid()}")
+        return handle
+
+    @classmethod
+    def reset(cls):
+        """
+        Drop all cached collection handles.
+
+        The next lookup of each collection will build a new collection wrapper.
+        """
+        cls._lock = threading.Lock()
+        cls._handles = {}
+
+    @classmethod
+    def _after_fork_in_child(cls):
+        """
+        Reset the registry and the MongoDB client in a forked child process.
+
+        MongoDB clients are not fork-safe, so the child must open its own connection pool.
+        """
+        MongoDBClient.reset_instance()
+        cls.reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=CollectionRegistry._after_fork_in_child)
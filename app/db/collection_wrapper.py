@@ -19,19 +19,21 @@ class CollectionWrapper:
         db = mongo_client.get_database()
         self.collection = db[collection_name]
 
-    def find_by_id(self, id):
+    def find_by_id(self, id, projection=None):
         """
         Find a document in the collection by its ID.
 
         :param id: The ID of the document to retrieve.
         :type id: str
+        :param projection: The fields to return, all fields if None.
+        :type projection: dict, optional
         :return: The document if found, otherwise None.
         :rtype: dict or None
         :raises ValueError: If the provided ID is not a valid ObjectId format.
         """
         if not isinstance(id, str) or not ObjectId.is_valid(id):
             raise ValueError("Invalid ObjectId format.")
-        return self.collection.find_one({"_id": ObjectId(id)})
+        return self.collection.find_one({"_id": ObjectId(id)}, projection)
 
     def update_by_id(self, id, item):
         """
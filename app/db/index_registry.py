@@ -0,0 +1,197 @@
+from db.collection_registry import CollectionRegistry
+from dataclasses import dataclass, field
+from pymongo import ASCENDING
+from typing import List, Optional, Tuple
+import logging
+import threading
+
+@dataclass(frozen=True)
+class IndexSpec:
+    """
+    A data model representing an index declared by a DAO class.
+
+    Attributes:
+        keys (List[Tuple[str, int]]): The indexed fields and their directions.
+        unique (bool): Whether the index rejects duplicate keys.
+        expire_after_seconds (int): The number of seconds after the indexed date when documents are removed, None if
+            the index is not a TTL index.
+        partial_filter_expression (dict): The filter of the documents included in the index, None if the index
+            includes every document.
+    """
+    keys: List[Tuple[str, int]] = field(default_factory=list)
+    unique: bool = False
+    expire_after_seconds: Optional[int] = None
+    partial_filter_expression: Optional[dict] = None
+
+    def options(self):
+        """
+        Get the options passed to `create_index` for the index.
+
+        :return: The index options.
+        :rtype: dict
+        """
+        options = {}
+        if self.unique:
+            options['unique'] = True
+        if self.expire_after_seconds is not None:
+            options['expireAfterSeconds'] = self.expire_after_seconds
+        if self.partial_filter_expression is not None:
+            options['partialFilterExpression'] = self.partial_filter_expression
+        return options
+
+class IndexRegistry:
+    """
+    A registry of the indexes declared by the DAO classes.
+
+    DAO classes declare their indexes in an `INDEXES` list of `IndexSpec` and are registered with the `register`
+    decorator. The declared indexes are created once, at startup or with the `ensure-indexes` command, instead of on
+    the request path. Queries can be checked against the declared indexes with `check_query`, which reports every
+    query shape without a matching index once.
+    """
+    _dao_classes = []
+    _reported = set()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def register(dao_class):
+        """
+        Register a DAO class whose `INDEXES` should be created. Used as a class decorator.
+
+        :param dao_class: The DAO class, with `COLLECTION_NAME` and `INDEXES` attributes.
+        :type dao_class: type
+        :return: The DAO class.
+        :rtype: type
+        """
+        IndexRegistry._dao_classes.append(dao_class)
+        return dao_class
+
+    @staticmethod
+    def apply(create=True):
+        """
+        Compare the declared indexes with the existing ones and create the missing ones.
+
+        Missing indexes are built in the background. Existing indexes with the same keys but different options are
+        reported and left unchanged.
+
+        :param create: Whether to create the missing indexes, or only report them.
+        :type create: bool
+        :return: A dictionary mapping collection names to the names of the existing, created, missing and
+            conflicting indexes.
+        :rtype: dict
+        """
+        report = {}
+        for dao_class in IndexRegistry._dao_classes:
+            collection = CollectionRegistry.get(dao_class.COLLECTION_NAME)
+            existing = {tuple(tuple(key) for key in info['key']): info for info in collection.index_information().values()}
+            result = report.setdefault(dao_class.COLLECTION_NAME, {'existing': [], 'created': [], 'missing': [], 'conflicting': []})
+            for spec in dao_class.INDEXES:
+                keys = tuple((name, direction) for name, direction in spec.keys)
+                name = IndexRegistry.index_name(spec)
+                info = existing.get(keys)
+                if info is None:
+                    if create:
+                        collection.create_index(list(keys), background=True, **spec.options())
+                        result['created'].append(name)
+                        logging.info(f"Created index {name} on {dao_class.COLLECTION_NAME}")
+                    else:
+                        result['missing'].append(name)
+                        logging.warning(f"Missing index {name} on {dao_class.COLLECTION_NAME}")
+                elif IndexRegistry.__has_other_options(info, spec):
+                    result['conflicting'].append(name)
+                    logging.warning(f"Index {name} on {dao_class.COLLECTION_NAME} exists with different options")
+                else:
+                    result['existing'].append(name)
+        return report
+
+    @staticmethod
+    def __has_other_options(info, spec):
+        """
+        Check whether an existing index has other options than the declared index with the same keys.
+
+        :param info: The description of the existing index, from `index_information`.
+        :type info: dict
+        :param spec: The declared index.
+        :type spec: IndexSpec
+        :return: True if the options differ.
+        :rtype: bool
+        """
+        partial_filter_expression = info.get('partialFilterExpression')
+        if partial_filter_expression is not None:
+            partial_filter_expression = dict(partial_filter_expression)
+        return (
+            bool(info.get('unique')) != spec.unique
+            or info.get('expireAfterSeconds') != spec.expire_after_seconds
+            or partial_filter_expression != spec.partial_filter_expression
+        )
+
+    @staticmethod
+    def index_name(spec: IndexSpec):
+        """
+        Get the default MongoDB name of an index.
+
+        :param spec: The declared index.
+        :type spec: IndexSpec
+        :return: The index name, e.g. 'user_id_1__id_-1'.
+        :rtype: str
+        """
+        return '_'.join(f"{name}_{direction}" for name, direction in spec.keys)
+
+    @staticmethod
+    def check_query(dao_class, equality_fields=(), sort_params=()):
+        """
+        Check whether a declared index supports a query and report the query shape once if none does.
+
+        An index supports the query if it starts with the equality fields in any order, followed by the sort fields in
+        the sort order or in the reverse order.
+
+        :param dao_class: The DAO class running the query.
+        :type dao_class: type
+        :param equality_fields: The fields the query matches by equality.
+        :type equality_fields: iterable of str
+        :param sort_params: The sort specification of the query.
+        :type sort_params: iterable of tuple
+        :return: True if a declared index supports the query.
+        :rtype: bool
+        """
+        equality_fields = frozenset(equality_fields)
+        sort_params = tuple(sort_params)
+        candidates = [[('_id', ASCENDING)]] + [list(spec.keys) for spec in dao_class.INDEXES]
+        for keys in candidates:
+            if IndexRegistry.__supports(keys, equality_fields, sort_params):
+                return True
+
+        shape = (dao_class.COLLECTION_NAME, equality_fields, sort_params)
+        with IndexRegistry._lock:
+            if shape not in IndexRegistry._reported:
+                IndexRegistry._reported.add(shape)
+                logging.warning(
+                    f"No index on {dao_class.COLLECTION_NAME} supports a query on {sorted(equality_fields)} "
+                    f"sorted by {list(sort_params)}"
+                )
+        return False
+
+    @staticmethod
+    def __supports(keys, equality_fields, sort_params):
+        """
+        Check whether an index supports a query.
+
+        :param keys: The keys of the index.
+        :type keys: list of tuple
+        :param equality_fields: The fields the query matches by equality.
+        :type equality_fields: frozenset of str
+        :param sort_params: The sort specification of the query.
+        :type sort_params: tuple of tuple
+        :return: True if the index supports the query.
+        :rtype: bool
+        """
+        prefix_length = len(equality_fields)
+        if len(keys) < prefix_length + len(sort_params):
+            return False
+        if {name for name, _ in keys[:prefix_length]} != equality_fields:
+            return False
+        sort_keys = keys[prefix_length:prefix_length + len(sort_params)]
+        if [name for name, _ in sort_keys] != [name for name, _ in sort_params]:
+            return False
+        same = all(direction == sort_direction for (_, direction), (_, sort_direction) in zip(sort_keys, sort_params))
+        reversed_ = all(direction == -sort_direction for (_, direction), (_, sort_direction) in zip(sort_keys, sort_params))
+        return same or reversed_
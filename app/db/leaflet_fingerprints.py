@@ -0,0 +1,119 @@
+from db.collection_registry import CollectionRegistry
+from db.index_registry import IndexRegistry, IndexSpec
+from pymongo import ASCENDING
+from datetime import datetime
+
+@IndexRegistry.register
+class LeafletFingerprints:
+    """
+    A class to interact with the leaflet_fingerprints collection, which caches the medication data parsed from
+    uploaded leaflets.
+
+    Documents are keyed by the SHA-256 digest of the uploaded bytes and hold the SHA-256 digest of the normalized
+    extracted text, the MinHash signature of the text and its locality-sensitive hashing bands, so that a repeated
+    upload is found by its bytes or by its text, and a similar text is reported. Lookups only match documents parsed with the
+    current parser version.
+    """
+    COLLECTION_NAME = "leaflet_fingerprints"
+    INDEXES = [
+        IndexSpec([('text_hash', ASCENDING), ('version', ASCENDING)]),
+        IndexSpec([('bands', ASCENDING), ('version', ASCENDING)])
+    ]
+    MAX_CANDIDATES = 20
+
+    @staticmethod
+    def __get_collection():
+        """
+        Retrieve the collection wrapper for the leaflet fingerprints collection.
+
+        The wrapper is created once per process and cached in the collection registry.
+
+        :return: The cached collection wrapper instance for leaflet fingerprints.
+        :rtype: CollectionWrapper
+        """
+        return CollectionRegistry.get(LeafletFingerprints.COLLECTION_NAME)
+
+    @staticmethod
+    def find_by_file_hash(file_hash, version):
+        """
+        Find the medication data parsed from an upload with the same bytes.
+
+        :param file_hash: The SHA-256 hex digest of the uploaded bytes.
+        :type file_hash: str
+        :param version: The version of the parser.
+        :type version: str
+        :return: The cached medication data, or None if no upload with the same bytes was parsed.
+        :rtype: dict or None
+        """
+        collection = LeafletFingerprints.__get_collection()
+        data = collection.find_one({'_id': file_hash, 'version': version}, {'medication': 1})
+        if data is None:
+            return None
+        return data['medication']
+
+    @staticmethod
+    def find_by_text_hash(text_hash, version):
+        """
+        Find the medication data parsed from an upload with the same normalized text.
+
+        :param text_hash: The SHA-256 hex digest of the normalized text.
+        :type text_hash: str
+        :param version: The version of the parser.
+        :type version: str
+        :return: The cached medication data, or None if no upload with the same text was parsed.
+        :rtype: dict or None
+        """
+        collection = LeafletFingerprints.__get_collection()
+        data = collection.find_one({'text_hash': text_hash, 'version': version}, {'medication': 1})
+        if data is None:
+            return None
+        return data['medication']
+
+    @staticmethod
+    def find_by_bands(bands, version, limit=MAX_CANDIDATES):
+        """
+        Find the uploads whose text shares at least one locality-sensitive hashing band, the candidate near-duplicates.
+
+        :param bands: The bands of the MinHash signature of the text.
+        :type bands: list of str
+        :param version: The version of the parser.
+        :type version: str
+        :param limit: The maximum number of candidates.
+        :type limit: int
+        :return: The candidates, with their signature.
+        :rtype: list of dict
+        """
+        collection = LeafletFingerprints.__get_collection()
+        return list(collection.find({'bands': {'$in': bands}, 'version': version}, {'signature': 1}).limit(limit))
+
+    @staticmethod
+    def add(file_hash, text_hash, signature, bands, version, medication):
+        """
+        Cache the medication data parsed from an upload.
+
+        :param file_hash: The SHA-256 hex digest of the uploaded bytes.
+        :type file_hash: str
+        :param text_hash: The SHA-256 hex digest of the normalized text.
+        :type text_hash: str
+        :param signature: The MinHash signature of the text.
+        :type signature: list of int
+        :param bands: The bands of the MinHash signature.
+        :type bands: list of str
+        :param version: The version of the parser.
+        :type version: str
+        :param medication: The parsed medication data.
+        :type medication: dict
+        """
+        collection = LeafletFingerprints.__get_collection()
+        collection.replace_one(
+            {'_id': file_hash},
+            {
+                'text_hash': text_hash,
+                'signature': signature,
+                'bands': bands,
+                'version': version,
+                'medication': medication,
+                'created_at': datetime.utcnow()
+            },
+            upsert=True
+        )
@@ -0,0 +1,103 @@
+from collections import OrderedDict
+import threading
+import time
+
+class LRUCache:
+    """
+    A thread-safe, size-bounded LRU cache with a time-to-live per entry.
+
+    The cache keeps hit, miss and eviction counters. Expired entries are evicted when they are read.
+    """
+
+    def __init__(self, max_size, ttl):
+        """
+        Initialize the LRUCache instance.
+
+        :param max_size: The maximum number of entries kept in the cache.
+        :type max_size: int
+        :param ttl: The number of seconds after which an entry expires.
+        :type ttl: float
+        :raises ValueError: If max_size or ttl is not positive.
+        """
+        if not isinstance(max_size, int) or max_size <= 0:
+            raise ValueError("max_size must be a positive integer.")
+        if ttl <= 0:
+            raise ValueError("ttl must be a positive number.")
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Get a cached value.
+
+        :param key: The key of the value.
+        :type key: str
+        :return: The cached value, or None if it is not cached or has expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Add a value to the cache, evicting the least recently used value if the cache is full.
+
+        :param key: The key of the value.
+        :type key: str
+        :param value: The value to cache.
+        """
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """
+        Remove a value from the cache.
+
+        :param key: The key of the value to remove.
+        :type key: str
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Remove all values from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Get the cache counters.
+
+        :return: A dictionary with the current size and the hit, miss and eviction counters.
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,76 @@
+from db.medications import Medications
+from model.medication_model import MedicationModel
+from flask import g, has_app_context
+from typing import Dict, List, Optional
+
+class MedicationRepository:
+    """
+    Batched read access to medications with a request-scoped identity map.
+
+    Medications are loaded with a single `$in` query that projects only the requested fields. Within a request, every
+    medication is loaded at most once for a set of fields, and the same model instance is returned to all callers.
+    Outside of a request, e.g. in background jobs, the identity map only lives for a single call.
+    """
+    TIMESHEET_FIELDS = ('name', 'dosage_schedule', 'objective', 'dosage_rule')
+    NAME_FIELDS = ('name',)
+
+    @staticmethod
+    def __identity_map():
+        """
+        Get the identity map of the current request.
+
+        :return: A dictionary mapping medication IDs to the loaded model and the set of loaded fields, None if all
+            fields are loaded.
+        :rtype: dict
+        """
+        if not has_app_context():
+            return {}
+        if 'medication_identity_map' not in g:
+            g.medication_identity_map = {}
+        return g.medication_identity_map
+
+    @staticmethod
+    def get_many(ids: List[str], fields: Optional[tuple] = None) -> Dict[str, MedicationModel]:
+        """
+        Get medications by their IDs with at most one database query.
+
+        :param ids: The IDs of the medications to get.
+        :type ids: list of str
+        :param fields: The fields to load, all fields if None. Fields that are not loaded are set to None.
+        :type fields: tuple of str, optional
+        :return: A dictionary mapping the IDs of the found medications to their models.
+        :rtype: dict
+        :raises ValueError: If the IDs are not valid ObjectId strings.
+        """
+        identity_map = MedicationRepository.__identity_map()
+        wanted_fields = None if fields is None else frozenset(fields)
+
+        found = {}
+        missing_ids = []
+        for id in dict.fromkeys(ids):
+            entry = identity_map.get(id)
+            if entry is not None and (entry[1] is None or (wanted_fields is not None and wanted_fields <= entry[1])):
+                found[id] = entry[0]
+            else:
+                missing_ids.append(id)
+
+        if missing_ids:
+            for medication in Medications.find_by_ids(missing_ids, list(fields) if fields is not None else None):
+                id = medication.get_id()
+                identity_map[id] = (medication, wanted_fields)
+                found[id] = medication
+        return found
+
+    @staticmethod
+    def get_names(ids: List[str]) -> Dict[str, str]:
+        """
+        Get the names of medications by their IDs with at most one database query.
+
+        :param ids: The IDs of the medications.
+        :type ids: list of str
+        :return: A dictionary mapping the IDs of the found medications to their names.
+        :rtype: dict
+        :raises ValueError: If the IDs are not valid ObjectId strings.
+        """
+        medications = MedicationRepository.get_many(ids, MedicationRepository.NAME_FIELDS)
+        return {id: medication.name for id, medication in medications.items()}
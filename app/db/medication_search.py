@@ -0,0 +1,174 @@
+from db.collection_registry import CollectionRegistry
+import logging
+import re
+import threading
+import time
+import unicodedata
+
+class MedicationSearch:
+    """
+    Index-friendly search over the medication catalogue.
+
+    Every medication document carries a `search` subdocument with its case-folded, accent-free name and the tokens of
+    its contents, objective and side effects. Filters are matched with anchored prefixes on these fields, which can use
+    regular indexes, instead of unanchored case-insensitive regular expressions on the original text.
+
+    Name filters match names starting with the filter. Filters on the other fields match medications that have a token
+    starting with every word of the filter. Results are ranked by the number of exact matches.
+    """
+    FIELD_NAME = 'search'
+    NAME_FIELD = 'name'
+    TOKEN_FIELDS = ('contents', 'objective', 'side_effects')
+    READY_TTL = 60
+    TOKEN_PATTERN = re.compile(r'\w+')
+
+    _lock = threading.Lock()
+    _ready_until = 0.0
+
+    @staticmethod
+    def normalize(text):
+        """
+        Normalize text for matching: remove accents, fold the case and collapse whitespace.
+
+        :param text: The text to normalize.
+        :type text: str or None
+        :return: The normalized text.
+        :rtype: str
+        """
+        if not text:
+            return ''
+        decomposed = unicodedata.normalize('NFKD', str(text))
+        stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+        return ' '.join(stripped.casefold().split())
+
+    @staticmethod
+    def tokenize(text):
+        """
+        Split text into unique normalized tokens.
+
+        :param text: The text to tokenize.
+        :type text: str or None
+        :return: The tokens in order of first appearance.
+        :rtype: list of str
+        """
+        return list(dict.fromkeys(MedicationSearch.TOKEN_PATTERN.findall(MedicationSearch.normalize(text))))
+
+    @staticmethod
+    def document_fields(medication):
+        """
+        Build the search subdocument of a medication.
+
+        :param medication: The medication document.
+        :type medication: dict
+        :return: The search subdocument.
+        :rtype: dict
+        """
+        fields = {MedicationSearch.NAME_FIELD: MedicationSearch.normalize(medication.get('name'))}
+        for field in MedicationSearch.TOKEN_FIELDS:
+            fields[field] = MedicationSearch.tokenize(medication.get(field))
+        return fields
+
+    @staticmethod
+    def build_query(filters):
+        """
+        Build the index-friendly query for medication filters.
+
+        :param filters: The filters, mapping medication fields to the searched text.
+        :type filters: dict
+        :return: The query, or None if a filter cannot be matched on the search fields.
+        :rtype: dict or None
+        """
+        conditions = []
+        for field, value in filters.items():
+            if not value:
+                continue
+            if field == MedicationSearch.NAME_FIELD:
+                prefix = MedicationSearch.normalize(value)
+                if not prefix:
+                    return None
+                conditions.append({f'{MedicationSearch.FIELD_NAME}.{field}': {'$regex': '^' + re.escape(prefix)}})
+            elif field in MedicationSearch.TOKEN_FIELDS:
+                tokens = MedicationSearch.tokenize(value)
+                if not tokens:
+                    return None
+                conditions.extend(
+                    {f'{MedicationSearch.FIELD_NAME}.{field}': {'$regex': '^' + re.escape(token)}} for token in tokens
+                )
+            else:
+                return None
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {'$and': conditions}
+
+    @staticmethod
+    def score_expression(filters):
+        """
+        Build the aggregation expression ranking the medications that match filters.
+
+        An exact name match scores 2 and a name prefix match scores 1. Every word of the other filters that equals a
+        token of the medication scores 1.
+
+        :param filters: The filters, mapping medication fields to the searched text.
+        :type filters: dict
+        :return: The score expression.
+        :rtype: dict
+        """
+        scores = []
+        for field, value in filters.items():
+            if not value:
+                continue
+            path = f'${MedicationSearch.FIELD_NAME}.{field}'
+            if field == MedicationSearch.NAME_FIELD:
+                scores.append({'$cond': [{'$eq': [path, MedicationSearch.normalize(value)]}, 2, 1]})
+            elif field in MedicationSearch.TOKEN_FIELDS:
+                tokens = MedicationSearch.tokenize(value)
+                scores.append({'$size': {'$filter': {
+                    'input': tokens,
+                    'as': 'token',
+                    'cond': {'$in': ['$$token', {'$ifNull': [path, []]}]}
+                }}})
+        return {'$add': scores} if scores else 0
+
+    @staticmethod
+    def is_ready(collection):
+        """
+        Check whether every medication has its search fields, so the search fields can be queried.
+
+        The result is reused for a short time to avoid checking on every query.
+
+        :param collection: The medications collection.
+        :type collection: CollectionWrapper
+        :return: True if the search fields can be queried.
+        :rtype: bool
+        """
+        if time.monotonic() < MedicationSearch._ready_until:
+            return True
+        with MedicationSearch._lock:
+            missing = collection.find_one({MedicationSearch.FIELD_NAME: {'$exists': False}}, {'_id': 1})
+            if missing is None:
+                MedicationSearch._ready_until = time.monotonic() + MedicationSearch.READY_TTL
+                return True
+        return False
+
+    @staticmethod
+    def backfill(collection_name):
+        """
+        Add the search fields to the medications that do not have them.
+
+        The search indexes are declared on the Medications DAO and created by the index registry.
+
+        :param collection_name: The name of the medications collection.
+        :type collection_name: str
+        :return: The number of updated medications.
+        :rtype: int
+        """
+        collection = CollectionRegistry.get(collection_name)
+        updated_count = 0
+        for medication in collection.find({MedicationSearch.FIELD_NAME: {'$exists': False}}):
+            collection.update_one(
+                {'_id': medication['_id']},
+                {'$set': {MedicationSearch.FIELD_NAME: MedicationSearch.document_fields(medication)}}
+            )
+            updated_count += 1
+        logging.info(f"Added search fields to {updated_count} medications")
+        return updated_count
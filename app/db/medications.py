@@ -1,27 +1,111 @@
 from db.mongo_db_client import MongoDBClient
 from model.medication_model import MedicationModel
+from model.dosage_rule_model import DosageRule
 from db.collection_wrapper import CollectionWrapper
+from db.collection_registry import CollectionRegistry
+from db.index_registry import IndexRegistry, IndexSpec
+from db.page_cursor import PageCursor
+from db.medication_search import MedicationSearch
+from db.lru_cache import LRUCache
+from bson import json_util
 from bson.objectid import ObjectId
 from services.password_encoder import PasswordEncoder
-from pymongo import DESCENDING, ASCENDING
+from pymongo import ASCENDING, DESCENDING
+from dataclasses import asdict
 import logging
+import re
 
+@IndexRegistry.register
 class Medications:
     """
     A class to interact with the medications collection in the MongoDB database.
     """
     COLLECTION_NAME = "medications"
+    INDEXES = [
+        IndexSpec([('user_id', ASCENDING), ('_id', DESCENDING)]),
+        IndexSpec([('name', ASCENDING), ('_id', DESCENDING)]),
+        IndexSpec([('name', ASCENDING), ('_id', ASCENDING)]),
+        IndexSpec([('search.name', ASCENDING)]),
+        IndexSpec([('search.contents', ASCENDING)]),
+        IndexSpec([('search.objective', ASCENDING)]),
+        IndexSpec([('search.side_effects', ASCENDING)])
+    ]
+    COUNT_CACHE = LRUCache(max_size=256, ttl=30)
+    DOCUMENT_PROJECTION = {MedicationSearch.FIELD_NAME: 0}
 
     @staticmethod
     def __get_collection():
         """
         Retrieve the collection wrapper for the medications collection.
 
-        :return: The collection wrapper instance for medications.
+        The wrapper is created once per process and cached in the collection registry.
+
+        :return: The cached collection wrapper instance for medications.
         :rtype: CollectionWrapper
         """
-        collection = CollectionWrapper(Medications.COLLECTION_NAME)
-        return collection;
+        return CollectionRegistry.get(Medications.COLLECTION_NAME)
+
+    @staticmethod
+    def __count(collection, query):
+        """
+        Count the medications matching a query, reusing counts computed in the last few seconds.
+
+        :param collection: The medications collection.
+        :type collection: CollectionWrapper
+        :param query: The query to count.
+        :type query: dict
+        :return: The number of matching medications.
+        :rtype: int
+        """
+        key = json_util.dumps(query, sort_keys=True)
+        count = Medications.COUNT_CACHE.get(key)
+        if count is None:
+            count = collection.count_documents(query)
+            Medications.COUNT_CACHE.put(key, count)
+        return count
+
+    @staticmethod
+    def __projection(fields, sort_field=None):
+        """
+        Build the projection loading the given fields of medications.
+
+        :param fields: The fields to load, or None to load all fields except the search fields.
+        :type fields: iterable of str or None
+        :param sort_field: The field the results are sorted by, which is loaded for the pagination cursors.
+        :type sort_field: str, optional
+        :return: The projection.
+        :rtype: dict
+        """
+        if fields is None:
+            return Medications.DOCUMENT_PROJECTION
+        projection = {field: 1 for field in fields}
+        if sort_field:
+            projection[sort_field] = 1
+        return projection
+
+    @staticmethod
+    def __filter_query(collection, filters):
+        """
+        Build the query matching medication filters.
+
+        The filters are matched with anchored prefixes on the search fields when every medication has them, otherwise
+        with case-insensitive regular expressions of the escaped filter text.
+
+        :param collection: The medications collection.
+        :type collection: CollectionWrapper
+        :param filters: Dictionary of filters to apply to the query.
+        :type filters: dict or None
+        :return: The query and whether it matches the search fields.
+        :rtype: tuple
+        """
+        search_query = MedicationSearch.build_query(filters) if filters else None
+        if search_query is not None and MedicationSearch.is_ready(collection):
+            return search_query, True
+        query = {}
+        for field, value in (filters or {}).items():
+            if value:
+                query[field] = {'$regex': re.escape(value), '$options': 'i'}
+        return query, False
 
     @staticmethod
     def add(medication: MedicationModel):
@@ -34,16 +118,23 @@ class Medications:
         :rtype: MedicationModel
         """
         collection = Medications.__get_collection()
-        result = collection.insert_one(medication.asdict())
+        document = medication.to_document()
+        document[MedicationSearch.FIELD_NAME] = MedicationSearch.document_fields(document)
+        result = collection.insert_one(document)
         medication.set_id(result.inserted_id)
+        Medications.COUNT_CACHE.clear()
         logging.info(f"Inserted medicine with ID: {result.inserted_id}")
         return medication
 
     @staticmethod
-    def find_by_user_id(user_id, page=None, per_page=None, sort_field=None, sort_direction=None, filters=None):
+    def find_by_user_id(user_id, page=None, per_page=None, sort_field=None, sort_direction=None, filters=None, after=None, include_count=True, fields=None):
         """
         Find medications by user ID with optional pagination, sorting, and filtering.
 
+        Filters are matched like in `find_all`, on the search fields when every medication has them, but the results
+        keep their sort order. Pages are selected either by page number or, if `after` is given, by a keyset cursor, which costs the same for
+        every page.
+
         :param user_id: The ID of the user whose medications are to be retrieved.
         :type user_id: str
         :param page: The page number for pagination (optional).
@@ -56,8 +147,15 @@ class Medications:
         :type sort_direction: str, optional
         :param filters: A dictionary of filters to apply to the query (optional).
         :type filters: dict, optional
+        :param after: The cursor of the previous page, built with `PageCursor.encode` (optional).
+        :type after: str, optional
+        :param include_count: Whether to count the matching medications, the count is None otherwise.
+        :type include_count: bool, optional
+        :param fields: The fields to load, all fields if None. The `_id` and the sort field are always loaded.
+        :type fields: iterable of str, optional
         :return: The total count of medications and a list of medications matching the query.
         :rtype: tuple
+        :raises ValueError: If the pagination parameters or the cursor are invalid.
         """
         if page is not None and (not isinstance(page, int) or page <= 0):
             raise ValueError("Page must be a positive integer.")
@@ -65,26 +163,25 @@ class Medications:
             raise ValueError("Per page must be a positive integer.")
 
         collection = Medications.__get_collection()
-        if page:
-            skip = (page - 1) * per_page
+        if page or after:
+            filter_query, _ = Medications.__filter_query(collection, filters)
+            query = {'user_id': user_id, **filter_query}
 
-            query = {'user_id': user_id}
-            if filters:
-                for field, value in filters.items():
-                    if value:
-                        query[field] = {'$regex': value, '$options': 'i'}
-
-            sort_params = [('_id', DESCENDING)]
-            if sort_field and sort_direction:
-                sort_params.insert(0, (sort_field, ASCENDING if sort_direction == 'asc' else DESCENDING))
-
-            total_count = collection.count_documents(query)
-            medications = list(collection.find(query).sort(sort_params).skip(skip).limit(per_page))
+            sort_params = PageCursor.sort_params(sort_field, sort_direction)
+            IndexRegistry.check_query(Medications, ['user_id'], sort_params)
+            total_count = Medications.__count(collection, query) if include_count else None
+            projection = Medications.__projection(fields, sort_field)
+            if after:
+                page_query = PageCursor.apply(query, after, sort_field, sort_direction)
+                medications = list(collection.find(page_query, projection).sort(sort_params).limit(per_page))
+            else:
+                skip = (page - 1) * per_page
+                medications = list(collection.find(query, projection).sort(sort_params).skip(skip).limit(per_page))
 
             return total_count, medications
         else:
             query = {'user_id': user_id}
-            medications = list(collection.find(query))
+            medications = list(collection.find(query, Medications.__projection(fields)))
 
             return medications
         
@@ -113,10 +210,10 @@ class Medications:
         :raises ValueError: If the medication with the given ID is not found.
         """
         collection = Medications.__get_collection()
-        data = collection.find_by_id(id)
+        data = collection.find_by_id(id, Medications.DOCUMENT_PROJECTION)
         if data is None:
             raise ValueError(f"Medication with ID {id} not found.")
-        return MedicationModel(**data)
+        return MedicationModel.from_document(data)
     
     @staticmethod
     def delete(id):
@@ -129,14 +226,18 @@ class Medications:
         :rtype: DeleteResult
         """
         collection = Medications.__get_collection()
+        Medications.COUNT_CACHE.clear()
         return collection.delete_one({"_id": ObjectId(id)})
 
     @staticmethod
-    def find_all(page=None, per_page=None, sort_field=None, sort_direction=None, filters=None):
+    def find_all(page=None, per_page=None, sort_field=None, sort_direction=None, filters=None, after=None, include_count=True, fields=None):
         """
         Find all medications with optional pagination, sorting, and filtering.
         If no parameters are provided, returns all medications.
 
+        Pages are selected either by page number or, if `after` is given, by a keyset cursor, which costs the same for
+        every page.
+
         :param page: The page number for pagination.
         :type page: int, optional
         :param per_page: The number of items per page.
@@ -147,41 +248,113 @@ class Medications:
         :type sort_direction: str, optional
         :param filters: Dictionary of filters to apply to the query.
         :type filters: dict, optional
+        :param after: The cursor of the previous page, built with `PageCursor.encode` (optional).
+        :type after: str, optional
+        :param include_count: Whether to count the matching medications, the count is None otherwise.
+        :type include_count: bool, optional
+        :param fields: The fields to load, all fields if None. The `_id` and the sort field are always loaded.
+        :type fields: iterable of str, optional
         :return: If pagination is used, returns (total_count, medications), otherwise just medications.
         :rtype: tuple or list
-        :raises ValueError: If pagination parameters are invalid.
+        :raises ValueError: If pagination parameters or the cursor are invalid.
         """
         collection = Medications.__get_collection()
-        query = {}
-        
-        # Apply filters if any
-        if filters:
-            for field, value in filters.items():
-                if value:
-                    query[field] = {'$regex': value, '$options': 'i'}
+        # Apply filters if any, matching them on the search fields when all medications have them
+        query, searched = Medications.__filter_query(collection, filters)
+        ranked = searched and Medications.is_ranked(filters, sort_field, sort_direction, after)
 
-        # Apply sorting
-        sort_params = [('_id', DESCENDING)]
-        if sort_field and sort_direction:
-            sort_params.insert(0, (sort_field, ASCENDING if sort_direction == 'asc' else DESCENDING))
+        # Apply sorting and projection
+        sort_params = PageCursor.sort_params(sort_field, sort_direction)
+        projection = Medications.__projection(fields, sort_field)
 
         # If no pagination is requested, return all results
-        if page is None or per_page is None:
-            return list(collection.find(query).sort(sort_params))
+        if per_page is None or (page is None and after is None):
+            if ranked:
+                return Medications.__find_ranked(collection, query, filters, projection)
+            return list(collection.find(query, projection).sort(sort_params))
 
         # Validate pagination parameters
-        if not isinstance(page, int) or page <= 0:
-            raise ValueError("Page must be a positive integer.")
         if not isinstance(per_page, int) or per_page <= 0:
             raise ValueError("Per page must be a positive integer.")
+        if not ranked:
+            IndexRegistry.check_query(Medications, [], sort_params)
+        total_count = Medications.__count(collection, query) if include_count else None
+
+        # Continue after the cursor
+        if after:
+            page_query = PageCursor.apply(query, after, sort_field, sort_direction)
+            return total_count, list(collection.find(page_query, projection).sort(sort_params).limit(per_page))
+
+        if not isinstance(page, int) or page <= 0:
+            raise ValueError("Page must be a positive integer.")
 
         # Apply pagination
-        total_count = collection.count_documents(query)
         skip = (page - 1) * per_page
-        medications = list(collection.find(query).sort(sort_params).skip(skip).limit(per_page))
+        if ranked:
+            return total_count, Medications.__find_ranked(collection, query, filters, projection, skip, per_page)
+        medications = list(collection.find(query, projection).sort(sort_params).skip(skip).limit(per_page))
 
         return total_count, medications
 
+    @staticmethod
+    def is_ranked(filters, sort_field=None, sort_direction=None, after=None):
+        """
+        Check whether `find_all` returns the results ranked by relevance instead of in sort order.
+
+        Results are ranked when they are searched on the search fields and no explicit order or cursor is requested.
+        Ranked results cannot be continued with a cursor.
+
+        :param filters: Dictionary of filters applied to the query.
+        :type filters: dict or None
+        :param sort_field: The field by which to sort the results.
+        :type sort_field: str, optional
+        :param sort_direction: The direction of sorting, either 'asc' or 'desc'.
+        :type sort_direction: str, optional
+        :param after: The cursor of the previous page.
+        :type after: str, optional
+        :return: True if the results are ranked.
+        :rtype: bool
+        """
+        if not filters or (sort_field and sort_direction) or after is not None:
+            return False
+        if MedicationSearch.build_query(filters) is None:
+            return False
+        return MedicationSearch.is_ready(Medications.__get_collection())
+
+    @staticmethod
+    def __find_ranked(collection, query, filters, projection, skip=None, limit=None):
+        """
+        Find the medications matching a search query, best matches first.
+
+        :param collection: The medications collection.
+        :type collection: CollectionWrapper
+        :param query: The search query built with `MedicationSearch.build_query`.
+        :type query: dict
+        :param filters: The filters the query was built from.
+        :type filters: dict
+        :param projection: The projection of the results, built with `__projection`.
+        :type projection: dict
+        :param skip: The number of results to skip (optional).
+        :type skip: int, optional
+        :param limit: The maximum number of results (optional).
+        :type limit: int, optional
+        :return: The matching medications.
+        :rtype: list of dict
+        """
+        pipeline = [
+            {'$match': query},
+            {'$addFields': {'search_score': MedicationSearch.score_expression(filters)}},
+            {'$sort': {'search_score': -1, '_id': -1}}
+        ]
+        if skip:
+            pipeline.append({'$skip': skip})
+        if limit:
+            pipeline.append({'$limit': limit})
+        if projection is Medications.DOCUMENT_PROJECTION:
+            projection = {MedicationSearch.FIELD_NAME: 0, 'search_score': 0}
+        pipeline.append({'$project': projection})
+        return list(collection.aggregate(pipeline))
+
     @staticmethod
     def update(medication: MedicationModel):
         """
@@ -193,18 +366,43 @@ class Medications:
         :rtype: UpdateResult
         """
         collection = Medications.__get_collection()
-        return collection.update_one(
+        document = medication.to_document()
+        document[MedicationSearch.FIELD_NAME] = MedicationSearch.document_fields(document)
+        result = collection.update_one(
             {"_id": ObjectId(medication.get_id())},
-            {"$set": medication.asdict()}
+            {"$set": document}
+        )
+        # The changed fields can move the medication in or out of filtered counts
+        Medications.COUNT_CACHE.clear()
+        return result
+
+    @staticmethod
+    def update_dosage_rule(id, dosage_rule: DosageRule):
+        """
+        Store the structured dosage schedule of a medication.
+
+        :param id: The ID of the medication to update.
+        :type id: str
+        :param dosage_rule: The dosage rule extracted from the medication's dosage schedule.
+        :type dosage_rule: DosageRule
+        :return: The result of the update operation.
+        :rtype: UpdateResult
+        """
+        collection = Medications.__get_collection()
+        return collection.update_one(
+            {"_id": ObjectId(id)},
+            {"$set": {"dosage_rule": asdict(dosage_rule)}}
         )
 
     @staticmethod
-    def find_by_ids(ids):
+    def find_by_ids(ids, fields=None):
         """
         Find medications by a list of IDs.
 
         :param ids: A list of medication IDs to retrieve.
         :type ids: list of str
+        :param fields: The fields to load, all fields if None. Fields that are not loaded are set to None.
+        :type fields: list of str, optional
         :return: A list of medication model instances.
         :rtype: list of MedicationModel
         :raises ValueError: If the IDs are not a list of valid ObjectId strings.
@@ -213,5 +411,6 @@ class Medications:
             raise ValueError("Ids must be a list of valid ObjectId strings.")
         
         collection = Medications.__get_collection()
-        medications = list(collection.find({'_id': {'$in': [ObjectId(id) for id in ids]}}))
-        return [MedicationModel(**med) for med in medications]
+        projection = {field: 1 for field in fields} if fields is not None else Medications.DOCUMENT_PROJECTION
+        medications = collection.find({'_id': {'$in': [ObjectId(id) for id in ids]}}, projection)
+        return [MedicationModel.from_document(med) for med in medications]
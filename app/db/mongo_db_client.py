@@ -56,6 +56,16 @@ class MongoDBClient:
                     else:
                         raise ConnectionFailure("Failed to connect to MongoDB after multiple attempts.")
 
+    @classmethod
+    def reset_instance(cls):
+        """
+        Discard the singleton instance so that the next instantiation opens a new connection pool.
+
+        This is used in forked child processes, which must not share the parent's MongoDB client.
+        """
+        cls._lock = threading.Lock()
+        cls._instance = None
+
     def is_initialized(self):
         """
         Check if the MongoDB client has been initialized.
@@ -0,0 +1,114 @@
+from bson import json_util
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING
+import base64
+import binascii
+
+class PageCursor:
+    """
+    Opaque cursors for keyset pagination.
+
+    A cursor encodes the sort field, the sort direction and the sort key and `_id` of the last document of a page. The
+    next page is read with a range query on the sort key and `_id` instead of skipping the previous pages, so every page
+    costs the same as the first one. Results must be sorted by the sort field and then by `_id` descending.
+    """
+
+    @staticmethod
+    def encode(sort_field, sort_direction, document):
+        """
+        Build the cursor pointing after a document.
+
+        :param sort_field: The field the results are sorted by, or None if they are only sorted by `_id`.
+        :type sort_field: str or None
+        :param sort_direction: The direction of sorting, either 'asc' or 'desc'.
+        :type sort_direction: str or None
+        :param document: The last document of the page.
+        :type document: dict
+        :return: The opaque cursor.
+        :rtype: str
+        """
+        if not (sort_field and sort_direction):
+            sort_field = sort_direction = None
+        state = {'field': sort_field, 'direction': sort_direction, 'id': document['_id']}
+        if sort_field:
+            state['value'] = document.get(sort_field)
+        encoded = json_util.dumps(state, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(encoded).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def decode(token, sort_field, sort_direction):
+        """
+        Read a cursor built by `encode`.
+
+        :param token: The opaque cursor.
+        :type token: str
+        :param sort_field: The field the results are sorted by, or None if they are only sorted by `_id`.
+        :type sort_field: str or None
+        :param sort_direction: The direction of sorting, either 'asc' or 'desc'.
+        :type sort_direction: str or None
+        :return: The sort key and the `_id` of the last document of the previous page.
+        :rtype: tuple
+        :raises ValueError: If the cursor is malformed or was built for a different sort order.
+        """
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            state = json_util.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        except (binascii.Error, UnicodeError, ValueError, TypeError):
+            raise ValueError("Invalid pagination cursor.")
+        if not isinstance(state, dict) or not isinstance(state.get('id'), ObjectId):
+            raise ValueError("Invalid pagination cursor.")
+        if state.get('field') != sort_field or state.get('direction') != sort_direction:
+            raise ValueError("The pagination cursor does not match the sort order.")
+        return state.get('value'), state['id']
+
+    @staticmethod
+    def apply(query, token, sort_field=None, sort_direction=None):
+        """
+        Restrict a query to the documents after a cursor.
+
+        :param query: The query of the paginated results.
+        :type query: dict
+        :param token: The opaque cursor.
+        :type token: str
+        :param sort_field: The field the results are sorted by, or None if they are only sorted by `_id`.
+        :type sort_field: str or None
+        :param sort_direction: The direction of sorting, either 'asc' or 'desc'.
+        :type sort_direction: str or None
+        :return: The restricted query.
+        :rtype: dict
+        :raises ValueError: If the cursor is malformed or was built for a different sort order.
+        """
+        if not (sort_field and sort_direction):
+            sort_field = sort_direction = None
+        value, last_id = PageCursor.decode(token, sort_field, sort_direction)
+        if sort_field is None:
+            after = {'_id': {'$lt': last_id}}
+        elif value is None:
+            # Missing values sort first, so ascending results continue with all documents that have a value
+            after = {'$or': [{sort_field: None, '_id': {'$lt': last_id}}]}
+            if sort_direction == 'asc':
+                after['$or'].append({sort_field: {'$ne': None}})
+        else:
+            operator = '$gt' if sort_direction == 'asc' else '$lt'
+            after = {'$or': [{sort_field: {operator: value}}, {sort_field: value, '_id': {'$lt': last_id}}]}
+            if sort_direction != 'asc':
+                # Missing values sort last in descending order
+                after['$or'].append({sort_field: None})
+        return {'$and': [query, after]} if query else after
+
+    @staticmethod
+    def sort_params(sort_field=None, sort_direction=None):
+        """
+        Build the sort specification matching the cursors.
+
+        :param sort_field: The field to sort by, or None to sort by `_id` only.
+        :type sort_field: str or None
+        :param sort_direction: The direction of sorting, either 'asc' or 'desc'.
+        :type sort_direction: str or None
+        :return: The sort specification.
+        :rtype: list of tuple
+        """
+        sort_params = [('_id', DESCENDING)]
+        if sort_field and sort_direction:
+            sort_params.insert(0, (sort_field, ASCENDING if sort_direction == 'asc' else DESCENDING))
+        return sort_params
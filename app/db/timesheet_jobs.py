@@ -0,0 +1,215 @@
+from model.timesheet_job_model import TimesheetJobModel
+from db.collection_registry import CollectionRegistry
+from db.index_registry import IndexRegistry, IndexSpec
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument, ASCENDING
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timedelta
+import logging
+
+@IndexRegistry.register
+class TimesheetJobs:
+    """
+    A class to interact with the timesheet_jobs collection, which is used as a persistent job queue.
+    """
+    COLLECTION_NAME = "timesheet_jobs"
+    INDEXES = [
+        IndexSpec([('status', ASCENDING), ('created_at', ASCENDING)]),
+        # Only one job with the same deduplication key may be pending, even when two requests queue it at once
+        IndexSpec(
+            [('dedup_key', ASCENDING), ('status', ASCENDING)],
+            unique=True,
+            partial_filter_expression={'status': TimesheetJobModel.PENDING}
+        )
+    ]
+
+    @staticmethod
+    def __get_collection():
+        """
+        Retrieve the collection wrapper for the timesheet jobs collection.
+
+        The wrapper is created once per process and cached in the collection registry.
+
+        :return: The cached collection wrapper instance for timesheet jobs.
+        :rtype: CollectionWrapper
+        """
+        return CollectionRegistry.get(TimesheetJobs.COLLECTION_NAME)
+
+    @staticmethod
+    def __to_job(data):
+        """
+        Convert a stored document to a job model.
+
+        :param data: The stored job document.
+        :type data: dict
+        :return: The job model instance.
+        :rtype: TimesheetJobModel
+        """
+        return TimesheetJobModel(**data)
+
+    @staticmethod
+    def enqueue(job: TimesheetJobModel):
+        """
+        Add a job to the queue unless an identical job is already pending.
+
+        Identical jobs are detected by their deduplication key, so queuing the same job for the same user twice
+        returns the pending job instead of creating a new one. The unique index on pending deduplication keys rejects
+        the second of two concurrent inserts, which then returns the job inserted first.
+
+        :param job: The job model instance to queue.
+        :type job: TimesheetJobModel
+        :return: The queued job and whether it was newly created.
+        :rtype: tuple
+        """
+        collection = TimesheetJobs.__get_collection()
+        document = job.asdict()
+        document.pop('id')
+        # The deduplication key and status are copied from the filter when the job is inserted
+        document.pop('dedup_key')
+        document.pop('status')
+        document.update({
+            '_id': ObjectId(),
+            'created_at': job.created_at,
+            'updated_at': job.updated_at,
+            'lease_expires_at': job.lease_expires_at
+        })
+        query = {'dedup_key': job.dedup_key, 'status': TimesheetJobModel.PENDING}
+        try:
+            data = collection.find_one_and_update(
+                query, {'$setOnInsert': document}, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            data = collection.find_one(query)
+            if data is None:
+                # The job inserted first has already been claimed, queue this one again
+                data = collection.find_one_and_update(
+                    query, {'$setOnInsert': document}, upsert=True, return_document=ReturnDocument.AFTER
+                )
+        queued_job = TimesheetJobs.__to_job(data)
+        created = data['_id'] == document['_id']
+        if created:
+            logging.info(f"Queued timesheet job with ID: {queued_job.get_id()}")
+        return queued_job, created
+
+    @staticmethod
+    def find(id):
+        """
+        Find a job by its ID.
+
+        :param id: The ID of the job to retrieve.
+        :type id: str
+        :return: The job model instance if found, otherwise None.
+        :rtype: TimesheetJobModel or None
+        :raises ValueError: If the provided ID is not a valid ObjectId format.
+        """
+        collection = TimesheetJobs.__get_collection()
+        data = collection.find_by_id(id)
+        if data is None:
+            return None
+        return TimesheetJobs.__to_job(data)
+
+    @staticmethod
+    def claim_next(kinds, lease_seconds):
+        """
+        Atomically claim the oldest pending job, or a running job whose lease has expired.
+
+        Each claim increments the number of attempts of the job, which identifies the claim: a worker whose lease
+        expired cannot complete or fail the job once another worker has claimed it, see `complete` and `fail`.
+
+        :param kinds: The job kinds the claiming worker can run.
+        :type kinds: list of str
+        :param lease_seconds: The number of seconds the claiming worker may run the job before it can be claimed again.
+        :type lease_seconds: float
+        :return: The claimed job, or None if there is no job to run.
+        :rtype: TimesheetJobModel or None
+        """
+        collection = TimesheetJobs.__get_collection()
+        now = datetime.utcnow()
+        data = collection.find_one_and_update(
+            {
+                'kind': {'$in': kinds},
+                '$or': [
+                    {'status': TimesheetJobModel.PENDING},
+                    {'status': TimesheetJobModel.RUNNING, 'lease_expires_at': {'$lt': now}}
+                ]
+            },
+            {
+                '$set': {
+                    'status': TimesheetJobModel.RUNNING,
+                    'updated_at': now,
+                    'lease_expires_at': now + timedelta(seconds=lease_seconds)
+                },
+                '$inc': {'attempts': 1}
+            },
+            sort=[('created_at', ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+        if data is None:
+            return None
+        return TimesheetJobs.__to_job(data)
+
+    @staticmethod
+    def complete(id, attempts, result):
+        """
+        Mark a running job as completed, unless it was claimed again since the given claim.
+
+        :param id: The ID of the job.
+        :type id: str
+        :param attempts: The number of attempts of the job when it was claimed, which identifies the claim.
+        :type attempts: int
+        :param result: The result of the job.
+        :type result: dict
+        :return: Whether the job was updated.
+        :rtype: bool
+        """
+        return TimesheetJobs.__finish(id, attempts, {
+            'status': TimesheetJobModel.COMPLETED,
+            'result': result,
+            'error': None
+        })
+
+    @staticmethod
+    def fail(id, attempts, error):
+        """
+        Mark a running job as failed, unless it was claimed again since the given claim.
+
+        :param id: The ID of the job.
+        :type id: str
+        :param attempts: The number of attempts of the job when it was claimed, which identifies the claim.
+        :type attempts: int
+        :param error: The error message describing why the job failed.
+        :type error: str
+        :return: Whether the job was updated.
+        :rtype: bool
+        """
+        return TimesheetJobs.__finish(id, attempts, {
+            'status': TimesheetJobModel.FAILED,
+            'error': error
+        })
+
+    @staticmethod
+    def __finish(id, attempts, fields):
+        """
+        Set the final fields of a running job if it still belongs to the given claim.
+
+        :param id: The ID of the job.
+        :type id: str
+        :param attempts: The number of attempts of the job when it was claimed.
+        :type attempts: int
+        :param fields: The fields to set, including the final status.
+        :type fields: dict
+        :return: Whether the job was updated.
+        :rtype: bool
+        """
+        collection = TimesheetJobs.__get_collection()
+        result = collection.update_one(
+            {'_id': ObjectId(id), 'status': TimesheetJobModel.RUNNING, 'attempts': attempts},
+            {'$set': {**fields, 'updated_at': datetime.utcnow(), 'lease_expires_at': None}}
+        )
+        if result.matched_count == 0:
+            logging.warning(
+                f"Timesheet job {id} was claimed again or finished by another worker, its {fields['status']} status "
+                f"is dropped"
+            )
+            return False
+        return True
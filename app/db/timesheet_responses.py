@@ -0,0 +1,76 @@
+from db.collection_registry import CollectionRegistry
+from db.index_registry import IndexRegistry, IndexSpec
+from pymongo import ASCENDING
+from datetime import datetime, timedelta
+import logging
+
+@IndexRegistry.register
+class TimesheetResponses:
+    """
+    A class to interact with the timesheet_responses collection, which caches parsed timesheets generated by OpenAI.
+
+    Documents are keyed by a content hash of the generation input and expire after a time-to-live. The collection is
+    kept under a maximum size by removing the oldest documents.
+    """
+    COLLECTION_NAME = "timesheet_responses"
+    INDEXES = [
+        IndexSpec([('expires_at', ASCENDING)], expire_after_seconds=0),
+        IndexSpec([('created_at', ASCENDING)])
+    ]
+    DEFAULT_TTL = timedelta(days=7)
+    DEFAULT_MAX_DOCUMENTS = 10000
+
+    @staticmethod
+    def __get_collection():
+        """
+        Retrieve the collection wrapper for the timesheet responses collection.
+
+        The wrapper is created once per process and cached in the collection registry.
+
+        :return: The cached collection wrapper instance for timesheet responses.
+        :rtype: CollectionWrapper
+        """
+        return CollectionRegistry.get(TimesheetResponses.COLLECTION_NAME)
+
+    @staticmethod
+    def find(key):
+        """
+        Find a cached timesheet by its content hash.
+
+        :param key: The content hash of the generation input.
+        :type key: str
+        :return: The cached timesheet, or None if it is not cached or has expired.
+        :rtype: dict or None
+        """
+        collection = TimesheetResponses.__get_collection()
+        data = collection.find_one({'_id': key, 'expires_at': {'$gt': datetime.utcnow()}}, {'timesheet': 1})
+        if data is None:
+            return None
+        return data['timesheet']
+
+    @staticmethod
+    def add(key, timesheet, ttl=DEFAULT_TTL, max_documents=DEFAULT_MAX_DOCUMENTS):
+        """
+        Cache a timesheet under its content hash and evict the oldest documents if the collection is too large.
+
+        :param key: The content hash of the generation input.
+        :type key: str
+        :param timesheet: The parsed timesheet to cache.
+        :type timesheet: dict
+        :param ttl: The time after which the cached timesheet expires.
+        :type ttl: timedelta
+        :param max_documents: The maximum number of cached timesheets.
+        :type max_documents: int
+        """
+        collection = TimesheetResponses.__get_collection()
+        now = datetime.utcnow()
+        collection.replace_one(
+            {'_id': key},
+            {'timesheet': timesheet, 'created_at': now, 'expires_at': now + ttl},
+            upsert=True
+        )
+        excess = collection.estimated_document_count() - max_documents
+        if excess > 0:
+            oldest = [doc['_id'] for doc in collection.find({}, {'_id': 1}).sort('created_at', ASCENDING).limit(excess)]
+            collection.delete_many({'_id': {'$in': oldest}})
+            logging.info(f"Evicted {len(oldest)} cached timesheet responses")
@@ -1,26 +1,70 @@
 from db.mongo_db_client import MongoDBClient
 from model.timesheet_model import TimeSheetModel, MedicationEntry
 from db.collection_wrapper import CollectionWrapper
+from db.collection_registry import CollectionRegistry
+from db.index_registry import IndexRegistry, IndexSpec
 from bson.objectid import ObjectId
 from datetime import datetime
+from pymongo import ASCENDING, ReturnDocument
 import logging
 
+@IndexRegistry.register
 class Timesheets:
     """
     A class to interact with the timesheets collection in the MongoDB database.
+
+    The dates of the medication entries are stored as compact recurrences with exceptions where possible, see
+    `MedicationEntry.compact`. Every update increments the version of the timesheet, so that edits based on an
+    outdated version can be rejected, see `update_if_version`.
     """
     COLLECTION_NAME = "timesheets"
+    INDEXES = [
+        IndexSpec([('user_id', ASCENDING), ('_id', ASCENDING)])
+    ]
 
     @staticmethod
     def __get_collection():
         """
         Retrieve the collection wrapper for the timesheets collection.
 
-        :return: The collection wrapper instance for timesheets.
+        The wrapper is created once per process and cached in the collection registry.
+
+        :return: The cached collection wrapper instance for timesheets.
         :rtype: CollectionWrapper
         """
-        collection = CollectionWrapper(Timesheets.COLLECTION_NAME)
-        return collection
+        return CollectionRegistry.get(Timesheets.COLLECTION_NAME)
+
+    @staticmethod
+    def __projection(medication_id):
+        """
+        Build the projection that limits the medication entries of a timesheet to a single medication.
+
+        :param medication_id: The ID of the medication to keep, or None to keep all medications.
+        :type medication_id: str or None
+        :return: The projection, or None if all fields are returned.
+        :rtype: dict or None
+        """
+        if medication_id is None:
+            return None
+        return {
+            'user_id': 1,
+            'start_date': 1,
+            'end_date': 1,
+            'version': 1,
+            'medications': {'$elemMatch': {'id': medication_id}}
+        }
+
+    @staticmethod
+    def __to_model(data):
+        """
+        Convert a timesheet document to a model, allowing for the medication entries to be projected away.
+
+        :param data: The timesheet document.
+        :type data: dict
+        :return: The timesheet model instance.
+        :rtype: TimeSheetModel
+        """
+        return TimeSheetModel.from_document(data)
 
     @staticmethod
     def add(timesheet: TimeSheetModel):
@@ -33,18 +77,21 @@ class Timesheets:
         :rtype: TimeSheetModel
         """
         collection = Timesheets.__get_collection()
-        result = collection.insert_one(timesheet.asdict())
+        timesheet.medications = [med.compact() for med in timesheet.medications]
+        result = collection.insert_one(timesheet.to_document())
         timesheet.set_id(result.inserted_id)
         logging.info(f"Inserted timesheet with ID: {result.inserted_id}")
         return timesheet
 
     @staticmethod
-    def find_by_user_id(user_id):
+    def find_by_user_id(user_id, medication_id=None):
         """
         Find timesheets by user ID.
 
         :param user_id: The ID of the user whose timesheets are to be retrieved.
         :type user_id: str
+        :param medication_id: The ID of a medication to limit the medication entries to, or None for all entries.
+        :type medication_id: str, optional
         :return: A list of timesheet model instances matching the user ID.
         :rtype: list of TimeSheetModel
         :raises ValueError: If the user ID is not a valid format.
@@ -53,25 +100,105 @@ class Timesheets:
             raise ValueError("Invalid user ID format.")
         
         collection = Timesheets.__get_collection()
-        timesheets = list(collection.find({'user_id': user_id}))
-        return [TimeSheetModel(**ts) for ts in timesheets]
+        timesheets = list(collection.find({'user_id': user_id}, Timesheets.__projection(medication_id)))
+        return [Timesheets.__to_model(ts) for ts in timesheets]
 
     @staticmethod
-    def find(id):
+    def find_by_user_id_with_names(user_id, page=None, per_page=None, medication_id=None):
+        """
+        Find timesheets by user ID with the names of their medications linked, using a single aggregation.
+
+        The medication names are joined from the medications collection with `$lookup`, so listing timesheets does not
+        need a medication query per timesheet.
+
+        :param user_id: The ID of the user whose timesheets are to be retrieved.
+        :type user_id: str
+        :param page: The page number for pagination (optional).
+        :type page: int, optional
+        :param per_page: The number of items per page for pagination (optional).
+        :type per_page: int, optional
+        :param medication_id: The ID of a medication to limit the medication entries to, or None for all entries.
+        :type medication_id: str, optional
+        :return: If pagination is used, the total count of timesheets and a list of timesheet model instances,
+            otherwise just the list of timesheet model instances.
+        :rtype: tuple or list
+        :raises ValueError: If the user ID or the pagination parameters are invalid.
+        """
+        if not isinstance(user_id, str) or not ObjectId.is_valid(user_id):
+            raise ValueError("Invalid user ID format.")
+        if page is not None and (not isinstance(page, int) or page <= 0):
+            raise ValueError("Page must be a positive integer.")
+        if page is not None and (not isinstance(per_page, int) or per_page <= 0):
+            raise ValueError("Per page must be a positive integer.")
+
+        collection = Timesheets.__get_collection()
+        query = {'user_id': user_id}
+        pipeline = [{'$match': query}, {'$sort': {'_id': ASCENDING}}]
+        if page is not None:
+            pipeline += [{'$skip': (page - 1) * per_page}, {'$limit': per_page}]
+
+        projection = {'user_id': 1, 'start_date': 1, 'end_date': 1, 'version': 1, 'medications': 1}
+        if medication_id is not None:
+            projection['medications'] = {
+                '$filter': {'input': '$medications', 'as': 'med', 'cond': {'$eq': ['$$med.id', medication_id]}}
+            }
+        pipeline += [
+            {'$project': projection},
+            # Medication entries reference medications by their string ID
+            {'$addFields': {'medication_object_ids': {'$map': {
+                'input': '$medications.id',
+                'as': 'id',
+                'in': {'$convert': {'input': '$$id', 'to': 'objectId', 'onError': None, 'onNull': None}}
+            }}}},
+            {'$lookup': {
+                'from': 'medications',
+                'localField': 'medication_object_ids',
+                'foreignField': '_id',
+                'as': 'linked_medications'
+            }},
+            {'$project': {
+                'user_id': 1,
+                'start_date': 1,
+                'end_date': 1,
+                'version': 1,
+                'medications': 1,
+                'linked_medications': {'$map': {
+                    'input': '$linked_medications',
+                    'as': 'med',
+                    'in': {'_id': '$$med._id', 'name': '$$med.name'}
+                }}
+            }}
+        ]
+
+        timesheets = []
+        for data in collection.aggregate(pipeline):
+            medication_names = {str(med['_id']): med.get('name') for med in data.pop('linked_medications', [])}
+            timesheet = Timesheets.__to_model(data)
+            timesheet.medications = [med.with_name(medication_names.get(med.id)) for med in timesheet.medications]
+            timesheets.append(timesheet)
+
+        if page is not None:
+            return collection.count_documents(query), timesheets
+        return timesheets
+
+    @staticmethod
+    def find(id, medication_id=None):
         """
         Find a timesheet by its ID.
 
         :param id: The ID of the timesheet to retrieve.
         :type id: str
+        :param medication_id: The ID of a medication to limit the medication entries to, or None for all entries.
+        :type medication_id: str, optional
         :return: The timesheet model instance if found.
         :rtype: TimeSheetModel
         :raises ValueError: If the timesheet with the given ID is not found.
         """
         collection = Timesheets.__get_collection()
-        data = collection.find_by_id(id)
+        data = collection.find_by_id(id, Timesheets.__projection(medication_id))
         if data is None:
             raise ValueError(f"Timesheet with ID {id} not found.")
-        return TimeSheetModel(**data)
+        return Timesheets.__to_model(data)
 
     @staticmethod
     def delete(id):
@@ -99,7 +226,7 @@ class Timesheets:
         :rtype: list of TimeSheetModel
         """
         collection = Timesheets.__get_collection()
-        return [TimeSheetModel(**ts) for ts in list(collection.find())]
+        return [TimeSheetModel.from_document(ts) for ts in collection.find()]
 
     @staticmethod
     def update(timesheet: TimeSheetModel):
@@ -114,13 +241,51 @@ class Timesheets:
         collection = Timesheets.__get_collection()
         return collection.update_one(
             {"_id": ObjectId(timesheet.get_id())},
-            {"$set": timesheet.asdict()}
+            {"$set": Timesheets.__update_document(timesheet), "$inc": {"version": 1}}
+        )
+
+    @staticmethod
+    def update_if_version(timesheet: TimeSheetModel, version):
+        """
+        Update a timesheet in the database if it has not been updated since it was read.
+
+        :param timesheet: The timesheet model instance with updated data.
+        :type timesheet: TimeSheetModel
+        :param version: The version of the timesheet the update is based on.
+        :type version: int
+        :return: True if the timesheet was updated, False if it has another version or does not exist.
+        :rtype: bool
+        """
+        collection = Timesheets.__get_collection()
+        # Timesheets stored before versions were added have no version field
+        version_query = version if version else {"$in": [0, None]}
+        result = collection.update_one(
+            {"_id": ObjectId(timesheet.get_id()), "version": version_query},
+            {"$set": Timesheets.__update_document(timesheet), "$inc": {"version": 1}}
         )
+        if result.matched_count:
+            timesheet.version = version + 1
+        return bool(result.matched_count)
+
+    @staticmethod
+    def __update_document(timesheet: TimeSheetModel):
+        """
+        Build the fields set by an update of a timesheet, with its medication entries compacted.
+
+        :param timesheet: The timesheet model instance with updated data.
+        :type timesheet: TimeSheetModel
+        :return: The timesheet document without its version, which is incremented by the update.
+        :rtype: dict
+        """
+        timesheet.medications = [med.compact() for med in timesheet.medications]
+        document = timesheet.to_document()
+        document.pop("version")
+        return document
 
     @staticmethod
     def add_medication_entry(timesheet_id, medication_entry: MedicationEntry):
         """
-        Add a medication entry to a timesheet.
+        Add a medication entry to a timesheet, unless the timesheet already has an entry for the medication.
 
         :param timesheet_id: The ID of the timesheet to update.
         :type timesheet_id: str
@@ -130,9 +295,55 @@ class Timesheets:
         :rtype: UpdateResult
         """
         collection = Timesheets.__get_collection()
+        return collection.update_one(
+            {"_id": ObjectId(timesheet_id), "medications.id": {"$ne": medication_entry.id}},
+            {"$push": {"medications": medication_entry.compact().to_document()}, "$inc": {"version": 1}}
+        )
+
+    @staticmethod
+    def remove_medication_entry(timesheet_id, medication_id):
+        """
+        Remove the entry of a medication from a timesheet atomically.
+
+        :param timesheet_id: The ID of the timesheet to update.
+        :type timesheet_id: str
+        :param medication_id: The ID of the medication whose entry is removed.
+        :type medication_id: str
+        :return: The updated timesheet, or None if the timesheet does not have an entry for the medication.
+        :rtype: TimeSheetModel or None
+        """
+        collection = Timesheets.__get_collection()
+        data = collection.find_one_and_update(
+            {"_id": ObjectId(timesheet_id), "medications.id": medication_id},
+            {"$pull": {"medications": {"id": medication_id}}, "$inc": {"version": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+        return Timesheets.__to_model(data) if data is not None else None
+
+    @staticmethod
+    def update_advice(timesheet_id, advice):
+        """
+        Set the advice of medication entries of a timesheet in a single update, which increments its version once.
+
+        :param timesheet_id: The ID of the timesheet to update.
+        :type timesheet_id: str
+        :param advice: A dictionary mapping the IDs of the medications to their new advice.
+        :type advice: dict
+        :return: The result of the update operation, or None if there is no advice to set.
+        :rtype: UpdateResult or None
+        """
+        if not advice:
+            return None
+        collection = Timesheets.__get_collection()
+        # Each entry is matched by its own array filter, e.g. medications.$[m0].advise for the first medication
+        items = list(advice.items())
         return collection.update_one(
             {"_id": ObjectId(timesheet_id)},
-            {"$push": {"medications": medication_entry.__dict__}}
+            {
+                "$set": {f"medications.$[m{index}].advise": advise for index, (_, advise) in enumerate(items)},
+                "$inc": {"version": 1}
+            },
+            array_filters=[{f"m{index}.id": medication_id} for index, (medication_id, _) in enumerate(items)]
         )
 
     @staticmethod
@@ -152,3 +363,27 @@ class Timesheets:
             {"_id": ObjectId(timesheet_id)},
             {"$push": {"advises": advise}}
         )
+
+    @staticmethod
+    def compact_dates():
+        """
+        Migrate the stored timesheets whose medication entries have explicit date lists to compact recurrences.
+
+        Entries whose dates cannot be described more compactly keep their date lists.
+
+        :return: The number of updated timesheets.
+        :rtype: int
+        """
+        collection = Timesheets.__get_collection()
+        updated_count = 0
+        for data in collection.find({"medications.dates.0": {"$exists": True}}):
+            timesheet = TimeSheetModel.from_document(data)
+            compacted = [med.compact() for med in timesheet.medications]
+            if any(new is not old for new, old in zip(compacted, timesheet.medications)):
+                collection.update_one(
+                    {"_id": data["_id"]},
+                    {"$set": {"medications": [med.to_document() for med in compacted]}}
+                )
+                updated_count += 1
+        logging.info(f"Compacted the dates of {updated_count} timesheets")
+        return updated_count
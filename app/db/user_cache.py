@@ -0,0 +1,56 @@
+from db.lru_cache import LRUCache
+from model.user_model import UserModel
+
+class UserCache(LRUCache):
+    """
+    A thread-safe, size-bounded LRU cache of user models with a time-to-live per entry.
+
+    The cache is used by the login manager to avoid loading the user from the database on every authenticated
+    request. Entries must be invalidated explicitly whenever the stored user changes.
+    """
+    DEFAULT_MAX_SIZE = 1024
+    DEFAULT_TTL = 60
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL):
+        """
+        Initialize the UserCache instance.
+
+        :param max_size: The maximum number of users kept in the cache.
+        :type max_size: int
+        :param ttl: The number of seconds after which a cached user expires.
+        :type ttl: float
+        :raises ValueError: If max_size or ttl is not positive.
+        """
+        super().__init__(max_size, ttl)
+
+    def get(self, user_id):
+        """
+        Get a cached user by ID.
+
+        :param user_id: The ID of the user.
+        :type user_id: str
+        :return: The cached user model, or None if it is not cached or has expired.
+        :rtype: UserModel or None
+        """
+        return super().get(str(user_id))
+
+    def put(self, user: UserModel):
+        """
+        Add a user to the cache, evicting the least recently used user if the cache is full.
+
+        :param user: The user model to cache.
+        :type user: UserModel
+        """
+        super().put(user.get_id(), user)
+
+    def invalidate(self, user_id):
+        """
+        Remove a user from the cache.
+
+        :param user_id: The ID of the user to remove.
+        :type user_id: str
+        """
+        super().invalidate(str(user_id))
+
+
+user_cache = UserCache()
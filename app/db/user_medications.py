@@ -1,26 +1,34 @@
 from db.mongo_db_client import MongoDBClient
 from model.user_medication_model import UserMedicationModel
 from db.collection_wrapper import CollectionWrapper
+from db.collection_registry import CollectionRegistry
+from db.index_registry import IndexRegistry, IndexSpec
+from db.page_cursor import PageCursor
 from bson.objectid import ObjectId
-from pymongo import DESCENDING, ASCENDING
+from pymongo import ASCENDING, DESCENDING
 import logging
 
+@IndexRegistry.register
 class UserMedications:
     """
     A class to interact with the user_medications collection in the MongoDB database.
     """
     COLLECTION_NAME = "user_medications"
+    INDEXES = [
+        IndexSpec([('user_id', ASCENDING), ('_id', DESCENDING)])
+    ]
 
     @staticmethod
     def __get_collection():
         """
         Retrieve the collection wrapper for the user medications collection.
 
-        :return: The collection wrapper instance for user medications.
+        The wrapper is created once per process and cached in the collection registry.
+
+        :return: The cached collection wrapper instance for user medications.
         :rtype: CollectionWrapper
         """
-        collection = CollectionWrapper(UserMedications.COLLECTION_NAME)
-        return collection
+        return CollectionRegistry.get(UserMedications.COLLECTION_NAME)
 
     @staticmethod
     def add(user_medication: UserMedicationModel):
@@ -33,16 +41,19 @@ class UserMedications:
         :rtype: UserMedicationModel
         """
         collection = UserMedications.__get_collection()
-        result = collection.insert_one(user_medication.asdict())
+        result = collection.insert_one(user_medication.to_document())
         user_medication.set_id(result.inserted_id)
         logging.info(f"Inserted user medication record with ID: {result.inserted_id}")
         return user_medication
 
     @staticmethod
-    def find_by_user_id(user_id, page=None, per_page=None, sort_field=None, sort_direction=None):
+    def find_by_user_id(user_id, page=None, per_page=None, sort_field=None, sort_direction=None, after=None, include_count=True):
         """
         Find user medication records by user ID with optional pagination and sorting.
 
+        Pages are selected either by page number or, if `after` is given, by a keyset cursor, which costs the same for
+        every page.
+
         :param user_id: The ID of the user whose medication records are to be retrieved.
         :type user_id: str
         :param page: The page number for pagination (optional).
@@ -53,20 +64,27 @@ class UserMedications:
         :type sort_field: str, optional
         :param sort_direction: The direction of sorting, either 'asc' or 'desc' (optional).
         :type sort_direction: str, optional
+        :param after: The cursor of the previous page, built with `PageCursor.encode` (optional).
+        :type after: str, optional
+        :param include_count: Whether to count the matching records, the count is None otherwise.
+        :type include_count: bool, optional
         :return: The total count of records and a list of user medication records matching the query.
         :rtype: tuple
+        :raises ValueError: If the cursor is invalid.
         """
         collection = UserMedications.__get_collection()
         query = {'user_id': user_id}
         
-        if page is not None and per_page is not None:
-            skip = (page - 1) * per_page
-            sort_params = [('_id', DESCENDING)]
-            if sort_field and sort_direction:
-                sort_params.insert(0, (sort_field, ASCENDING if sort_direction == 'asc' else DESCENDING))
-
-            total_count = collection.count_documents(query)
-            records = list(collection.find(query).sort(sort_params).skip(skip).limit(per_page))
+        if per_page is not None and (page is not None or after is not None):
+            sort_params = PageCursor.sort_params(sort_field, sort_direction)
+            IndexRegistry.check_query(UserMedications, ['user_id'], sort_params)
+            total_count = collection.count_documents(query) if include_count else None
+            if after is not None:
+                page_query = PageCursor.apply(query, after, sort_field, sort_direction)
+                records = list(collection.find(page_query).sort(sort_params).limit(per_page))
+            else:
+                skip = (page - 1) * per_page
+                records = list(collection.find(query).sort(sort_params).skip(skip).limit(per_page))
             return total_count, records
         else:
             records = list(collection.find(query))
@@ -1,40 +1,58 @@
 from db.mongo_db_client import MongoDBClient
 from model.user_model import UserModel
+from model.roles import Role
 from db.collection_wrapper import CollectionWrapper
+from db.collection_registry import CollectionRegistry
+from db.index_registry import IndexRegistry, IndexSpec
+from db.user_cache import user_cache
 from bson.objectid import ObjectId
-from services.password_encoder import PasswordEncoder
+from pymongo import ASCENDING
+from services.password_hashing_service import PasswordHashingService
 import logging
 import re
 
+@IndexRegistry.register
 class Users:
     """
     A class to interact with the users collection in the MongoDB database.
     """
     COLLECTION_NAME = "users"
+    INDEXES = [
+        IndexSpec([('email', ASCENDING)], unique=True),
+        IndexSpec([('username', ASCENDING)], unique=True)
+    ]
+    # The fields needed to verify a login and to log the user in
+    CREDENTIAL_PROJECTION = {"username": 1, "email": 1, "password": 1, "role": 1}
 
     @staticmethod
     def __get_collection():
         """
         Retrieve the collection wrapper for the users collection.
 
-        :return: The collection wrapper instance for users.
+        The wrapper is created once per process and cached in the collection registry.
+
+        :return: The cached collection wrapper instance for users.
         :rtype: CollectionWrapper
         """
-        collection = CollectionWrapper(Users.COLLECTION_NAME)
-        return collection;
+        return CollectionRegistry.get(Users.COLLECTION_NAME)
 
     @staticmethod
-    def add(user: UserModel):
+    def add(user: UserModel, ip=None):
         """
         Add a new user to the database.
 
-        :param user: The user model instance to add.
+        The password is hashed by the password hashing service.
+
+        :param user: The user model instance to add, with its plain-text password.
         :type user: UserModel
+        :param ip: The IP address of the caller, whose hashing rate limit is applied if given.
+        :type ip: str, optional
         :return: The added user with an updated ID.
         :rtype: UserModel
+        :raises HashingUnavailableError: If the caller is rate limited or the hashing queue is full.
         """
         collection = Users.__get_collection()
-        user.password = PasswordEncoder.encode_password(user.password)
+        user.password = PasswordHashingService().encode_password(user.password, ip=ip)
         result = collection.insert_one(user.asdict())
         user.set_id(result.inserted_id)
         logging.info(f"Inserted user with ID: {result.inserted_id}")
@@ -83,9 +101,50 @@ class Users:
         print(f"Found user: {user}")
         user.email = email
         collection.update_by_id(id, user.asdict())
+        user_cache.invalidate(id)
         print(f"Updated user: {user}")
         return user
     
+    @staticmethod
+    def update_role(id, role: Role):
+        """
+        Update the role of a user.
+
+        :param id: The ID of the user to update.
+        :type id: str
+        :param role: The new role of the user.
+        :type role: Role
+        :raises ValueError: If the user ID format is invalid or if the user is not found.
+        """
+        if not isinstance(id, str) or not ObjectId.is_valid(id):
+            raise ValueError("Invalid user ID format.")
+
+        collection = Users.__get_collection()
+        collection.update_by_id(id, {"role": Role(role).value})
+        user_cache.invalidate(id)
+
+    @staticmethod
+    def update_password(id, hashed_password, expected_password=None):
+        """
+        Replace the hashed password of a user, e.g. after it has been rehashed or converted to another format.
+
+        :param id: The ID of the user to update.
+        :type id: str
+        :param hashed_password: The new hashed password.
+        :type hashed_password: str
+        :param expected_password: If given, the password is only replaced if it is still this hashed password.
+        :type expected_password: str, optional
+        :return: True if the password was replaced.
+        :rtype: bool
+        """
+        collection = Users.__get_collection()
+        user_filter = {"_id": ObjectId(id)}
+        if expected_password is not None:
+            user_filter["password"] = expected_password
+        result = collection.update_one(user_filter, {"$set": {"password": hashed_password}})
+        user_cache.invalidate(id)
+        return result.modified_count > 0
+
     @staticmethod
     def delete(id):
         """
@@ -101,7 +160,9 @@ class Users:
             raise ValueError("Invalid user ID format.")
         
         collection = Users.__get_collection()
-        return collection.delete_one({"_id": ObjectId(id)})
+        result = collection.delete_one({"_id": ObjectId(id)})
+        user_cache.invalidate(id)
+        return result
 
     @staticmethod
     def findAll():
@@ -130,6 +191,24 @@ class Users:
             return UserModel(**user)
         return None
 
+    @staticmethod
+    def find_credentials(username):
+        """
+        Find the credentials of a user by their username, for verifying a login.
+
+        Only the fields in `CREDENTIAL_PROJECTION` are loaded, with a lookup on the unique username index.
+
+        :param username: The username of the user to retrieve.
+        :type username: str
+        :return: The user model instance with the credential fields if found, otherwise None.
+        :rtype: UserModel or None
+        """
+        collection = Users.__get_collection()
+        user = collection.find_one({"username": username}, Users.CREDENTIAL_PROJECTION)
+        if user:
+            return UserModel(**user)
+        return None
+
     @staticmethod
     def find_by_email(email):
         """
@@ -159,9 +238,6 @@ class Users:
         :rtype: dict or None
         """
         collection = Users.__get_collection()
-        # Ensure indexes exist for email and username fields to optimize query performance
-        collection.create_index("email", unique=True)
-        collection.create_index("username", unique=True)
         existing_user = collection.find_one({
             "$or": [
                 {"email": email},
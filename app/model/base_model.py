@@ -6,6 +6,7 @@ class BaseModel(ABC):
     """
     An abstract base class for data models, providing a common interface for converting model instances to dictionaries and JSON.
     """
+    __slots__ = ()
 
     @abstractmethod
     def asdict(self):
@@ -0,0 +1,45 @@
+from dataclasses import dataclass, field
+from typing import List, Optional
+import re
+
+@dataclass
+class DosageRule:
+    """
+    A data model representing the structured dosage schedule of a medication.
+
+    The rule is extracted once per medication from its free-text dosage schedule and is expanded into the dates of a
+    timesheet by the schedule engine.
+
+    Attributes:
+        dosage (str): The amount taken per intake, e.g. '1 tablet'.
+        times_of_day (List[str]): The times of the intakes on each day the medication is taken, in 'HH:MM' format.
+        interval_days (int): The number of days between the days the medication is taken, 1 for every day.
+        food (str): Whether the medication is taken 'with' food, 'without' food or regardless of food ('any').
+        max_course_days (int): The maximum number of days the medication may be taken, None if unlimited.
+    """
+    FOOD_OPTIONS = ('with', 'without', 'any')
+    TIME_PATTERN = re.compile(r'^([01]\d|2[0-3]):[0-5]\d$')
+
+    dosage: str
+    times_of_day: List[str] = field(default_factory=list)
+    interval_days: int = 1
+    food: str = 'any'
+    max_course_days: Optional[int] = None
+
+    def __post_init__(self):
+        """
+        Validate and normalize the rule.
+
+        :raises ValueError: If the times of day, interval, food option or course length are invalid.
+        """
+        if not isinstance(self.times_of_day, list) or not self.times_of_day:
+            raise ValueError("times_of_day must be a non-empty list.")
+        if not all(isinstance(time, str) and DosageRule.TIME_PATTERN.match(time) for time in self.times_of_day):
+            raise ValueError("times_of_day must contain times in 'HH:MM' format.")
+        if not isinstance(self.interval_days, int) or self.interval_days < 1:
+            raise ValueError("interval_days must be a positive integer.")
+        if self.food not in DosageRule.FOOD_OPTIONS:
+            raise ValueError(f"food must be one of {', '.join(DosageRule.FOOD_OPTIONS)}.")
+        if self.max_course_days is not None and (not isinstance(self.max_course_days, int) or self.max_course_days < 1):
+            raise ValueError("max_course_days must be a positive integer or None.")
+        self.times_of_day = sorted(set(self.times_of_day))
@@ -1,5 +1,7 @@
 from dataclasses import dataclass, asdict
+from typing import Optional
 from .base_model import BaseModel
+from .dosage_rule_model import DosageRule
 import logging
 
 @dataclass
@@ -15,7 +17,10 @@ class MedicationModel(BaseModel):
         objective (str): The objective or purpose of the medication.
         side_effects (str): The potential side effects of the medication.
         dosage_schedule (str): The dosage schedule for the medication.
+        dosage_rule (DosageRule): The structured dosage schedule, None until it has been extracted.
     """
+    __slots__ = ('_id', 'id', 'user_id', 'name', 'contents', 'objective', 'side_effects', 'dosage_schedule', 'dosage_rule')
+
     id: str
     user_id: str
     name: str
@@ -23,6 +28,12 @@ class MedicationModel(BaseModel):
     objective: str
     side_effects: str
     dosage_schedule: str
+    dosage_rule: Optional[DosageRule]
+
+    # The fields shown in medication lists and the fields list endpoints can return
+    LIST_FIELDS = ('name', 'contents', 'objective', 'side_effects', 'dosage_schedule')
+    ROW_FIELDS = ('user_id',) + LIST_FIELDS + ('dosage_rule',)
+
     def __init__(
         self,
         name: str,
@@ -31,6 +42,7 @@ class MedicationModel(BaseModel):
         side_effects: str,
         dosage_schedule: str,
         user_id: str,
+        dosage_rule=None,
         _id=-1,
         id=-1
     ):
@@ -49,6 +61,8 @@ class MedicationModel(BaseModel):
         :type dosage_schedule: str
         :param user_id: The ID of the admin user who added the medication.
         :type user_id: str
+        :param dosage_rule: The structured dosage schedule, default is None. Can be DosageRule or dict.
+        :type dosage_rule: DosageRule or dict, optional
         :param _id: The unique identifier of the medication, default is -1.
         :type _id: int or str
         :param id: The unique identifier of the medication, default is -1 (redundant parameter).
@@ -62,6 +76,8 @@ class MedicationModel(BaseModel):
         self.objective = objective
         self.side_effects = side_effects
         self.dosage_schedule = dosage_schedule
+        # Convert a stored dosage rule dictionary to a DosageRule if necessary
+        self.dosage_rule = DosageRule(**dosage_rule) if isinstance(dosage_rule, dict) else dosage_rule
 
     def set_id(self, id):
         """
@@ -88,10 +104,67 @@ class MedicationModel(BaseModel):
         :return: A dictionary representation of the medication.
         :rtype: dict
         """
-        dictionary = asdict(self)
-        dictionary.update({'id': str(self._id)})
+        dictionary = self.to_document()
+        dictionary['id'] = str(self._id)
         return dictionary
 
+    def to_document(self):
+        """
+        Convert the medication to the document stored in the database, without its ID and search fields.
+
+        :return: The medication document.
+        :rtype: dict
+        """
+        return {
+            'user_id': self.user_id,
+            'name': self.name,
+            'contents': self.contents,
+            'objective': self.objective,
+            'side_effects': self.side_effects,
+            'dosage_schedule': self.dosage_schedule,
+            'dosage_rule': asdict(self.dosage_rule) if self.dosage_rule is not None else None
+        }
+
+    @staticmethod
+    def from_document(document):
+        """
+        Create a medication from a document stored in the database.
+
+        Fields missing from the document, e.g. projected away, are set to None.
+
+        :param document: The medication document.
+        :type document: dict
+        :return: The medication.
+        :rtype: MedicationModel
+        """
+        return MedicationModel(
+            name=document.get('name'),
+            contents=document.get('contents'),
+            objective=document.get('objective'),
+            side_effects=document.get('side_effects'),
+            dosage_schedule=document.get('dosage_schedule'),
+            user_id=document.get('user_id'),
+            dosage_rule=document.get('dosage_rule'),
+            _id=document.get('_id', -1)
+        )
+
+    @staticmethod
+    def to_row(document, fields=LIST_FIELDS):
+        """
+        Convert a stored medication document to a JSON-serializable list row without building a model.
+
+        :param document: The medication document, loaded with at least the given fields.
+        :type document: dict
+        :param fields: The fields of the row besides the ID.
+        :type fields: iterable of str, optional
+        :return: A dictionary with the ID and the given fields of the medication.
+        :rtype: dict
+        """
+        row = {'id': str(document['_id'])}
+        for field in fields:
+            row[field] = document.get(field)
+        return row
+
     def log(self):
         """
         Log the details of the medication using the logging module.
@@ -0,0 +1,155 @@
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional
+from .base_model import BaseModel
+from datetime import datetime
+import logging
+
+@dataclass
+class TimesheetJobModel(BaseModel):
+    """
+    A data model representing a queued timesheet generation job.
+
+    Attributes:
+        id (str): The unique identifier of the job.
+        user_id (str): The ID of the user the job runs for.
+        kind (str): The kind of the job, used to select the job handler.
+        payload (dict): The input data of the job.
+        status (str): The job status, one of 'pending', 'running', 'completed' or 'failed'.
+        dedup_key (str): A hash of the user ID, kind and payload used to deduplicate pending jobs.
+        result (dict): The result of the job once it has completed.
+        error (str): The error message if the job has failed.
+        attempts (int): The number of times the job has been claimed by a worker.
+        created_at (datetime): The time the job was queued.
+        updated_at (datetime): The time the job was last updated.
+        lease_expires_at (datetime): The time after which a running job may be claimed again.
+    """
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+    id: str
+    user_id: str
+    kind: str
+    payload: Dict
+    status: str
+    dedup_key: str
+    result: Optional[Dict]
+    error: Optional[str]
+    attempts: int
+    created_at: datetime
+    updated_at: datetime
+    lease_expires_at: Optional[datetime]
+
+    def __init__(
+        self,
+        user_id: str,
+        kind: str,
+        payload: Dict,
+        dedup_key: str,
+        status: str = PENDING,
+        result: Optional[Dict] = None,
+        error: Optional[str] = None,
+        attempts: int = 0,
+        created_at: Optional[datetime] = None,
+        updated_at: Optional[datetime] = None,
+        lease_expires_at: Optional[datetime] = None,
+        _id=-1,
+        id=-1
+    ):
+        """
+        Initialize a new TimesheetJobModel instance.
+
+        :param user_id: The ID of the user the job runs for.
+        :type user_id: str
+        :param kind: The kind of the job, used to select the job handler.
+        :type kind: str
+        :param payload: The input data of the job.
+        :type payload: dict
+        :param dedup_key: A hash of the user ID, kind and payload used to deduplicate pending jobs.
+        :type dedup_key: str
+        :param status: The job status, default is 'pending'.
+        :type status: str
+        :param result: The result of the job once it has completed.
+        :type result: dict, optional
+        :param error: The error message if the job has failed.
+        :type error: str, optional
+        :param attempts: The number of times the job has been claimed by a worker.
+        :type attempts: int
+        :param created_at: The time the job was queued, default is now.
+        :type created_at: datetime, optional
+        :param updated_at: The time the job was last updated, default is the creation time.
+        :type updated_at: datetime, optional
+        :param lease_expires_at: The time after which a running job may be claimed again.
+        :type lease_expires_at: datetime, optional
+        :param _id: The unique identifier of the job, default is -1.
+        :type _id: int or str
+        :param id: The unique identifier of the job, default is -1 (redundant parameter).
+        :type id: int or str
+        """
+        self._id = _id
+        self.id = _id
+        self.user_id = user_id
+        self.kind = kind
+        self.payload = payload
+        self.status = status
+        self.dedup_key = dedup_key
+        self.result = result
+        self.error = error
+        self.attempts = attempts
+        self.created_at = created_at or datetime.utcnow()
+        self.updated_at = updated_at or self.created_at
+        self.lease_expires_at = lease_expires_at
+
+    def set_id(self, id):
+        """
+        Set the unique identifier for the job.
+
+        :param id: The unique identifier to set.
+        :type id: int or str
+        """
+        self._id = id
+
+    def get_id(self):
+        """
+        Get the unique identifier of the job.
+
+        :return: The unique identifier of the job.
+        :rtype: str
+        """
+        return str(self._id)
+
+    def is_finished(self):
+        """
+        Check if the job has completed or failed.
+
+        :return: True if the job will not run again, False otherwise.
+        :rtype: bool
+        """
+        return self.status in (TimesheetJobModel.COMPLETED, TimesheetJobModel.FAILED)
+
+    def asdict(self):
+        """
+        Convert the TimesheetJobModel instance to a dictionary.
+
+        :return: A dictionary representation of the job.
+        :rtype: dict
+        """
+        dictionary = asdict(self)
+        dictionary.update({
+            'id': str(self._id),
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat(),
+            'lease_expires_at': self.lease_expires_at.isoformat() if self.lease_expires_at else None
+        })
+        return dictionary
+
+    def log(self):
+        """
+        Log the details of the job using the logging module.
+        """
+        logging.info(
+            f"Timesheet Job: {self.get_id()}\nUser ID: {self.user_id}\n"
+            f"Kind: {self.kind}\nStatus: {self.status}\nAttempts: {self.attempts}\n"
+            f"Error: {self.error}"
+        )
@@ -1,26 +1,303 @@
-from dataclasses import dataclass, asdict
-from enum import Enum
-from typing import List
+from dataclasses import dataclass, field, replace
+from typing import List, Optional
 from .base_model import BaseModel
+from datetime import date, timedelta
+from collections import Counter
 import logging
+import re
 
-@dataclass
+@dataclass(slots=True)
+class Recurrence:
+    """
+    A data model representing a compact recurrence of medication intakes.
+
+    The medication is taken at the same times on every `interval_days`-th day from the start date to the end date.
+
+    Attributes:
+        start_date (str): The first day of the recurrence, in 'YYYY-MM-DD' format.
+        end_date (str): The last day of the recurrence, in 'YYYY-MM-DD' format.
+        times_of_day (List[str]): The times of the intakes on each day, in 'HH:MM' format.
+        interval_days (int): The number of days between the days the medication is taken, 1 for every day.
+    """
+    start_date: str
+    end_date: str
+    times_of_day: List[str] = field(default_factory=list)
+    interval_days: int = 1
+
+    def expand(self, window_start=None, window_end=None) -> List[str]:
+        """
+        Build the intake dates of the recurrence that fall within a window.
+
+        :param window_start: The first day of the window, or None to start at the start date.
+        :type window_start: date or None
+        :param window_end: The last day of the window, or None to end at the end date.
+        :type window_end: date or None
+        :return: The intake dates in '%Y-%m-%dT%H:%M:%S' format, in chronological order.
+        :rtype: list of str
+        """
+        start = date.fromisoformat(self.start_date)
+        end = date.fromisoformat(self.end_date)
+        if window_end is not None:
+            end = min(end, window_end)
+        day = start
+        if window_start is not None and window_start > start:
+            # Align the first day to the recurrence grid
+            skipped_steps = -(-(window_start - start).days // self.interval_days)
+            day = start + timedelta(days=skipped_steps * self.interval_days)
+
+        time_suffixes = [f"T{time}:00" for time in self.times_of_day]
+        step = timedelta(days=self.interval_days)
+        dates = []
+        while day <= end:
+            day_str = day.isoformat()
+            dates.extend(day_str + suffix for suffix in time_suffixes)
+            day += step
+        return dates
+
+    def to_document(self):
+        """
+        Convert the recurrence to its stored form. The times of day are shared, not copied.
+
+        :return: A dictionary representation of the recurrence.
+        :rtype: dict
+        """
+        return {
+            'start_date': self.start_date,
+            'end_date': self.end_date,
+            'times_of_day': self.times_of_day,
+            'interval_days': self.interval_days
+        }
+
+    @staticmethod
+    def from_document(document):
+        """
+        Create a recurrence from its stored form.
+
+        :param document: A dictionary representation of the recurrence.
+        :type document: dict
+        :return: The recurrence.
+        :rtype: Recurrence
+        """
+        return Recurrence(
+            start_date=document['start_date'],
+            end_date=document['end_date'],
+            times_of_day=document.get('times_of_day', []),
+            interval_days=document.get('interval_days', 1)
+        )
+
+@dataclass(slots=True)
 class MedicationEntry:
     """
     A data model representing an entry for a medication in a timesheet.
 
+    The intake dates are stored either as an explicit list of dates or as a compact recurrence with the dates excluded
+    from it and the extra dates added to it. Use `expand` to get the dates regardless of the storage format.
+
+    Entries are not modified once created: `compact` and `with_name` return new entries. The date lists are shared with
+    the documents the entries are created from and converted to, so they must not be modified either.
+
     Attributes:
         id (str): The unique identifier of the medication.
         dosage (str): The dosage information for the medication.
         advise (str): The medical advice associated with the medication.
-        dates (List[str]): List of dates when the medication should be taken.
+        dates (List[str]): List of dates when the medication should be taken, empty if a recurrence is stored.
         name (str): The name of the medication.
+        recurrence (Recurrence): The compact recurrence of the intakes, None if the dates are stored explicitly.
+        excluded_dates (List[str]): The dates of the recurrence when the medication is not taken.
+        extra_dates (List[str]): The dates outside of the recurrence when the medication is taken.
     """
+    DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}T([01]\d|2[0-3]):[0-5]\d:00$')
+
     id: str
     dosage: str
     advise: str
-    dates: List[str]
+    dates: List[str] = field(default_factory=list)
     name: str = ""
+    recurrence: Optional[Recurrence] = None
+    excluded_dates: List[str] = field(default_factory=list)
+    extra_dates: List[str] = field(default_factory=list)
+
+    def expand(self, window_start=None, window_end=None) -> List[str]:
+        """
+        Get the intake dates of the medication that fall within a window.
+
+        :param window_start: The first day of the window, or None for no lower bound.
+        :type window_start: date or None
+        :param window_end: The last day of the window, or None for no upper bound.
+        :type window_end: date or None
+        :return: The intake dates in '%Y-%m-%dT%H:%M:%S' format, in chronological order.
+        :rtype: list of str
+        """
+        if self.recurrence is None:
+            return [d for d in self.dates if MedicationEntry.__in_window(d, window_start, window_end)]
+
+        dates = self.recurrence.expand(window_start, window_end)
+        if self.excluded_dates:
+            excluded = set(self.excluded_dates)
+            dates = [d for d in dates if d not in excluded]
+        extra = [d for d in self.extra_dates if MedicationEntry.__in_window(d, window_start, window_end)]
+        if extra:
+            dates = sorted(dates + extra)
+        return dates
+
+    def compact(self) -> 'MedicationEntry':
+        """
+        Get the entry with its explicit dates replaced by a recurrence and its exceptions, if that is more compact.
+
+        The recurrence spans the first to the last day of the dates, uses the times taken on at least half of the days
+        and the most common interval between the days. The dates of the recurrence that are not in the list are excluded
+        and the dates of the list that are not in the recurrence are added, so no date is lost. Entries that list the same
+        date more than once, e.g. two doses taken at the same time, are not compacted, because a recurrence lists each
+        date once.
+
+        :return: The compacted entry, or the entry itself if it cannot be compacted.
+        :rtype: MedicationEntry
+        """
+        if self.recurrence is not None or not self.dates:
+            return self
+        if not all(isinstance(d, str) and MedicationEntry.DATE_PATTERN.match(d) for d in self.dates):
+            return self
+
+        actual = set(self.dates)
+        if len(actual) != len(self.dates):
+            return self
+        days = sorted({d[:10] for d in actual})
+        parsed_days = [date.fromisoformat(day) for day in days]
+        gaps = Counter((later - earlier).days for earlier, later in zip(parsed_days, parsed_days[1:]))
+        interval_days = min(gaps, key=lambda gap: (-gaps[gap], gap)) if gaps else 1
+        time_counts = Counter(d[11:16] for d in actual)
+        times_of_day = sorted(time for time, count in time_counts.items() if count * 2 >= len(days))
+        if not times_of_day:
+            return self
+
+        recurrence = Recurrence(
+            start_date=days[0],
+            end_date=days[-1],
+            times_of_day=times_of_day,
+            interval_days=interval_days
+        )
+        expected = set(recurrence.expand())
+        excluded_dates = sorted(expected - actual)
+        extra_dates = sorted(actual - expected)
+        # Keep the explicit dates if the exceptions would take as much space
+        if len(excluded_dates) + len(extra_dates) >= len(actual) // 2:
+            return self
+
+        return replace(self, dates=[], recurrence=recurrence, excluded_dates=excluded_dates, extra_dates=extra_dates)
+
+    def with_name(self, name):
+        """
+        Get the entry with the name of its medication linked.
+
+        :param name: The name of the medication.
+        :type name: str or None
+        :return: The named entry.
+        :rtype: MedicationEntry
+        """
+        return replace(self, name=name)
+
+    def with_advise(self, advise):
+        """
+        Get the entry with its advice replaced.
+
+        :param advise: The advice for the medication.
+        :type advise: str
+        :return: The entry itself if the advice is unchanged, otherwise a new entry.
+        :rtype: MedicationEntry
+        """
+        return self if advise == self.advise else replace(self, advise=advise)
+
+    def to_document(self):
+        """
+        Convert the entry to its stored form. The date lists are shared, not copied.
+
+        :return: A dictionary representation of the entry.
+        :rtype: dict
+        """
+        return {
+            'id': self.id,
+            'dosage': self.dosage,
+            'advise': self.advise,
+            'dates': self.dates,
+            'name': self.name,
+            'recurrence': self.recurrence.to_document() if self.recurrence is not None else None,
+            'excluded_dates': self.excluded_dates,
+            'extra_dates': self.extra_dates
+        }
+
+    @staticmethod
+    def from_document(document):
+        """
+        Create an entry from its stored form. The date lists are shared, not copied.
+
+        :param document: A dictionary representation of the entry.
+        :type document: dict
+        :return: The medication entry.
+        :rtype: MedicationEntry
+        """
+        recurrence = document.get('recurrence')
+        return MedicationEntry(
+            document['id'],
+            document.get('dosage'),
+            document.get('advise'),
+            MedicationEntry.__list(document.get('dates')),
+            document.get('name') or "",
+            Recurrence.from_document(recurrence) if recurrence else None,
+            MedicationEntry.__list(document.get('excluded_dates')),
+            MedicationEntry.__list(document.get('extra_dates'))
+        )
+
+    @staticmethod
+    def __list(value):
+        """
+        Get a stored date list, reusing the stored list instead of allocating a new one.
+
+        :param value: The stored date list, or None if it is missing.
+        :type value: list or None
+        :return: The date list.
+        :rtype: list
+        """
+        return [] if value is None else value
+
+    def expanded_asdict(self, window_start=None, window_end=None):
+        """
+        Convert the entry to a dictionary with its intake dates expanded within a window.
+
+        :param window_start: The first day of the window, or None for no lower bound.
+        :type window_start: date or None
+        :param window_end: The last day of the window, or None for no upper bound.
+        :type window_end: date or None
+        :return: A dictionary representation of the entry without the recurrence fields.
+        :rtype: dict
+        """
+        return {
+            'id': self.id,
+            'dosage': self.dosage,
+            'advise': self.advise,
+            'dates': self.expand(window_start, window_end),
+            'name': self.name
+        }
+
+    @staticmethod
+    def __in_window(date_str, window_start, window_end):
+        """
+        Check whether a date string falls within a window.
+
+        :param date_str: A date string starting with 'YYYY-MM-DD'.
+        :type date_str: str
+        :param window_start: The first day of the window, or None for no lower bound.
+        :type window_start: date or None
+        :param window_end: The last day of the window, or None for no upper bound.
+        :type window_end: date or None
+        :return: True if the date falls within the window.
+        :rtype: bool
+        """
+        day = date_str[:10]
+        if window_start is not None and day < window_start.isoformat():
+            return False
+        if window_end is not None and day > window_end.isoformat():
+            return False
+        return True
 
 @dataclass
 class TimeSheetModel(BaseModel):
@@ -33,12 +310,16 @@ class TimeSheetModel(BaseModel):
         medications (List[MedicationEntry]): A list of medications included in the timesheet.
         start_date (str): The start date of the timesheet.
         end_date (str): The end date of the timesheet.
+        version (int): The number of times the timesheet was updated, used to detect concurrent updates.
     """
+    __slots__ = ('_id', 'id', 'user_id', 'medications', 'start_date', 'end_date', 'version')
+
     id: str
     user_id: str
     medications: List[MedicationEntry]
     start_date: str
     end_date: str
+    version: int
 
     def __init__(
         self,
@@ -46,6 +327,7 @@ class TimeSheetModel(BaseModel):
         medications: List[MedicationEntry],
         start_date: str,
         end_date: str,
+        version: int = 0,
         _id=-1,
         id=-1
     ):
@@ -54,12 +336,14 @@ class TimeSheetModel(BaseModel):
 
         :param user_id: The ID of the user associated with the timesheet.
         :type user_id: str
-        :param medications: A list of medications included in the timesheet.
-        :type medications: List[MedicationEntry]
+        :param medications: A list of medications included in the timesheet, as entries or stored dictionaries.
+        :type medications: List[MedicationEntry] or List[dict]
         :param start_date: The start date of the timesheet.
         :type start_date: str
         :param end_date: The end date of the timesheet.
         :type end_date: str
+        :param version: The number of times the timesheet was updated, default is 0.
+        :type version: int
         :param _id: The unique identifier of the timesheet, default is -1.
         :type _id: int or str
         :param id: The unique identifier of the timesheet, default is -1 (redundant parameter).
@@ -68,13 +352,12 @@ class TimeSheetModel(BaseModel):
         self._id = _id
         self.id = _id
         self.user_id = user_id
-        self.medications = []
-        for med in medications:
-            if isinstance(med, MedicationEntry): 
-                self.medications.append(med) 
-            else: self.medications.append(MedicationEntry(**med)) 
+        self.medications = [
+            med if isinstance(med, MedicationEntry) else MedicationEntry.from_document(med) for med in medications
+        ]
         self.start_date = start_date
         self.end_date = end_date
+        self.version = version
 
     def set_id(self, id):
         """
@@ -101,10 +384,72 @@ class TimeSheetModel(BaseModel):
         :return: A dictionary representation of the timesheet.
         :rtype: dict
         """
-        dictionary = asdict(self)
-        dictionary.update({'id': str(self._id)})
-        dictionary['medications'] = [asdict(med) for med in self.medications]
-        return dictionary
+        return {
+            'id': str(self._id),
+            'user_id': self.user_id,
+            'medications': [med.to_document() for med in self.medications],
+            'start_date': self.start_date,
+            'end_date': self.end_date,
+            'version': self.version
+        }
+
+    def to_document(self):
+        """
+        Convert the timesheet to the document stored in the database, without its ID.
+
+        :return: The timesheet document.
+        :rtype: dict
+        """
+        return {
+            'user_id': self.user_id,
+            'medications': [med.to_document() for med in self.medications],
+            'start_date': self.start_date,
+            'end_date': self.end_date,
+            'version': self.version
+        }
+
+    @staticmethod
+    def from_document(document):
+        """
+        Create a timesheet from a document stored in the database.
+
+        Missing medication entries, e.g. projected away, are read as an empty list.
+
+        :param document: The timesheet document.
+        :type document: dict
+        :return: The timesheet.
+        :rtype: TimeSheetModel
+        """
+        return TimeSheetModel(
+            user_id=document.get('user_id'),
+            medications=[MedicationEntry.from_document(med) for med in document.get('medications', ())],
+            start_date=document.get('start_date'),
+            end_date=document.get('end_date'),
+            version=document.get('version', 0),
+            _id=document.get('_id', -1)
+        )
+
+    def expanded_asdict(self, window_start=None, window_end=None):
+        """
+        Convert the TimeSheetModel instance to a dictionary with the intake dates of each medication expanded.
+
+        The compact recurrence fields are replaced by the list of dates that fall within the window.
+
+        :param window_start: The first day of the window, or None for no lower bound.
+        :type window_start: date or None
+        :param window_end: The last day of the window, or None for no upper bound.
+        :type window_end: date or None
+        :return: A dictionary representation of the timesheet.
+        :rtype: dict
+        """
+        return {
+            'id': str(self._id),
+            'user_id': self.user_id,
+            'medications': [med.expanded_asdict(window_start, window_end) for med in self.medications],
+            'start_date': self.start_date,
+            'end_date': self.end_date,
+            'version': self.version
+        }
 
     def log(self):
         """
@@ -112,5 +457,5 @@ class TimeSheetModel(BaseModel):
         """
         logging.info(f"TimeSheet: User ID: {self.user_id}")
         for med in self.medications:
-            logging.info(f"  Medication: {med.id}, Dosage: {med.dosage}, Dates: {med.dates}")
+            logging.info(f"  Medication: {med.id}, Dosage: {med.dosage}, Dates: {med.expand()}")
         logging.info(f"Advise: {self.advise}")
@@ -1,4 +1,4 @@
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 from .base_model import BaseModel
 from datetime import datetime
 import logging
@@ -17,6 +17,8 @@ class UserMedicationModel(BaseModel):
         end_date (datetime): The date when the medication should end.
         notes (str): Additional notes for taking the medication.
     """
+    __slots__ = ('_id', 'id', 'user_id', 'medication_id', 'dosage_schedule', 'start_date', 'end_date', 'notes')
+
     id: str
     user_id: str
     medication_id: str
@@ -90,13 +92,55 @@ class UserMedicationModel(BaseModel):
         :return: A dictionary representation of the user medication record.
         :rtype: dict
         """
-        dictionary = asdict(self)
-        dictionary.update({
+        return {
             'id': str(self._id),
+            'user_id': self.user_id,
+            'medication_id': self.medication_id,
+            'dosage_schedule': self.dosage_schedule,
+            'start_date': self.start_date.isoformat(),
+            'end_date': self.end_date.isoformat(),
+            'notes': self.notes
+        }
+
+    def to_document(self):
+        """
+        Convert the user medication record to the document stored in the database, without its ID.
+
+        The dates are stored in ISO format.
+
+        :return: The user medication document.
+        :rtype: dict
+        """
+        return {
+            'user_id': self.user_id,
+            'medication_id': self.medication_id,
+            'dosage_schedule': self.dosage_schedule,
             'start_date': self.start_date.isoformat(),
-            'end_date': self.end_date.isoformat()
-        })
-        return dictionary
+            'end_date': self.end_date.isoformat(),
+            'notes': self.notes
+        }
+
+    @staticmethod
+    def from_document(document):
+        """
+        Create a user medication record from a document stored in the database.
+
+        :param document: The user medication document.
+        :type document: dict
+        :return: The user medication record.
+        :rtype: UserMedicationModel
+        """
+        start_date = document.get('start_date')
+        end_date = document.get('end_date')
+        return UserMedicationModel(
+            user_id=document.get('user_id'),
+            medication_id=document.get('medication_id'),
+            dosage_schedule=document.get('dosage_schedule'),
+            start_date=datetime.fromisoformat(start_date) if isinstance(start_date, str) else start_date,
+            end_date=datetime.fromisoformat(end_date) if isinstance(end_date, str) else end_date,
+            notes=document.get('notes', ""),
+            _id=document.get('_id', -1)
+        )
 
     def log(self):
         """
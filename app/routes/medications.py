@@ -46,9 +46,11 @@ def upload_medication(medications_controller: MedicationsController):
         :param medications_controller: The controller used to create the medication from the uploaded file.
         :type medications_controller: MedicationsController
         :statuscode 200: Medication created successfully from file
-        :statuscode 400: Bad request (e.g., missing file or empty filename)
+        :statuscode 400: Bad request (e.g., missing file, empty filename or unsupported file type)
         :statuscode 401: Unauthorized
         :statuscode 403: Forbidden - User is not an admin
+        :statuscode 413: The file is larger than the byte or page limit
+        :statuscode 503: The document extraction queue is full
 
         **Dependency Injection**: The `inject` decorator is used to automatically provide an instance of `MedicationsController`. This improves code maintainability by decoupling dependencies and makes unit testing easier by allowing mock injections.
 
@@ -188,6 +190,9 @@ def get_all_medications(medications_controller: MedicationsController):
         :query per_page: The number of items per page (default is 10).
         :query sort_field: The field to sort the results by.
         :query sort_direction: The direction of sorting (e.g., 'asc' or 'desc').
+        :query after: The `next_after` cursor of the previous page. If given, the page following it is returned instead of the page with the given number.
+        :query count: Whether to return the total count, 'true' or 'false' (default is 'true' without a cursor and 'false' with one).
+        :query fields: Comma-separated medication fields to return besides the ID (default is name, contents, objective, side_effects and dosage_schedule).
         :query filters: Optional filters for medication attributes (e.g., 'name', 'contents', etc.).
         :statuscode 200: Successfully retrieved medications
         :statuscode 401: Unauthorized
@@ -199,6 +204,9 @@ def get_all_medications(medications_controller: MedicationsController):
     per_page = request.args.get('per_page', 10, type=int)
     sort_field = request.args.get('sort_field')
     sort_direction = request.args.get('sort_direction')
+    after = request.args.get('after') or None
+    include_count = request.args.get('count', 'false' if after else 'true').lower() == 'true'
+    fields = request.args.get('fields')
     
     # Get all filter parameters
     filters = {
@@ -210,4 +218,6 @@ def get_all_medications(medications_controller: MedicationsController):
     # Remove None values
     filters = {k: v for k, v in filters.items() if v is not None}
 
-    return medications_controller.get_all_medications(page, per_page, sort_field, sort_direction, **filters)
+    return medications_controller.get_all_medications(
+        page, per_page, sort_field, sort_direction, after=after, include_count=include_count, fields=fields, **filters
+    )
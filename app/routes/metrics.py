@@ -0,0 +1,64 @@
+from flask import Blueprint, jsonify
+from flask_login import login_required
+from auth.login_manager import role_required
+from model.roles import Role
+from services.openai_service import OpenAIService
+from services.timesheet_response_cache import timesheet_response_cache
+from services.leaflet_cache import leaflet_cache
+from injector import inject
+
+metrics = Blueprint('metrics', __name__)
+
+@metrics.route('/openai', methods=['GET'])
+@login_required
+@role_required(Role.ADMIN)
+@inject
+def get_openai_metrics(openai_service: OpenAIService):
+    """
+    .. http:get:: /api/metrics/openai
+
+        Get the metrics of the requests sent to OpenAI's API by this process.
+
+        Requires the user to be logged in and have the ADMIN role.
+
+        :param openai_service: The shared OpenAI service.
+        :type openai_service: OpenAIService
+        :statuscode 200: The request, failure, retry and token counts, the number of requests in flight and the
+            latency in seconds
+        :statuscode 403: Forbidden - User does not have ADMIN role
+    """
+    return jsonify(openai_service.metrics.snapshot()), 200
+
+@metrics.route('/timesheet-cache', methods=['GET'])
+@login_required
+@role_required(Role.ADMIN)
+def get_timesheet_cache_metrics():
+    """
+    .. http:get:: /api/metrics/timesheet-cache
+
+        Get the counters of the cache of timesheets generated by OpenAI in this process.
+
+        Requires the user to be logged in and have the ADMIN role.
+
+        :statuscode 200: The size and the hit, miss and eviction counts of the in-memory cache, and the number of
+            hits served from the timesheet_responses collection
+        :statuscode 403: Forbidden - User does not have ADMIN role
+    """
+    return jsonify(timesheet_response_cache.stats()), 200
+
+@metrics.route('/leaflet-cache', methods=['GET'])
+@login_required
+@role_required(Role.ADMIN)
+def get_leaflet_cache_metrics():
+    """
+    .. http:get:: /api/metrics/leaflet-cache
+
+        Get the counters of the cache of medication data parsed from uploaded leaflets in this process.
+
+        Requires the user to be logged in and have the ADMIN role.
+
+        :statuscode 200: The number of uploads answered by the digest of their bytes or of their text, and the number
+            of near-duplicate uploads that were parsed again
+        :statuscode 403: Forbidden - User does not have ADMIN role
+    """
+    return jsonify(leaflet_cache.stats()), 200
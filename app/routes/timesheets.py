@@ -1,4 +1,4 @@
-from flask import Blueprint
+from flask import Blueprint, request
 from controllers.timesheets_controller import TimesheetsController
 from flask_login import login_required
 from injector import inject
@@ -18,10 +18,58 @@ def get_timesheet(timesheets_controller: TimesheetsController):
 
         :param timesheets_controller: The controller used to retrieve the timesheet.
         :type timesheets_controller: TimesheetsController
+        :query from: The first day of the dates to return, in 'YYYY-MM-DD' format (optional).
+        :query to: The last day of the dates to return, in 'YYYY-MM-DD' format (optional).
+        :query medication_id: The ID of the only medication to return (optional).
         :statuscode 200: Successfully retrieved timesheet
+        :statuscode 400: Invalid date window
         :statuscode 404: No timesheet found
     """
-    return timesheets_controller.get_timesheet()
+    return timesheets_controller.get_timesheet(
+        request.args.get('from'),
+        request.args.get('to'),
+        request.args.get('medication_id')
+    )
+
+@timesheets.route('/timesheet', methods=['POST'])
+@login_required
+@inject
+def create_timesheet(timesheets_controller: TimesheetsController):
+    """
+    .. http:post:: /api/timesheets/timesheet
+
+        Queue the creation of a timesheet for the current user.
+
+        Requires user to be logged in.
+
+        :param timesheets_controller: The controller used to create the timesheet.
+        :type timesheets_controller: TimesheetsController
+        :statuscode 202: Timesheet creation job queued, the job status URL is returned in the Location header
+        :statuscode 400: Bad request
+    """
+    return timesheets_controller.create_timesheet()
+
+@timesheets.route('/timesheet/stream', methods=['POST'])
+@login_required
+@inject
+def stream_timesheet(timesheets_controller: TimesheetsController):
+    """
+    .. http:post:: /api/timesheets/timesheet/stream
+
+        Create a timesheet for the current user, streaming each medication entry as a server-sent event as soon as it
+        has been generated. A 'medication' event is sent with each entry, followed by a 'timesheet' event with the ID of
+        the saved timesheet, or an 'error' event.
+
+        Requires user to be logged in. The request body is a JSON object with the same fields as for creating a
+        timesheet: 'medication_ids', 'start_date' and 'end_date'.
+
+        :param timesheets_controller: The controller used to create the timesheet.
+        :type timesheets_controller: TimesheetsController
+        :statuscode 200: Streaming the timesheet as 'text/event-stream'
+        :statuscode 400: Bad request
+        :statuscode 415: The request body is not JSON
+    """
+    return timesheets_controller.stream_timesheet()
 
 @timesheets.route('/timesheet', methods=['PUT'])
 @login_required
@@ -54,13 +102,25 @@ def get_all_timesheets(timesheets_controller: TimesheetsController):
 
         :param timesheets_controller: The controller used to retrieve timesheets.
         :type timesheets_controller: TimesheetsController
-        :statuscode 200: Successfully retrieved all timesheets
+        :query page: The page number for pagination (optional, all timesheets are returned if omitted).
+        :query per_page: The number of timesheets per page (default is 10).
+        :query from: The first day of the dates to return, in 'YYYY-MM-DD' format (optional).
+        :query to: The last day of the dates to return, in 'YYYY-MM-DD' format (optional).
+        :query medication_id: The ID of the only medication to return (optional).
+        :statuscode 200: Successfully retrieved all timesheets, the total count is in the X-Total-Count header when paginated
+        :statuscode 400: Bad request
         :statuscode 401: Unauthorized
 
         **Dependency Injection**: The `inject` decorator is used to automatically provide an instance of `TimesheetsController`. This improves code maintainability by decoupling dependencies and makes unit testing easier by allowing mock injections.
 
     """
-    return timesheets_controller.get_all_timesheets()
+    return timesheets_controller.get_all_timesheets(
+        request.args.get('page', type=int),
+        request.args.get('per_page', 10, type=int),
+        request.args.get('from'),
+        request.args.get('to'),
+        request.args.get('medication_id')
+    )
 
 @timesheets.route('/timesheet/<id>', methods=['GET'])
 @login_required
@@ -77,14 +137,23 @@ def get_timesheet_by_id(timesheets_controller: TimesheetsController, id):
         :type id: str
         :param timesheets_controller: The controller used to get the timesheet.
         :type timesheets_controller: TimesheetsController
+        :query from: The first day of the dates to return, in 'YYYY-MM-DD' format (optional).
+        :query to: The last day of the dates to return, in 'YYYY-MM-DD' format (optional).
+        :query medication_id: The ID of the only medication to return (optional).
         :statuscode 200: Successfully retrieved timesheet
         :statuscode 400: Bad request
         :statuscode 401: Unauthorized
+        :statuscode 404: Timesheet not found
 
         **Dependency Injection**: The `inject` decorator is used to automatically provide an instance of `TimesheetsController`. This improves code maintainability by decoupling dependencies and makes unit testing easier by allowing mock injections.
 
     """
-    return timesheets_controller.get_timesheet_by_id(id)
+    return timesheets_controller.get_timesheet_by_id(
+        id,
+        request.args.get('from'),
+        request.args.get('to'),
+        request.args.get('medication_id')
+    )
 
 @timesheets.route('/timesheet/<id>', methods=['DELETE'])
 @login_required
@@ -119,11 +188,31 @@ def edit_timesheet(timesheets_controller: TimesheetsController, id):
         :type id: str
         :param timesheets_controller: The controller used to edit the timesheet.
         :type timesheets_controller: TimesheetsController
-        :statuscode 200: Timesheet updated successfully
+        :statuscode 202: Timesheet edit job queued, the job status URL is returned in the Location header
         :statuscode 404: Timesheet not found
     """
     return timesheets_controller.edit_timesheet(id)
 
+@timesheets.route('/jobs/<id>', methods=['GET'])
+@login_required
+@inject
+def get_timesheet_job(timesheets_controller: TimesheetsController, id):
+    """
+    .. http:get:: /api/timesheets/jobs/{id}
+
+        Get the status of a timesheet generation job.
+
+        Requires user to be logged in.
+
+        :param id: The ID of the job.
+        :type id: str
+        :param timesheets_controller: The controller used to get the job.
+        :type timesheets_controller: TimesheetsController
+        :statuscode 200: Successfully retrieved the job status
+        :statuscode 404: Job not found
+    """
+    return timesheets_controller.get_timesheet_job(id)
+
 @timesheets.route('timesheet//active', methods=['GET'])  # New route for active timesheet
 @login_required
 @inject
@@ -0,0 +1,348 @@
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from docx import Document
+import PyPDF2
+import multiprocessing
+import configparser
+import threading
+import logging
+import signal
+
+try:
+    import resource
+except ImportError:  # resource is only available on Unix
+    resource = None
+
+class ExtractionLimitError(RuntimeError):
+    """
+    Raised when extracting the text of a document takes longer or needs more memory than a worker process is allowed.
+    """
+
+class ExtractionOverloadError(RuntimeError):
+    """
+    Raised when the document extraction queue is full and the upload should be retried later.
+
+    Attributes:
+        retry_after (int): The number of seconds after which the upload may be retried.
+    """
+
+    def __init__(self, message, retry_after):
+        """
+        Initialize the ExtractionOverloadError instance.
+
+        :param message: The error message.
+        :type message: str
+        :param retry_after: The number of seconds after which the upload may be retried.
+        :type retry_after: int
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def _limit_worker_memory(max_memory_bytes):
+    """
+    Cap the address space of a worker process, so that a malicious or broken document cannot exhaust the memory.
+
+    This is the initializer of the worker processes, it does nothing where the resource module is not available.
+
+    :param max_memory_bytes: The maximum address space of the worker process in bytes.
+    :type max_memory_bytes: int
+    """
+    if resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (max_memory_bytes, max_memory_bytes))
+
+def _raise_time_limit(signum, frame):
+    """
+    Interrupt an extraction that reached its time limit.
+    """
+    raise ExtractionLimitError("Extracting the text of the document took too long.")
+
+def _run_limited(function, timeout, *args):
+    """
+    Run an extraction function in a worker process with a time limit.
+
+    :param function: The extraction function.
+    :type function: callable
+    :param timeout: The time limit in seconds.
+    :type timeout: float
+    :return: The result of the function.
+    :raises ExtractionLimitError: If the function reaches the time or memory limit.
+    """
+    has_timer = hasattr(signal, 'setitimer')
+    if has_timer:
+        signal.signal(signal.SIGALRM, _raise_time_limit)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return function(*args)
+    except MemoryError:
+        raise ExtractionLimitError("Extracting the text of the document needed too much memory.")
+    finally:
+        if has_timer:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+def _count_pdf_pages(path):
+    """
+    Count the pages of a PDF file without extracting their text.
+
+    :param path: The path of the PDF file.
+    :type path: str
+    :return: The number of pages.
+    :rtype: int
+    :raises IOError: If the PDF file cannot be read properly.
+    """
+    try:
+        return len(PyPDF2.PdfReader(path).pages)
+    except (ExtractionLimitError, MemoryError):
+        raise
+    except Exception as e:
+        raise IOError(f"An error occurred while reading the PDF file: {str(e)}")
+
+def _extract_pdf_pages(path, start, stop):
+    """
+    Extract the text of a range of pages of a PDF file.
+
+    :param path: The path of the PDF file.
+    :type path: str
+    :param start: The index of the first page of the range.
+    :type start: int
+    :param stop: The index after the last page of the range.
+    :type stop: int
+    :return: The text of each page of the range.
+    :rtype: list of str
+    :raises IOError: If the PDF file cannot be read properly.
+    """
+    try:
+        reader = PyPDF2.PdfReader(path)
+        return [reader.pages[index].extract_text() or '' for index in range(start, stop)]
+    except (ExtractionLimitError, MemoryError):
+        raise
+    except Exception as e:
+        raise IOError(f"An error occurred while reading the PDF file: {str(e)}")
+
+def _extract_docx_paragraphs(path):
+    """
+    Extract the text of the paragraphs of a DOCX file.
+
+    :param path: The path of the DOCX file.
+    :type path: str
+    :return: The text of each paragraph.
+    :rtype: list of str
+    :raises IOError: If the DOCX file cannot be read properly.
+    """
+    try:
+        return [paragraph.text for paragraph in Document(path).paragraphs]
+    except (ExtractionLimitError, MemoryError):
+        raise
+    except Exception as e:
+        raise IOError(f"An error occurred while reading the DOCX file: {str(e)}")
+
+class DocumentExtractionService:
+    """
+    A thread-safe singleton class that extracts the text of PDF and DOCX documents in a pool of worker processes.
+
+    PyPDF2 and python-docx are pure Python parsers, so extracting a large document on a request thread would hold the
+    GIL and stall every other request of the process. The extraction runs in worker processes instead, while the
+    request thread waits without holding the GIL. The pages of a PDF document are extracted in ranges of
+    `PAGES_PER_JOB` pages by several workers at once.
+
+    The workers are sandboxed: each job is interrupted after `timeout` seconds, and the address space of each worker is
+    capped at `max_memory_mb` megabytes. At most `workers + queue_size` jobs are accepted at once; further jobs are
+    rejected with `ExtractionOverloadError`. The settings are read from the optional keys of the 'Documents'
+    configuration section: extraction_workers, extraction_queue_size, extraction_timeout and extraction_memory_mb.
+    """
+    CONFIG_KEY = 'Documents'
+    WORKERS = 2
+    QUEUE_SIZE = 16
+    TIMEOUT = 20
+    MAX_MEMORY_MB = 512
+    PAGES_PER_JOB = 8
+    RESULT_GRACE = 5
+    OVERLOAD_RETRY_AFTER = 2
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        """
+        Create a new instance of DocumentExtractionService if it does not exist, ensuring thread safety.
+        """
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = super(DocumentExtractionService, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self, config_path='config.dev.ini'):
+        """
+        Initialize the DocumentExtractionService instance, unless the shared instance has already been initialized.
+
+        The worker processes are started when the first document is extracted.
+
+        :param config_path: Path to the configuration file.
+        :type config_path: str
+        :raises ValueError: If a setting in the configuration file is invalid.
+        """
+        if getattr(self, "_initialized", False):
+            return
+        with DocumentExtractionService._lock:
+            if getattr(self, "_initialized", False):
+                return
+            config = configparser.ConfigParser()
+            config.read(config_path)
+            has_settings = config.has_section(DocumentExtractionService.CONFIG_KEY)
+            settings = config[DocumentExtractionService.CONFIG_KEY] if has_settings else {}
+            try:
+                self.workers = int(settings.get('extraction_workers', DocumentExtractionService.WORKERS))
+                queue_size = int(settings.get('extraction_queue_size', DocumentExtractionService.QUEUE_SIZE))
+                self.timeout = float(settings.get('extraction_timeout', DocumentExtractionService.TIMEOUT))
+                self.max_memory_mb = int(settings.get('extraction_memory_mb', DocumentExtractionService.MAX_MEMORY_MB))
+            except ValueError as e:
+                logging.error(f"Error loading document extraction settings from config file: {e}")
+                raise ValueError("Failed to load the document extraction settings from the configuration file.")
+            self._slots = threading.BoundedSemaphore(self.workers + queue_size)
+            self._executor = None
+            self._executor_lock = threading.Lock()
+            self._initialized = True
+
+    def count_pdf_pages(self, path):
+        """
+        Count the pages of a PDF file in a worker process.
+
+        :param path: The path of the PDF file.
+        :type path: str
+        :return: The number of pages.
+        :rtype: int
+        :raises IOError: If the PDF file cannot be read properly.
+        :raises ExtractionLimitError: If the worker reaches its time or memory limit.
+        :raises ExtractionOverloadError: If the extraction queue is full.
+        """
+        return self.__result(self.__submit(_count_pdf_pages, path))
+
+    def extract_pdf_pages(self, path, page_count):
+        """
+        Extract the text of the pages of a PDF file in ranges, in parallel worker processes.
+
+        The ranges are submitted at once and their pages are yielded in order. The ranges that have not started are
+        cancelled when the generator is closed, e.g. once enough text was extracted.
+
+        :param path: The path of the PDF file.
+        :type path: str
+        :param page_count: The number of pages of the PDF file.
+        :type page_count: int
+        :return: A generator of the text of each page.
+        :rtype: Iterator[str]
+        :raises IOError: If the PDF file cannot be read properly.
+        :raises ExtractionLimitError: If a worker reaches its time or memory limit.
+        :raises ExtractionOverloadError: If the extraction queue is full.
+        """
+        futures = []
+        try:
+            for start in range(0, page_count, DocumentExtractionService.PAGES_PER_JOB):
+                stop = min(start + DocumentExtractionService.PAGES_PER_JOB, page_count)
+                futures.append(self.__submit(_extract_pdf_pages, path, start, stop))
+            for future in futures:
+                yield from self.__result(future)
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def extract_docx_paragraphs(self, path):
+        """
+        Extract the text of the paragraphs of a DOCX file in a worker process.
+
+        :param path: The path of the DOCX file.
+        :type path: str
+        :return: The text of each paragraph.
+        :rtype: list of str
+        :raises IOError: If the DOCX file cannot be read properly.
+        :raises ExtractionLimitError: If the worker reaches its time or memory limit.
+        :raises ExtractionOverloadError: If the extraction queue is full.
+        """
+        return self.__result(self.__submit(_extract_docx_paragraphs, path))
+
+    def __result(self, future):
+        """
+        Wait for the result of an extraction job.
+
+        The worker interrupts the job when it reaches the time limit, so the wait only times out if the job waited too
+        long in the queue.
+
+        :param future: The future of the job.
+        :type future: Future
+        :return: The result of the job.
+        :raises ExtractionOverloadError: If the result does not arrive in time or the worker processes crashed.
+        """
+        try:
+            return future.result(timeout=self.timeout + DocumentExtractionService.RESULT_GRACE)
+        except FutureTimeoutError:
+            raise ExtractionOverloadError(
+                "Document extraction timed out.", DocumentExtractionService.OVERLOAD_RETRY_AFTER
+            )
+        except BrokenProcessPool as e:
+            self.__reset_executor(e)
+            raise ExtractionOverloadError(
+                "Document extraction is restarting, please try again later.",
+                DocumentExtractionService.OVERLOAD_RETRY_AFTER
+            )
+
+    def __submit(self, function, *args):
+        """
+        Submit an extraction function to the worker processes if the extraction queue is not full.
+
+        :param function: The extraction function.
+        :type function: callable
+        :return: The future of the result.
+        :rtype: Future
+        :raises ExtractionOverloadError: If the extraction queue is full.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise ExtractionOverloadError(
+                "Too many documents are being extracted, please try again later.",
+                DocumentExtractionService.OVERLOAD_RETRY_AFTER
+            )
+        try:
+            future = self.__get_executor().submit(_run_limited, function, self.timeout, *args)
+        except BrokenProcessPool as e:
+            self.__reset_executor(e)
+            self._slots.release()
+            raise ExtractionOverloadError(
+                "Document extraction is restarting, please try again later.",
+                DocumentExtractionService.OVERLOAD_RETRY_AFTER
+            )
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def __reset_executor(self, error):
+        """
+        Discard a broken process pool, so that a new one is started for the next job.
+
+        :param error: The error raised by the broken pool.
+        :type error: BrokenProcessPool
+        """
+        logging.error(f"The document extraction pool is broken, restarting it: {error}")
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def __get_executor(self):
+        """
+        Get the process pool, starting it if it is not running.
+
+        The processes are spawned rather than forked, because the application process runs other threads. Spawned
+        processes import the main module, so scripts that extract documents must guard their code with
+        `if __name__ == '__main__'`.
+
+        :return: The process pool.
+        :rtype: ProcessPoolExecutor
+        """
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_limit_worker_memory,
+                    initargs=(self.max_memory_mb * 1024 * 1024,)
+                )
+            return self._executor
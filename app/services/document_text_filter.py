@@ -0,0 +1,109 @@
+import re
+
+class DocumentTextFilter:
+    """
+    A filter that removes boilerplate from the text of a medication document while it is being extracted.
+
+    The text is fed page by page. Empty lines, page numbers and running headers and footers are dropped, and so are
+    the sections of a package leaflet that do not describe the medication, such as the marketing authorisation holder,
+    the manufacturer and how to report side effects. A skipped section ends at the next numbered heading or known
+    leaflet heading.
+
+    A running header or footer is a short line among the first or last `EDGE_LINES` lines of a page that was at the
+    edge of at least `MIN_REPEATED_PAGES` pages and of most of the pages so far. Lines in the body of a page, e.g. a
+    dosage repeated in several sections, are never dropped as repeated, and the first occurrences of a header are kept
+    as the pages are not known in advance.
+
+    A filter keeps state across pages and must be used for a single document. Documents without pages are fed in
+    consecutive blocks of text, with the detection of repeated lines turned off.
+    """
+    BOILERPLATE_SECTION = re.compile(
+        r'^(marketing authori[sz]ation holder|manufacturer|this leaflet was (last )?revised|reporting of side effects'
+        r'|other sources of information|detailed information on this medicine is available'
+        r'|for any information about this medicine|this medicinal product is authori[sz]ed)',
+        re.IGNORECASE
+    )
+    SECTION_HEADING = re.compile(
+        r'^(\d{1,2}\.\s+\S|what .+ (contains|is and what it is used for|looks like)|how to (take|use|store)'
+        r'|possible side effects|before you (take|use))',
+        re.IGNORECASE
+    )
+    PAGE_NUMBER = re.compile(r'^(page\s*)?\d{1,4}(\s*(of|/)\s*\d{1,4})?$', re.IGNORECASE)
+    WHITESPACE = re.compile(r'\s+')
+    REPEATED_LINE_MAX_LENGTH = 80
+    EDGE_LINES = 2
+    MIN_REPEATED_PAGES = 3
+
+    def __init__(self, drop_repeated_lines=True):
+        """
+        Initialize the DocumentTextFilter instance.
+
+        :param drop_repeated_lines: Whether to drop the running headers and footers of the pages.
+        :type drop_repeated_lines: bool
+        """
+        self.drop_repeated_lines = drop_repeated_lines
+        self._edge_line_pages = {}
+        self._pages_seen = 0
+        self._skipping = False
+
+    def filter_page(self, text):
+        """
+        Remove the boilerplate from the text of the next page.
+
+        :param text: The text of the page.
+        :type text: str
+        :return: The remaining lines of the page, with their whitespace collapsed.
+        :rtype: list of str
+        """
+        page_lines = []
+        for raw_line in text.splitlines():
+            line = DocumentTextFilter.WHITESPACE.sub(' ', raw_line).strip()
+            if line and not DocumentTextFilter.PAGE_NUMBER.match(line):
+                page_lines.append(line)
+        edge_indexes = self.__count_edge_lines(page_lines) if self.drop_repeated_lines else set()
+
+        lines = []
+        for index, line in enumerate(page_lines):
+            if DocumentTextFilter.BOILERPLATE_SECTION.match(line):
+                self._skipping = True
+                continue
+            if self._skipping:
+                if not DocumentTextFilter.SECTION_HEADING.match(line):
+                    continue
+                self._skipping = False
+            if index in edge_indexes and self.__is_running_line(line):
+                continue
+            lines.append(line)
+        return lines
+
+    def __count_edge_lines(self, page_lines):
+        """
+        Count the short lines at the edges of a page, the candidate running headers and footers.
+
+        :param page_lines: The non-empty lines of the page.
+        :type page_lines: list of str
+        :return: The indexes of the lines at the edges of the page.
+        :rtype: set of int
+        """
+        self._pages_seen += 1
+        edge_count = min(DocumentTextFilter.EDGE_LINES, len(page_lines))
+        edge_indexes = set(range(edge_count)) | set(range(len(page_lines) - edge_count, len(page_lines)))
+        edge_lines = {
+            page_lines[index] for index in edge_indexes
+            if len(page_lines[index]) <= DocumentTextFilter.REPEATED_LINE_MAX_LENGTH
+        }
+        for line in edge_lines:
+            self._edge_line_pages[line] = self._edge_line_pages.get(line, 0) + 1
+        return edge_indexes
+
+    def __is_running_line(self, line):
+        """
+        Check whether a line at the edge of a page is a running header or footer.
+
+        :param line: The line.
+        :type line: str
+        :return: True if the line was at the edge of enough pages, and of most of the pages so far.
+        :rtype: bool
+        """
+        page_count = self._edge_line_pages.get(line, 0)
+        return page_count >= DocumentTextFilter.MIN_REPEATED_PAGES and page_count * 2 > self._pages_seen
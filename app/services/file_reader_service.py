@@ -1,8 +1,43 @@
-import PyPDF2
-from docx import Document
+from .document_text_filter import DocumentTextFilter
+from .document_extraction_service import DocumentExtractionService, ExtractionLimitError
+from contextlib import contextmanager
+import hashlib
+import codecs
+import tempfile
+import shutil
+import logging
 import os
 
+class DocumentLimitError(ValueError):
+    """
+    Raised when an uploaded document is larger than the limits of the file reader.
+    """
+
 class FileReaderService:
+    """
+    A service class that extracts the text of uploaded medication documents.
+
+    The document is read as a stream: the upload is spooled to a temporary file when it is not seekable, its size and
+    number of pages are checked before it is parsed, and its pages are extracted one at a time. Boilerplate is dropped
+    with a `DocumentTextFilter`, and the extraction stops once the text reaches the token budget, so the remaining
+    pages are never parsed. PDF and DOCX documents are parsed in the worker processes of the
+    `DocumentExtractionService`, so that parsing does not stall the other requests.
+
+    Attributes:
+        MAX_FILE_BYTES (int): The maximum size of a document in bytes.
+        MAX_PAGES (int): The maximum number of pages of a PDF document.
+        MAX_TOKENS (int): The maximum number of tokens of the extracted text, estimated from its length.
+        CHARS_PER_TOKEN (int): The number of characters counted as one token.
+        SPOOL_MAX_MEMORY (int): The number of bytes of a spooled upload kept in memory before it is moved to a file.
+        CHUNK_SIZE (int): The number of bytes read from an upload at once.
+    """
+    MAX_FILE_BYTES = 10 * 1024 * 1024
+    MAX_PAGES = 40
+    MAX_TOKENS = 6000
+    CHARS_PER_TOKEN = 4
+    SPOOL_MAX_MEMORY = 512 * 1024
+    CHUNK_SIZE = 64 * 1024
+
     @staticmethod
     def read_file(file, file_extension):
         """
@@ -12,74 +47,291 @@ class FileReaderService:
         :type file: FileStorage (werkzeug.datastructures.FileStorage)
         :param file_extension: The file extension (e.g., '.pdf', '.docx').
         :type file_extension: str
-        :return: The content of the file as a string.
+        :return: The content of the file as a string, without boilerplate and truncated to the token budget.
         :rtype: str
         :raises ValueError: If the file type is not supported or if file_extension is invalid.
+        :raises DocumentLimitError: If the file is larger than the byte or page limit, or too expensive to parse.
+        :raises ExtractionOverloadError: If the document extraction queue is full.
+        :raises IOError: If the file cannot be read properly.
+        """
+        FileReaderService.validate_file_extension(file_extension)
+        with FileReaderService.open_upload(file) as stream:
+            return FileReaderService.read_stream(stream, file_extension)
+
+    @staticmethod
+    @contextmanager
+    def open_upload(file):
+        """
+        Open an upload as a seekable stream that is within the byte limit, for hashing and reading.
+
+        :param file: The uploaded file.
+        :type file: FileStorage (werkzeug.datastructures.FileStorage)
+        :return: A context manager of a seekable binary stream positioned at the start of the upload.
+        :rtype: ContextManager[IO[bytes]]
+        :raises DocumentLimitError: If the upload is larger than the byte limit.
+        """
+        stream = FileReaderService._spool(file)
+        try:
+            yield stream
+        finally:
+            if stream is not getattr(file, 'stream', file):
+                stream.close()
+
+    @staticmethod
+    def hash_stream(stream):
+        """
+        Compute the SHA-256 digest of the bytes of a stream and rewind it.
+
+        :param stream: A seekable binary stream positioned at the start of the upload.
+        :type stream: IO[bytes]
+        :return: The SHA-256 hex digest of the remaining bytes of the stream.
+        :rtype: str
+        """
+        start = stream.tell()
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: stream.read(FileReaderService.CHUNK_SIZE), b''):
+            digest.update(chunk)
+        stream.seek(start)
+        return digest.hexdigest()
+
+    @staticmethod
+    def read_stream(stream, file_extension):
+        """
+        Read the content of an upload opened with `open_upload` based on its extension.
+
+        :param stream: A seekable binary stream positioned at the start of the upload.
+        :type stream: IO[bytes]
+        :param file_extension: The file extension (e.g., '.pdf', '.docx').
+        :type file_extension: str
+        :return: The content of the file as a string, without boilerplate and truncated to the token budget.
+        :rtype: str
+        :raises ValueError: If the file type is not supported or if file_extension is invalid.
+        :raises DocumentLimitError: If the file has more pages than the page limit or is too expensive to parse.
+        :raises ExtractionOverloadError: If the document extraction queue is full.
+        :raises IOError: If the file cannot be read properly.
+        """
+        read_pages, paginated = FileReaderService._get_read_method(file_extension)
+        return FileReaderService._join_pages(read_pages(stream), paginated)
+
+    @staticmethod
+    def validate_file_extension(file_extension):
+        """
+        Check that files with an extension can be read, before the upload is opened.
+
+        :param file_extension: The file extension (e.g., '.pdf', '.docx').
+        :type file_extension: str
+        :raises ValueError: If the file type is not supported or if file_extension is invalid.
+        """
+        FileReaderService._get_read_method(file_extension)
+
+    @staticmethod
+    def _get_read_method(file_extension):
+        """
+        Get the read method of a file extension.
+
+        :param file_extension: The file extension (e.g., '.pdf', '.docx').
+        :type file_extension: str
+        :return: The read method and whether it yields pages.
+        :rtype: tuple
+        :raises ValueError: If the file type is not supported or if file_extension is invalid.
         """
         # Validate file_extension input
         if not isinstance(file_extension, str) or not file_extension:
             raise ValueError("file_extension must be a non-empty string")
-        
-        # Mapping file extensions to their respective read methods
+
+        # Mapping file extensions to their respective read methods and whether they yield pages
         read_methods = {
-            '.pdf': FileReaderService._read_pdf,
-            '.docx': FileReaderService._read_docx,
-            '.txt': FileReaderService._read_text,
-            '.md': FileReaderService._read_text
+            '.pdf': (FileReaderService._read_pdf, True),
+            '.docx': (FileReaderService._read_docx, False),
+            '.txt': (FileReaderService._read_text, False),
+            '.md': (FileReaderService._read_text, False)
         }
 
         read_method = read_methods.get(file_extension.lower())
-        if read_method:
-            return read_method(file)
-        else:
+        if not read_method:
             raise ValueError(f"Unsupported file type: {file_extension}")
+        return read_method
 
     @staticmethod
-    def _read_pdf(file):
+    def _spool(file):
         """
-        Extract text from a PDF file.
+        Get a seekable stream of an upload that is within the byte limit.
 
-        :param file: The PDF file to be read.
+        Seekable uploads, which Werkzeug already keeps in a temporary file when they are large, are measured without
+        being read. Other uploads are copied in chunks to a temporary file that stays in memory only while it is small.
+
+        :param file: The uploaded file.
         :type file: FileStorage (werkzeug.datastructures.FileStorage)
-        :return: The extracted text from the PDF.
+        :return: A seekable binary stream positioned at the start of the upload.
+        :rtype: IO[bytes]
+        :raises DocumentLimitError: If the upload is larger than the byte limit.
+        """
+        stream = getattr(file, 'stream', file)
+        try:
+            seekable = stream.seekable()
+        except (AttributeError, ValueError):
+            seekable = False
+        if seekable:
+            start = stream.tell()
+            size = stream.seek(0, os.SEEK_END) - start
+            stream.seek(start)
+            if size > FileReaderService.MAX_FILE_BYTES:
+                raise FileReaderService.__too_large()
+            return stream
+
+        spooled = tempfile.SpooledTemporaryFile(max_size=FileReaderService.SPOOL_MAX_MEMORY)
+        size = 0
+        try:
+            while True:
+                chunk = stream.read(FileReaderService.CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > FileReaderService.MAX_FILE_BYTES:
+                    raise FileReaderService.__too_large()
+                spooled.write(chunk)
+        except Exception:
+            spooled.close()
+            raise
+        spooled.seek(0)
+        return spooled
+
+    @staticmethod
+    def __too_large():
+        """
+        Create the error raised for an upload that is larger than the byte limit.
+
+        :return: The error.
+        :rtype: DocumentLimitError
+        """
+        max_megabytes = FileReaderService.MAX_FILE_BYTES / (1024 * 1024)
+        return DocumentLimitError(f"The file is larger than the limit of {max_megabytes:g} MB.")
+
+    @staticmethod
+    def _join_pages(pages, paginated):
+        """
+        Join the text of the pages of a document, dropping boilerplate, until the token budget is reached.
+
+        :param pages: A generator of the text of the pages, or of consecutive blocks of text for documents without pages.
+        :type pages: Iterator[str]
+        :param paginated: Whether the text is split into pages, so that repeated headers and footers can be dropped.
+        :type paginated: bool
+        :return: The joined text.
         :rtype: str
+        """
+        text_filter = DocumentTextFilter(drop_repeated_lines=paginated)
+        max_chars = FileReaderService.MAX_TOKENS * FileReaderService.CHARS_PER_TOKEN
+        lines = []
+        length = 0
+        try:
+            for page in pages:
+                for line in text_filter.filter_page(page):
+                    remaining = max_chars - length
+                    if len(line) > remaining:
+                        if remaining > 0:
+                            lines.append(line[:remaining])
+                        logging.info(f"Truncated a document to the budget of {FileReaderService.MAX_TOKENS} tokens")
+                        return '\n'.join(lines)
+                    lines.append(line)
+                    length += len(line) + 1
+        finally:
+            # Stop the generator, so the remaining pages are not parsed
+            pages.close()
+        return '\n'.join(lines)
+
+    @staticmethod
+    def _read_pdf(file):
+        """
+        Extract text from a PDF file, in parallel page ranges in worker processes.
+
+        :param file: The PDF file to be read.
+        :type file: IO[bytes]
+        :return: A generator of the text of each page, each extracted once.
+        :rtype: Iterator[str]
+        :raises DocumentLimitError: If the PDF file has more pages than the page limit or is too expensive to parse.
+        :raises ExtractionOverloadError: If the document extraction queue is full.
         :raises IOError: If the PDF file cannot be read properly.
         """
+        extraction_service = DocumentExtractionService()
+        path = FileReaderService._save_temporary_file(file, '.pdf')
         try:
-            reader = PyPDF2.PdfReader(file)
-            return ' '.join(page.extract_text() for page in reader.pages if page.extract_text())
-        except Exception as e:
-            raise IOError(f"An error occurred while reading the PDF file: {str(e)}")
+            page_count = extraction_service.count_pdf_pages(path)
+            if page_count > FileReaderService.MAX_PAGES:
+                raise DocumentLimitError(f"The PDF file has more than {FileReaderService.MAX_PAGES} pages.")
+            for text in extraction_service.extract_pdf_pages(path, page_count):
+                if text:
+                    yield text
+        except ExtractionLimitError as e:
+            raise DocumentLimitError(str(e))
+        finally:
+            os.remove(path)
 
     @staticmethod
     def _read_docx(file):
         """
-        Extract text from a DOCX file.
+        Extract text from a DOCX file in a worker process.
 
         :param file: The DOCX file to be read.
-        :type file: FileStorage (werkzeug.datastructures.FileStorage)
-        :return: The extracted text from the DOCX file.
-        :rtype: str
+        :type file: IO[bytes]
+        :return: A generator of the text of each paragraph.
+        :rtype: Iterator[str]
+        :raises DocumentLimitError: If the DOCX file is too expensive to parse.
+        :raises ExtractionOverloadError: If the document extraction queue is full.
         :raises IOError: If the DOCX file cannot be read properly.
         """
+        path = FileReaderService._save_temporary_file(file, '.docx')
         try:
-            doc = Document(file)
-            return ' '.join(paragraph.text for paragraph in doc.paragraphs)
-        except Exception as e:
-            raise IOError(f"An error occurred while reading the DOCX file: {str(e)}")
+            yield from DocumentExtractionService().extract_docx_paragraphs(path)
+        except ExtractionLimitError as e:
+            raise DocumentLimitError(str(e))
+        finally:
+            os.remove(path)
+
+    @staticmethod
+    def _save_temporary_file(file, suffix):
+        """
+        Copy an upload to a named temporary file, which the worker processes can open.
+
+        :param file: The upload.
+        :type file: IO[bytes]
+        :param suffix: The suffix of the temporary file.
+        :type suffix: str
+        :return: The path of the temporary file, which the caller must remove.
+        :rtype: str
+        """
+        with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as temporary_file:
+            try:
+                shutil.copyfileobj(file, temporary_file, FileReaderService.CHUNK_SIZE)
+            except Exception:
+                temporary_file.close()
+                os.remove(temporary_file.name)
+                raise
+            return temporary_file.name
 
     @staticmethod
     def _read_text(file):
         """
-        Extract text from a plain text file.
+        Extract text from a plain text file, one chunk at a time.
 
         :param file: The text file to be read.
-        :type file: FileStorage (werkzeug.datastructures.FileStorage)
-        :return: The extracted text from the text file.
-        :rtype: str
-        :raises UnicodeDecodeError: If the file cannot be decoded using UTF-8.
+        :type file: IO[bytes]
+        :return: A generator of consecutive blocks of complete lines of the file.
+        :rtype: Iterator[str]
+        :raises ValueError: If the file cannot be decoded using UTF-8.
         """
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        pending = ''
         try:
-            return file.read().decode('utf-8')
+            while True:
+                chunk = file.read(FileReaderService.CHUNK_SIZE)
+                text = pending + decoder.decode(chunk, final=not chunk)
+                if not chunk:
+                    if text:
+                        yield text
+                    return
+                # Keep the last, possibly incomplete line for the next chunk
+                complete, _, pending = text.rpartition('\n')
+                if complete:
+                    yield complete
         except UnicodeDecodeError as e:
-            raise UnicodeDecodeError(f"An error occurred while decoding the text file: {str(e)}")
+            raise ValueError(f"An error occurred while decoding the text file: {str(e)}")
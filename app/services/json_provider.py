@@ -0,0 +1,121 @@
+from bson import ObjectId
+from datetime import date, datetime
+from enum import Enum
+from flask.json.provider import DefaultJSONProvider
+from model.base_model import BaseModel
+import dataclasses
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+def encode_default(value):
+    """
+    Convert a value the JSON encoders do not support natively to a JSON-serializable value.
+
+    :param value: The value to convert.
+    :type value: Any
+    :return: The string of an `ObjectId`, the ISO format of a date, the value of an enum member, the dictionary of a
+        model or dataclass.
+    :rtype: Any
+    :raises TypeError: If the value cannot be converted.
+    """
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, BaseModel):
+        return value.asdict()
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    The JSON provider of the Flask app, used by `jsonify` and `request.get_json`.
+
+    Responses are encoded with orjson when it is installed and with the standard library otherwise. Both encoders
+    support `ObjectId`, `datetime`, `Role` and the models directly, so controllers can return them without converting
+    them to JSON strings first.
+    """
+    default = staticmethod(encode_default)
+
+    if orjson is not None:
+        OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATACLASS
+    else:
+        OPTIONS = 0
+
+    def dumps(self, obj, **kwargs):
+        """
+        Serialize data as JSON.
+
+        :param obj: The data to serialize.
+        :type obj: Any
+        :param kwargs: Arguments of `json.dumps`. The standard library encoder is used if any is given.
+        :return: The JSON string.
+        :rtype: str
+        """
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.__encode(obj, self.OPTIONS | self.__sort_option()).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        """
+        Deserialize data as JSON.
+
+        :param s: The JSON text.
+        :type s: str or bytes
+        :param kwargs: Arguments of `json.loads`. The standard library decoder is used if any is given.
+        :return: The deserialized data.
+        :rtype: Any
+        """
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        """
+        Serialize the given arguments as JSON and return a response with the `application/json` mimetype.
+
+        With orjson, the encoded bytes are used as the response body without an intermediate string.
+
+        :return: The response.
+        :rtype: Response
+        """
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        options = self.OPTIONS | self.__sort_option()
+        if self.compact is False or (self.compact is None and self._app.debug):
+            options |= orjson.OPT_INDENT_2
+        return self._app.response_class(self.__encode(obj, options) + b"\n", mimetype=self.mimetype)
+
+    def __sort_option(self):
+        """
+        Get the orjson option matching the `sort_keys` setting.
+
+        :return: The orjson option.
+        :rtype: int
+        """
+        return orjson.OPT_SORT_KEYS if self.sort_keys else 0
+
+    def __encode(self, obj, options):
+        """
+        Encode data with orjson, or with the standard library if orjson cannot encode it (e.g. integers over 64 bits).
+
+        :param obj: The data to encode.
+        :type obj: Any
+        :param options: The orjson options.
+        :type options: int
+        :return: The JSON bytes.
+        :rtype: bytes
+        """
+        try:
+            return orjson.dumps(obj, default=encode_default, option=options)
+        except orjson.JSONEncodeError:
+            indent = 2 if options & orjson.OPT_INDENT_2 else None
+            separators = None if indent else (',', ':')
+            return super().dumps(obj, indent=indent, separators=separators).encode('utf-8')
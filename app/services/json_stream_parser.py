@@ -0,0 +1,106 @@
+import json
+
+class JSONArrayStreamParser:
+    """
+    An incremental parser that emits the items of an array in a JSON object while the object is being received.
+
+    The text of the JSON object is fed in pieces as it arrives, for example from a streamed OpenAI response. Each
+    object in the array under the given top-level key is parsed and returned as soon as its closing brace has been
+    received. Only the text of the item being received is kept in memory.
+    """
+
+    def __init__(self, key):
+        """
+        Initialize the JSONArrayStreamParser instance.
+
+        :param key: The top-level key of the array whose items are emitted.
+        :type key: str
+        """
+        self.key = key
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._string = []
+        self._last_key = None
+        self._array_depth = None
+        self._item = []
+        self._item_started = False
+
+    def feed(self, text):
+        """
+        Feed the next piece of the JSON text to the parser.
+
+        :param text: The next piece of the JSON text.
+        :type text: str
+        :return: The array items that were completed by this piece, in order.
+        :rtype: list of dict
+        :raises ValueError: If a completed item is not valid JSON.
+        """
+        items = []
+        for char in text:
+            if self._item_started:
+                self._item.append(char)
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_key = ''.join(self._string)
+                elif self._depth == 1:
+                    self._string.append(char)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string = []
+            elif char in '{[':
+                self._depth += 1
+                if char == '[' and self._depth == 2 and self._array_depth is None and self._last_key == self.key:
+                    self._array_depth = self._depth
+                elif char == '{' and self._array_depth is not None and self._depth == self._array_depth + 1:
+                    self._item_started = True
+                    self._item = [char]
+            elif char in '}]':
+                if self._depth == 0:
+                    raise ValueError(f"Unexpected '{char}' in the JSON text.")
+                if self._item_started and self._depth == self._array_depth + 1:
+                    items.append(self.__parse_item(''.join(self._item)))
+                    self._item_started = False
+                    self._item = []
+                elif self._depth == self._array_depth:
+                    self._array_depth = -1  # The array is complete, ignore any later array with the same key
+                self._depth -= 1
+            elif char == ',' and self._depth == 1:
+                self._last_key = None
+        return items
+
+    def close(self):
+        """
+        Check that the whole JSON object has been received.
+
+        :raises ValueError: If the JSON object is incomplete or does not contain the array.
+        """
+        if self._depth != 0 or self._in_string:
+            raise ValueError("The JSON text ended before the object was complete.")
+        if self._array_depth is None:
+            raise ValueError(f"The JSON text does not contain a '{self.key}' array.")
+
+    @staticmethod
+    def __parse_item(item_text):
+        """
+        Parse the text of a completed array item.
+
+        :param item_text: The JSON text of the item.
+        :type item_text: str
+        :return: The parsed item.
+        :rtype: dict
+        :raises ValueError: If the item is not valid JSON.
+        """
+        try:
+            return json.loads(item_text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"An item of the JSON array is not valid JSON: {str(e)}")
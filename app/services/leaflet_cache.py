@@ -0,0 +1,220 @@
+from db.leaflet_fingerprints import LeafletFingerprints
+from db.medication_search import MedicationSearch
+from dataclasses import dataclass, field
+from typing import List
+import threading
+import hashlib
+import logging
+import random
+
+@dataclass(frozen=True)
+class LeafletFingerprint:
+    """
+    A data model representing the fingerprint of the extracted text of a leaflet.
+
+    Attributes:
+        text_hash (str): The SHA-256 hex digest of the normalized text.
+        signature (List[int]): The MinHash signature of the shingles of the text.
+        bands (List[str]): The locality-sensitive hashing bands of the signature.
+    """
+    text_hash: str
+    signature: List[int] = field(default_factory=list)
+    bands: List[str] = field(default_factory=list)
+
+class LeafletCache:
+    """
+    A content-addressed cache of the medication data parsed from uploaded leaflets.
+
+    A repeated upload is recognized, in order of cost, by the SHA-256 digest of its bytes before its text is extracted,
+    or by the SHA-256 digest of its normalized text.
+
+    Uploads whose text shares most of its shingles (runs of `SHINGLE_SIZE` words) with a cached leaflet are reported as
+    near-duplicates, but their cached data is never reused: leaflets of two strengths of a medication differ in a few
+    words only, and the name, dosage and dosage rule of one must not be stored for the other. Near-duplicates are found
+    with MinHash signatures, whose bands are indexed so that only leaflets sharing a band are compared, and are
+    reported when the estimated Jaccard similarity is at least `NEAR_DUPLICATE_THRESHOLD`.
+
+    Cached medication data is shared between callers and must not be modified. The cache counters are served by
+    `GET /api/metrics/leaflet-cache`.
+    """
+    SHINGLE_SIZE = 5
+    SIGNATURE_SIZE = 64
+    BAND_ROWS = 4
+    NEAR_DUPLICATE_THRESHOLD = 0.9
+    MERSENNE_PRIME = (1 << 61) - 1
+    SEED = 20240917
+
+    def __init__(self):
+        """
+        Initialize the LeafletCache instance and its MinHash permutations.
+        """
+        generator = random.Random(LeafletCache.SEED)
+        self._permutations = [
+            (generator.randrange(1, LeafletCache.MERSENNE_PRIME), generator.randrange(0, LeafletCache.MERSENNE_PRIME))
+            for _ in range(LeafletCache.SIGNATURE_SIZE)
+        ]
+        self.hits = {'file': 0, 'text': 0}
+        self.near_duplicates = 0
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def normalize(text):
+        """
+        Normalize extracted text so that formatting differences do not change its hash.
+
+        :param text: The extracted text.
+        :type text: str
+        :return: The words of the text, case-folded and without accents or punctuation, separated by single spaces.
+        :rtype: str
+        """
+        return ' '.join(MedicationSearch.TOKEN_PATTERN.findall(MedicationSearch.normalize(text)))
+
+    def fingerprint(self, text):
+        """
+        Compute the fingerprint of extracted text.
+
+        :param text: The extracted text.
+        :type text: str
+        :return: The fingerprint of the text, without a signature if the text is shorter than a shingle.
+        :rtype: LeafletFingerprint
+        """
+        normalized = LeafletCache.normalize(text)
+        text_hash = hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+        words = normalized.split()
+        if len(words) < LeafletCache.SHINGLE_SIZE:
+            return LeafletFingerprint(text_hash)
+        shingles = {
+            ' '.join(words[index:index + LeafletCache.SHINGLE_SIZE])
+            for index in range(len(words) - LeafletCache.SHINGLE_SIZE + 1)
+        }
+        shingle_hashes = [
+            int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+            for shingle in shingles
+        ]
+        prime = LeafletCache.MERSENNE_PRIME
+        signature = [min((a * value + b) % prime for value in shingle_hashes) for a, b in self._permutations]
+        bands = [
+            f"{start}:" + hashlib.sha1(repr(signature[start:start + LeafletCache.BAND_ROWS]).encode('utf-8')).hexdigest()[:16]
+            for start in range(0, LeafletCache.SIGNATURE_SIZE, LeafletCache.BAND_ROWS)
+        ]
+        return LeafletFingerprint(text_hash, signature, bands)
+
+    @staticmethod
+    def similarity(signature, other_signature):
+        """
+        Estimate the Jaccard similarity of the shingles of two texts from their MinHash signatures.
+
+        :param signature: The signature of the first text.
+        :type signature: list of int
+        :param other_signature: The signature of the second text.
+        :type other_signature: list of int
+        :return: The estimated similarity, between 0 and 1.
+        :rtype: float
+        """
+        if len(signature) != len(other_signature) or not signature:
+            return 0.0
+        return sum(1 for value, other in zip(signature, other_signature) if value == other) / len(signature)
+
+    def get_by_file_hash(self, file_hash, version):
+        """
+        Get the medication data parsed from an upload with the same bytes.
+
+        :param file_hash: The SHA-256 hex digest of the uploaded bytes.
+        :type file_hash: str
+        :param version: The version of the parser.
+        :type version: str
+        :return: The cached medication data, or None if it is not cached.
+        :rtype: dict or None
+        """
+        try:
+            medication = LeafletFingerprints.find_by_file_hash(file_hash, version)
+        except Exception as e:
+            logging.error(f"Failed to read the cached leaflet: {e}")
+            return None
+        if medication is not None:
+            self.__count_hit('file')
+        return medication
+
+    def get_by_fingerprint(self, fingerprint, version):
+        """
+        Get the medication data parsed from an upload with the same normalized text.
+
+        A cached leaflet with a similar text is only logged as a near-duplicate, its data is not returned. Texts shorter
+        than a shingle, e.g. of scanned leaflets without a text layer, are not matched.
+
+        :param fingerprint: The fingerprint of the extracted text.
+        :type fingerprint: LeafletFingerprint
+        :param version: The version of the parser.
+        :type version: str
+        :return: The cached medication data, or None if it is not cached.
+        :rtype: dict or None
+        """
+        if not fingerprint.signature:
+            return None
+        try:
+            medication = LeafletFingerprints.find_by_text_hash(fingerprint.text_hash, version)
+            if medication is not None:
+                self.__count_hit('text')
+                return medication
+            candidates = LeafletFingerprints.find_by_bands(fingerprint.bands, version)
+        except Exception as e:
+            logging.error(f"Failed to read the cached leaflet: {e}")
+            return None
+        best = max(candidates, key=lambda doc: LeafletCache.similarity(fingerprint.signature, doc['signature']), default=None)
+        if best is not None:
+            similarity = LeafletCache.similarity(fingerprint.signature, best['signature'])
+            if similarity >= LeafletCache.NEAR_DUPLICATE_THRESHOLD:
+                with self._stats_lock:
+                    self.near_duplicates += 1
+                logging.info(
+                    f"The leaflet is a near-duplicate ({similarity:.2f}) of the cached leaflet {best['_id']}, parsing it"
+                )
+        return None
+
+    def __count_hit(self, kind):
+        """
+        Count a cache hit.
+
+        :param kind: The kind of the hit, 'file' or 'text'.
+        :type kind: str
+        """
+        with self._stats_lock:
+            self.hits[kind] += 1
+
+    def stats(self):
+        """
+        Get the cache counters.
+
+        :return: The number of hits by the digest of the uploaded bytes and of the text, and the number of
+            near-duplicates that were parsed again.
+        :rtype: dict
+        """
+        with self._stats_lock:
+            return {
+                'file_hits': self.hits['file'],
+                'text_hits': self.hits['text'],
+                'near_duplicates': self.near_duplicates
+            }
+
+    def put(self, file_hash, fingerprint, version, medication):
+        """
+        Cache the medication data parsed from an upload.
+
+        :param file_hash: The SHA-256 hex digest of the uploaded bytes.
+        :type file_hash: str
+        :param fingerprint: The fingerprint of the extracted text.
+        :type fingerprint: LeafletFingerprint
+        :param version: The version of the parser.
+        :type version: str
+        :param medication: The parsed medication data.
+        :type medication: dict
+        """
+        try:
+            LeafletFingerprints.add(
+                file_hash, fingerprint.text_hash, fingerprint.signature, fingerprint.bands, version, medication
+            )
+        except Exception as e:
+            logging.error(f"Failed to store the leaflet in the cache: {e}")
+
+
+leaflet_cache = LeafletCache()
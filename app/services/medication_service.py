@@ -2,15 +2,49 @@ from .openai_service import OpenAIService
 import json
 from json.decoder import JSONDecodeError
 from .file_reader_service import FileReaderService
+from .document_extraction_service import ExtractionOverloadError
+from .leaflet_cache import leaflet_cache
+from model.dosage_rule_model import DosageRule
+from model.medication_model import MedicationModel
+from db.medications import Medications
+from dataclasses import asdict
 from werkzeug.utils import secure_filename
 import os
+import logging
 
 class MedicationService:
     """
     A service class to handle the extraction of medication data from a file using OpenAI's API.
     
     This service reads a file, processes it through OpenAI's API, and extracts the required medication information.
+    It also extracts the structured dosage rule of a medication, which is used to build timesheets without OpenAI.
     """
+    MEDICATION_PROMPT = (
+        "You are an assistant that will receive information on medication, that should parse the information and extract the medication data in the following fields as json: "
+        "name, contents, sideEffects, objective, dosageSchedule, dosageRule."
+        "Each of the first five fields should be a free text."
+        "The dosageRule field should be an object describing the dosage schedule for an adult less than 65 years old with the following fields: "
+        "dosage - free text with the amount taken per intake, times_of_day - a list of intake times in 'HH:MM' format between 08:00 and 22:00 unless the medication should be taken during sleep hours or at exact time intervals, "
+        "interval_days - the number of days between the days the medication is taken, 1 if it is taken every day, food - 'with', 'without' or 'any', "
+        "max_course_days - the maximum number of days the medication may be taken or null if there is no limit."
+        "The returned object should contain only those six properties."
+        "The returned value should be a valid json format with no new lines or any text before or after the json output."
+        "Translate to English if necessary.\n"
+    )
+    MEDICATION_PROMPT_VERSION = 1
+    DOSAGE_RULE_PROMPT = (
+        "You are an assistant that will receive the dosage schedule of a medication and should convert it to a structured dosage rule as json with the following fields: "
+        "dosage, times_of_day, interval_days, food, max_course_days."
+        "The dosage - should be free text with the amount taken per intake, e.g. '1 tablet'."
+        "The times_of_day - should be a list of the times of the intakes on each day the medication is taken in 'HH:MM' format. "
+        "Keep in mind that most people are awake from 08:00 until about 22:00 and choose the times accordingly unless the medication should be taken during sleep hours or at exact time intervals."
+        "The interval_days - should be the number of days between the days the medication is taken as an integer, 1 if it is taken every day."
+        "The food - should be 'with' if the medication is taken with food, 'without' if it is taken without food and 'any' otherwise."
+        "The max_course_days - should be the maximum number of days the medication may be taken as an integer, or null if there is no limit."
+        "Consider the person taking the medication as an adult less than 65 years old."
+        "The returned value should be a valid json format with no new lines or any text before or after the json output.\n"
+    )
+
     def __init__(self):
         """
         Initialize the MedicationService instance.
@@ -24,38 +58,99 @@ class MedicationService:
         Parse medication data from a given file.
 
         This method reads the content of the file, sends it to OpenAI for processing, and extracts the medication data in JSON format.
+        The parsed data is cached by the content of the file, so a repeated upload of the same leaflet, or of one with the same
+        text, is answered from the cache without calling OpenAI. Leaflets with a nearly identical text are parsed again.
 
         :param file: The file containing medication information to be processed.
         :type file: FileStorage (werkzeug.datastructures.FileStorage)
-        :return: A dictionary containing extracted medication data with fields: name, contents, sideEffects, objective, dosageSchedule.
+        :return: A dictionary containing extracted medication data with fields: name, contents, sideEffects, objective, dosageSchedule, dosageRule.
         :rtype: dict
         :raises FileNotFoundError: If the file is not found.
         :raises ValueError: If the response from OpenAI cannot be parsed as JSON or if there is an issue with the response data.
+        :raises DocumentLimitError: If the file is larger than the limits of the file reader.
+        :raises ExtractionOverloadError: If the document extraction queue is full.
         :raises IOError: For any other errors that occur while reading the file or processing the data.
         """
-        prompt = (
-            "You are an assistant that will receive information on medication, that should parse the information and extract the medication data in the following fields as json: "
-            "name, contents, sideEffects, objective, dosageSchedule."
-            "Each of those fields should be a free text."
-            "The returned object should contain only those five properties."
-            "The returned value should be a valid json format with no new lines or any text before or after the json output."
-            "Translate to English if necessary.\n"
-        )
-
         try:
             filename = secure_filename(file.filename)
             file_extension = os.path.splitext(filename)[1]
-            file_content = FileReaderService.read_file(file, file_extension)
-
-            response = self.openai_service.run(prompt, file_content)
+            FileReaderService.validate_file_extension(file_extension)
+            version = f"{MedicationService.MEDICATION_PROMPT_VERSION}-{OpenAIService.MODEL}"
+            with FileReaderService.open_upload(file) as stream:
+                file_hash = FileReaderService.hash_stream(stream)
+                medication_data = leaflet_cache.get_by_file_hash(file_hash, version)
+                if medication_data is not None:
+                    return medication_data
 
-            medication_data = json.loads(response)
+                file_content = FileReaderService.read_stream(stream, file_extension)
+            fingerprint = leaflet_cache.fingerprint(file_content)
+            medication_data = leaflet_cache.get_by_fingerprint(fingerprint, version)
+            if medication_data is None:
+                response = self.openai_service.run(MedicationService.MEDICATION_PROMPT, file_content)
+                medication_data = json.loads(response)
+                if not isinstance(medication_data, dict):
+                    raise ValueError("The response from OpenAI is not a JSON object.")
+            leaflet_cache.put(file_hash, fingerprint, version, medication_data)
             return medication_data
         except FileNotFoundError:
             raise FileNotFoundError(f"The file was not found.")
         except JSONDecodeError as e:
             raise ValueError(f"Failed to parse the response from OpenAI as JSON: {str(e)}")
-        except ValueError as e:
-            raise ValueError(str(e))
+        except (ValueError, ExtractionOverloadError):
+            raise
         except Exception as e:
             raise IOError(f"An error occurred while reading the file: {str(e)}")
+
+    def extract_dosage_rule(self, dosage_schedule):
+        """
+        Extract the structured dosage rule from a free-text dosage schedule.
+
+        :param dosage_schedule: The dosage schedule of the medication.
+        :type dosage_schedule: str
+        :return: The extracted dosage rule.
+        :rtype: DosageRule
+        :raises ValueError: If the response from OpenAI is not valid JSON or is not a valid dosage rule.
+        """
+        response = self.openai_service.run(MedicationService.DOSAGE_RULE_PROMPT, dosage_schedule)
+        try:
+            return DosageRule(**json.loads(response))
+        except JSONDecodeError as e:
+            raise ValueError(f"Failed to parse the response from OpenAI as JSON: {str(e)}")
+        except TypeError as e:
+            raise ValueError(f"The response from OpenAI is not a valid dosage rule: {str(e)}")
+
+    def get_dosage_rule(self, medication: MedicationModel):
+        """
+        Get the dosage rule of a medication, extracting and storing it if the medication does not have one yet.
+
+        :param medication: The medication.
+        :type medication: MedicationModel
+        :return: The dosage rule, or None if it could not be extracted.
+        :rtype: DosageRule or None
+        """
+        if medication.dosage_rule is None:
+            try:
+                medication.dosage_rule = self.extract_dosage_rule(medication.dosage_schedule)
+            except (ValueError, RuntimeError) as e:
+                logging.error(f"Failed to extract the dosage rule of medication {medication.get_id()}: {e}")
+                return None
+            Medications.update_dosage_rule(medication.get_id(), medication.dosage_rule)
+        return medication.dosage_rule
+
+    def get_timesheet_data(self, medication: MedicationModel):
+        """
+        Get the medication data sent to the timesheet service.
+
+        :param medication: The medication.
+        :type medication: MedicationModel
+        :return: A dictionary with the medication ID, name, dosage schedule, objective and dosage rule.
+        :rtype: dict
+        """
+        dosage_rule = self.get_dosage_rule(medication)
+        return {
+            "id": str(medication.id),
+            "name": medication.name,
+            "dosage_schedule": medication.dosage_schedule,
+            "objective": medication.objective,
+            "dosage_rule": asdict(dosage_rule) if dosage_rule else None
+        }
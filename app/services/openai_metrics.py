@@ -0,0 +1,113 @@
+from collections import deque
+import threading
+
+class OpenAIMetrics:
+    """
+    Thread-safe counters of the requests sent to OpenAI's API.
+
+    The latency of each request attempt, the number of retries and failures and the number of prompt and completion
+    tokens are recorded. Latency percentiles are computed over the most recent requests.
+    """
+    LATENCY_WINDOW = 1000
+
+    def __init__(self, latency_window=LATENCY_WINDOW):
+        """
+        Initialize the OpenAIMetrics instance.
+
+        :param latency_window: The number of most recent request latencies kept for the percentiles.
+        :type latency_window: int
+        """
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=latency_window)
+        self.requests = 0
+        self.failures = 0
+        self.retries = 0
+        self.in_flight = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def request_started(self):
+        """
+        Record that a request is waiting for OpenAI's API.
+        """
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self, latency, succeeded):
+        """
+        Record the end of a request attempt.
+
+        :param latency: The duration of the attempt in seconds.
+        :type latency: float
+        :param succeeded: Whether the attempt succeeded.
+        :type succeeded: bool
+        """
+        with self._lock:
+            self.in_flight -= 1
+            self.requests += 1
+            if not succeeded:
+                self.failures += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            self._latencies.append(latency)
+
+    def record_retry(self):
+        """
+        Record that a failed request attempt is retried.
+        """
+        with self._lock:
+            self.retries += 1
+
+    def record_usage(self, usage):
+        """
+        Record the tokens used by a completed request.
+
+        :param usage: The usage returned by OpenAI's API, or None if it was not returned.
+        :type usage: CompletionUsage or None
+        """
+        if usage is None:
+            return
+        with self._lock:
+            self.prompt_tokens += usage.prompt_tokens or 0
+            self.completion_tokens += usage.completion_tokens or 0
+
+    def snapshot(self):
+        """
+        Get the current values of the metrics.
+
+        :return: A dictionary with the request, failure, retry and token counts, the number of requests in flight and
+            the mean, median, 95th percentile and maximum latency in seconds.
+        :rtype: dict
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            return {
+                "requests": self.requests,
+                "failures": self.failures,
+                "retries": self.retries,
+                "in_flight": self.in_flight,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "latency_mean": self.total_latency / self.requests if self.requests else 0.0,
+                "latency_p50": OpenAIMetrics.__percentile(latencies, 0.5),
+                "latency_p95": OpenAIMetrics.__percentile(latencies, 0.95),
+                "latency_max": self.max_latency
+            }
+
+    @staticmethod
+    def __percentile(sorted_values, fraction):
+        """
+        Get a percentile of sorted values with the nearest-rank method.
+
+        :param sorted_values: The values in ascending order.
+        :type sorted_values: list of float
+        :param fraction: The percentile as a fraction between 0 and 1.
+        :type fraction: float
+        :return: The percentile, or 0.0 if there are no values.
+        :rtype: float
+        """
+        if not sorted_values:
+            return 0.0
+        return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
@@ -1,46 +1,111 @@
 import configparser
-from openai import OpenAI
+from openai import OpenAI, APIConnectionError, APIStatusError
+from .openai_metrics import OpenAIMetrics
+import httpx
+import threading
+import random
 import logging
+import time
+import os
 
 class OpenAIService:
     """
-    A service class to interact with OpenAI's API.
-    
+    A thread-safe singleton class to interact with OpenAI's API.
+
     This class handles loading the API key, initializing the OpenAI client, and making requests to the API.
+    Responses can be returned whole with `run` or streamed piece by piece with `stream`.
+
+    All services share one OpenAI client with a pooled, keep-alive HTTP connection and explicit timeouts. Requests
+    that fail with a connection error, a timeout or a 429 or 5xx status are retried with jittered exponential backoff,
+    at most `max_concurrent_requests` requests are sent at once, and the latency, retries and tokens of the requests
+    are recorded in `metrics`. The settings are read from the optional keys of the 'OpenAI' configuration section.
     """
+    MODEL = "gpt-4o-mini"
+    CONFIG_KEY = 'OpenAI'
+    RETRY_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+    BACKOFF_BASE = 0.5
+    BACKOFF_MAX = 20.0
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        """
+        Create a new instance of OpenAIService if it does not exist, ensuring thread safety.
+        """
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = super(OpenAIService, cls).__new__(cls)
+        return cls._instance
+
     def __init__(self, config_path='config.dev.ini'):
         """
-        Initialize the OpenAIService instance.
+        Initialize the OpenAIService instance, unless the shared instance has already been initialized.
 
         :param config_path: Path to the configuration file containing the OpenAI API key.
         :type config_path: str
         :raises ValueError: If the API key cannot be loaded from the configuration file.
         :raises ConnectionError: If the OpenAI client cannot be initialized.
         """
-        try:
-            self.api_key = self._load_api_key(config_path)
-        except (configparser.Error, KeyError) as e:
-            logging.error(f"Error loading API key from config file: {e}")
-            raise ValueError("Failed to load API key from configuration file.")
-        try:
-            self.client = OpenAI(api_key=self.api_key)
-        except Exception as e:
-            logging.error(f"Error initializing OpenAI client: {e}")
-            raise ConnectionError("Failed to initialize OpenAI client.")
+        if getattr(self, "_initialized", False):
+            return
+        with OpenAIService._lock:
+            if getattr(self, "_initialized", False):
+                return
+            try:
+                config = self._load_config(config_path)
+                self.api_key = config['api_key']
+                timeout = float(config.get('timeout', 60))
+                connect_timeout = float(config.get('connect_timeout', 5))
+                self.max_retries = int(config.get('max_retries', 4))
+                max_concurrent_requests = int(config.get('max_concurrent_requests', 8))
+                max_connections = int(config.get('max_connections', 20))
+                max_keepalive_connections = int(config.get('max_keepalive_connections', 10))
+                keepalive_expiry = float(config.get('keepalive_expiry', 30))
+            except (configparser.Error, KeyError, ValueError) as e:
+                logging.error(f"Error loading OpenAI settings from config file: {e}")
+                raise ValueError("Failed to load the OpenAI settings from the configuration file.")
+            try:
+                http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=max_connections,
+                        max_keepalive_connections=max_keepalive_connections,
+                        keepalive_expiry=keepalive_expiry
+                    ),
+                    timeout=httpx.Timeout(timeout, connect=connect_timeout)
+                )
+                # Retries are handled here, so that they are limited, counted and backed off with jitter
+                self.client = OpenAI(api_key=self.api_key, http_client=http_client, max_retries=0)
+            except Exception as e:
+                logging.error(f"Error initializing OpenAI client: {e}")
+                raise ConnectionError("Failed to initialize OpenAI client.")
+            self._limiter = threading.BoundedSemaphore(max_concurrent_requests)
+            self.metrics = OpenAIMetrics()
+            self._initialized = True
+
+    @classmethod
+    def reset_instance(cls):
+        """
+        Discard the singleton instance so that the next instantiation creates a new client.
 
-    def _load_api_key(self, config_path):
+        This is registered to run in forked child processes, which must not share the parent's HTTP connections.
         """
-        Load the OpenAI API key from the configuration file.
+        cls._lock = threading.Lock()
+        cls._instance = None
+
+    def _load_config(self, config_path):
+        """
+        Load the OpenAI settings from the configuration file.
 
         :param config_path: Path to the configuration file.
         :type config_path: str
-        :return: The OpenAI API key.
-        :rtype: str
-        :raises KeyError: If the 'OpenAI' section or 'api_key' key is missing in the configuration file.
+        :return: The 'OpenAI' section, containing the API key and optional client settings.
+        :rtype: configparser.SectionProxy
+        :raises KeyError: If the 'OpenAI' section is missing in the configuration file.
         """
         config = configparser.ConfigParser()
         config.read(config_path)
-        return config['OpenAI']['api_key']
+        return config[OpenAIService.CONFIG_KEY]
 
     def run(self, assistant_prompt, query):
         """
@@ -59,6 +124,56 @@ class OpenAIService:
         ]
         return self.__run_chat_model(messages)
 
+    def stream(self, assistant_prompt, query):
+        """
+        Run a chat model with the provided assistant prompt and user query, streaming the response.
+
+        :param assistant_prompt: The system prompt to guide the assistant's behavior.
+        :type assistant_prompt: str
+        :param query: The user's query or message.
+        :type query: str
+        :return: A generator of the pieces of the response content as they are received.
+        :rtype: Iterator[str]
+        :raises RuntimeError: If the API call fails.
+        """
+        messages = [
+            {"role": "system", "content": assistant_prompt},
+            {"role": "user", "content": query}
+        ]
+        return self.__stream_chat_model(messages)
+
+    def __stream_chat_model(self, messages):
+        """
+        Run the chat model with the provided messages and yield the response content as it is received.
+
+        Only the request that opens the stream is retried. The concurrency limit is held until the stream ends, except
+        while backing off before a retry.
+
+        :param messages: A list of message dictionaries containing roles and content.
+        :type messages: list
+        :return: A generator of the pieces of the response content.
+        :rtype: Iterator[str]
+        :raises RuntimeError: If the API call fails.
+        """
+        try:
+            response = self.__create_with_retries(
+                model=OpenAIService.MODEL, messages=messages, stream=True, stream_options={"include_usage": True}
+            )
+        except Exception as e:
+            logging.error(f"Error during OpenAI API call: {e}")
+            raise RuntimeError("Failed to get response from OpenAI API.")
+        try:
+            for chunk in response:
+                self.metrics.record_usage(chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            logging.error(f"Error while streaming the OpenAI API response: {e}")
+            raise RuntimeError("Failed to get response from OpenAI API.")
+        finally:
+            response.close()
+            self._limiter.release()
+
     def __run_chat_model(self, messages):
         """
         Run the chat model with the provided messages.
@@ -70,9 +185,69 @@ class OpenAIService:
         :raises RuntimeError: If the API call fails.
         """
         try:
-            response = self.client.chat.completions.create(model="gpt-4o-mini",
-            messages=messages)
+            response = self.__create_with_retries(model=OpenAIService.MODEL, messages=messages)
+            self._limiter.release()
+            self.metrics.record_usage(response.usage)
             return response.choices[0].message.content
         except Exception as e:
             logging.error(f"Error during OpenAI API call: {e}")
             raise RuntimeError("Failed to get response from OpenAI API.")
+
+    def __create_with_retries(self, **kwargs):
+        """
+        Create a chat completion, retrying connection errors, timeouts and retryable status codes.
+
+        A slot of the concurrency limit is acquired for each attempt and released while backing off, so that waiting
+        requests are not blocked by a request that is waiting to retry. The slot of the successful attempt is still held
+        when the response is returned, and the caller must release it.
+
+        :param kwargs: The arguments of the chat completion.
+        :return: The chat completion, or the stream of chat completion chunks.
+        :rtype: ChatCompletion or Stream
+        :raises APIError: If the request fails with a non-retryable error or the retries are exhausted.
+        """
+        for attempt in range(self.max_retries + 1):
+            self._limiter.acquire()
+            self.metrics.request_started()
+            started = time.perf_counter()
+            try:
+                response = self.client.chat.completions.create(**kwargs)
+                self.metrics.request_finished(time.perf_counter() - started, True)
+                return response
+            except Exception as e:
+                self._limiter.release()
+                self.metrics.request_finished(time.perf_counter() - started, False)
+                retryable = isinstance(e, APIConnectionError) or (
+                    isinstance(e, APIStatusError) and e.status_code in OpenAIService.RETRY_STATUS_CODES
+                )
+                if not retryable or attempt == self.max_retries:
+                    raise
+                delay = self.__backoff_delay(attempt, e)
+                logging.warning(f"OpenAI API call failed ({e}), retrying in {delay:.1f} seconds")
+                self.metrics.record_retry()
+                time.sleep(delay)
+
+    def __backoff_delay(self, attempt, error):
+        """
+        Get the delay before retrying a failed request.
+
+        The delay requested by a 'Retry-After' header is used if there is one, clamped between 0 and `BACKOFF_MAX`,
+        otherwise the delay is chosen at random up to an exponentially growing limit, so that clients that failed
+        together do not retry together.
+
+        :param attempt: The number of the failed attempt, starting from 0.
+        :type attempt: int
+        :param error: The error of the failed attempt.
+        :type error: APIError
+        :return: The delay in seconds.
+        :rtype: float
+        """
+        retry_after = error.response.headers.get('retry-after') if isinstance(error, APIStatusError) else None
+        try:
+            return max(0.0, min(float(retry_after), OpenAIService.BACKOFF_MAX))
+        except (TypeError, ValueError):
+            return random.uniform(0, min(OpenAIService.BACKOFF_MAX, OpenAIService.BACKOFF_BASE * 2 ** attempt))
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=OpenAIService.reset_instance)
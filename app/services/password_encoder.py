@@ -5,13 +5,19 @@ class PasswordEncoder:
     """
     A utility class for encoding and verifying passwords using bcrypt.
 
+    Hashed passwords are stored in the native bcrypt format ('$2b$<rounds>$...'). Hashes stored by earlier versions
+    are additionally Base64-encoded; they are still verified and can be converted with `to_native`.
+
     Attributes:
         UTF8_ENCODING (str): The encoding format used for strings (UTF-8).
+        SALT_ROUNDS (int): The default number of salt rounds (the bcrypt cost).
     """
     UTF8_ENCODING = 'utf-8'
+    SALT_ROUNDS = 12
+    NATIVE_PREFIX = '$2'
 
     @staticmethod
-    def encode_password(password, salt_rounds=12):
+    def encode_password(password, salt_rounds=SALT_ROUNDS):
         """
         Encode a password using bcrypt with a specified number of salt rounds.
 
@@ -19,34 +25,79 @@ class PasswordEncoder:
         :type password: str
         :param salt_rounds: The number of rounds to use for generating the salt (default is 12).
         :type salt_rounds: int
-        :return: The Base64-encoded hashed password.
+        :return: The hashed password in the native bcrypt format.
         :rtype: str
         :raises ValueError: If the password is not a non-empty string.
         """
         if not isinstance(password, str) or not password:
             raise ValueError("Password must be a non-empty string.")
-        
+
         salt = bcrypt.gensalt(rounds=salt_rounds)
         hashed_password = bcrypt.hashpw(password.encode(PasswordEncoder.UTF8_ENCODING), salt)
-        hashed_password_str = base64.b64encode(hashed_password).decode(PasswordEncoder.UTF8_ENCODING)
-        return hashed_password_str
+        return hashed_password.decode(PasswordEncoder.UTF8_ENCODING)
 
     @staticmethod
     def check_password(password, hashed_password_str):
         """
-        Verify a password against a given Base64-encoded hashed password.
+        Verify a password against a given hashed password.
 
         :param password: The password to be verified.
         :type password: str
-        :param hashed_password_str: The Base64-encoded hashed password to verify against.
+        :param hashed_password_str: The hashed password to verify against, in the native bcrypt format or Base64-encoded.
         :type hashed_password_str: str
         :return: True if the password matches the hashed password, False otherwise.
         :rtype: bool
-        :raises ValueError: If the hashed password is not a valid Base64-encoded string.
+        :raises ValueError: If the hashed password is neither a native nor a valid Base64-encoded bcrypt hash.
         """
-        try:
-            hashed_password = base64.b64decode(hashed_password_str.encode(PasswordEncoder.UTF8_ENCODING))
-        except base64.binascii.Error as e:
-            raise ValueError("Invalid hashed password format. Must be a valid Base64-encoded string.") from e
-        
+        hashed_password = PasswordEncoder.to_native(hashed_password_str).encode(PasswordEncoder.UTF8_ENCODING)
         return bcrypt.checkpw(password.encode(PasswordEncoder.UTF8_ENCODING), hashed_password)
+
+    @staticmethod
+    def is_native(hashed_password_str):
+        """
+        Check whether a hashed password is stored in the native bcrypt format.
+
+        :param hashed_password_str: The hashed password.
+        :type hashed_password_str: str
+        :return: True if the hashed password is in the native format, False if it is Base64-encoded.
+        :rtype: bool
+        """
+        return hashed_password_str.startswith(PasswordEncoder.NATIVE_PREFIX)
+
+    @staticmethod
+    def to_native(hashed_password_str):
+        """
+        Convert a hashed password to the native bcrypt format.
+
+        :param hashed_password_str: The hashed password, in the native bcrypt format or Base64-encoded.
+        :type hashed_password_str: str
+        :return: The hashed password in the native bcrypt format.
+        :rtype: str
+        :raises ValueError: If the hashed password is neither a native nor a valid Base64-encoded bcrypt hash.
+        """
+        if PasswordEncoder.is_native(hashed_password_str):
+            return hashed_password_str
+        try:
+            hashed_password = base64.b64decode(hashed_password_str.encode(PasswordEncoder.UTF8_ENCODING), validate=True)
+            native_password_str = hashed_password.decode(PasswordEncoder.UTF8_ENCODING)
+        except (base64.binascii.Error, UnicodeDecodeError) as e:
+            raise ValueError("Invalid hashed password format. Must be a bcrypt hash or a Base64-encoded bcrypt hash.") from e
+        if not PasswordEncoder.is_native(native_password_str):
+            raise ValueError("Invalid hashed password format. Must be a bcrypt hash or a Base64-encoded bcrypt hash.")
+        return native_password_str
+
+    @staticmethod
+    def get_salt_rounds(hashed_password_str):
+        """
+        Get the number of salt rounds a hashed password was encoded with.
+
+        :param hashed_password_str: The hashed password, in the native bcrypt format or Base64-encoded.
+        :type hashed_password_str: str
+        :return: The number of salt rounds.
+        :rtype: int
+        :raises ValueError: If the hashed password is neither a native nor a valid Base64-encoded bcrypt hash.
+        """
+        try:
+            return int(PasswordEncoder.to_native(hashed_password_str).split('$')[2])
+        except IndexError as e:
+            raise ValueError("Invalid hashed password format. Must be a bcrypt hash or a Base64-encoded bcrypt hash.") from e
@@ -0,0 +1,285 @@
+from .password_encoder import PasswordEncoder
+from .token_bucket_limiter import TokenBucketLimiter
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import configparser
+import threading
+import logging
+
+class HashingUnavailableError(RuntimeError):
+    """
+    Raised when a password cannot be hashed or verified now and the request should be retried later.
+
+    Attributes:
+        retry_after (int): The number of seconds after which the request may be retried.
+    """
+
+    def __init__(self, message, retry_after):
+        """
+        Initialize the HashingUnavailableError instance.
+
+        :param message: The error message.
+        :type message: str
+        :param retry_after: The number of seconds after which the request may be retried.
+        :type retry_after: int
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class HashingRateLimitError(HashingUnavailableError):
+    """
+    Raised when a caller has triggered more password hashing than its rate limit allows.
+    """
+
+class HashingOverloadError(HashingUnavailableError):
+    """
+    Raised when the password hashing queue is full.
+    """
+
+class PasswordHashingService:
+    """
+    A thread-safe singleton class that hashes and verifies passwords with bcrypt in a pool of worker processes.
+
+    bcrypt is deliberately slow, so hashing on the request threads would block them and every cheap request queued
+    behind them. The work is sent to a process pool instead, and at most `workers + queue_size` hashing tasks are
+    accepted at once; further tasks are rejected with `HashingOverloadError`. The hashing each caller can trigger is
+    capped by token buckets per IP address and per username, which reject excess work with `HashingRateLimitError`.
+
+    The settings are read from the optional keys of the 'Passwords' configuration section: salt_rounds,
+    hashing_workers, hashing_queue_size and rehash_on_login. With rehash_on_login, a password whose hash was encoded
+    with a different number of salt rounds is rehashed in the background after a successful login.
+    """
+    CONFIG_KEY = 'Passwords'
+    WORKERS = 2
+    QUEUE_SIZE = 16
+    TIMEOUT = 10
+    OVERLOAD_RETRY_AFTER = 1
+    IP_BUCKET_CAPACITY = 20
+    IP_REFILL_RATE = 20 / 60
+    USERNAME_BUCKET_CAPACITY = 5
+    USERNAME_REFILL_RATE = 5 / 60
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        """
+        Create a new instance of PasswordHashingService if it does not exist, ensuring thread safety.
+        """
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = super(PasswordHashingService, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self, config_path='config.dev.ini'):
+        """
+        Initialize the PasswordHashingService instance, unless the shared instance has already been initialized.
+
+        The worker processes are started when the first password is hashed.
+
+        :param config_path: Path to the configuration file.
+        :type config_path: str
+        :raises ValueError: If a setting in the configuration file is invalid.
+        """
+        if getattr(self, "_initialized", False):
+            return
+        with PasswordHashingService._lock:
+            if getattr(self, "_initialized", False):
+                return
+            config = configparser.ConfigParser()
+            config.read(config_path)
+            has_settings = config.has_section(PasswordHashingService.CONFIG_KEY)
+            settings = config[PasswordHashingService.CONFIG_KEY] if has_settings else {}
+            try:
+                self.salt_rounds = int(settings.get('salt_rounds', PasswordEncoder.SALT_ROUNDS))
+                self.workers = int(settings.get('hashing_workers', PasswordHashingService.WORKERS))
+                queue_size = int(settings.get('hashing_queue_size', PasswordHashingService.QUEUE_SIZE))
+                self.rehash_on_login = str(settings.get('rehash_on_login', 'false')).lower() in ('1', 'true', 'yes', 'on')
+            except ValueError as e:
+                logging.error(f"Error loading password settings from config file: {e}")
+                raise ValueError("Failed to load the password settings from the configuration file.")
+            self._slots = threading.BoundedSemaphore(self.workers + queue_size)
+            self._executor = None
+            self._executor_lock = threading.Lock()
+            self.ip_limiter = TokenBucketLimiter(
+                PasswordHashingService.IP_BUCKET_CAPACITY, PasswordHashingService.IP_REFILL_RATE
+            )
+            self.username_limiter = TokenBucketLimiter(
+                PasswordHashingService.USERNAME_BUCKET_CAPACITY, PasswordHashingService.USERNAME_REFILL_RATE
+            )
+            self._initialized = True
+
+    def limit(self, ip=None, username=None):
+        """
+        Take a token from the buckets of the caller's IP address and username.
+
+        A token is only taken if both buckets allow the attempt: the username bucket is not used when the IP address
+        bucket is empty, and the token of the IP address is given back when the username bucket is empty.
+
+        :param ip: The IP address of the caller, or None.
+        :type ip: str, optional
+        :param username: The username the caller is hashing for, or None.
+        :type username: str, optional
+        :raises HashingRateLimitError: If a bucket of the caller is empty.
+        """
+        retry_after = self.ip_limiter.try_acquire(ip) if ip else 0
+        if not retry_after and username:
+            retry_after = self.username_limiter.try_acquire(username.lower())
+            if retry_after and ip:
+                self.ip_limiter.refund(ip)
+        if retry_after:
+            raise HashingRateLimitError("Too many password attempts, please try again later.", retry_after)
+
+    def encode_password(self, password, ip=None):
+        """
+        Encode a password with the configured number of salt rounds in a worker process.
+
+        :param password: The password to be encoded.
+        :type password: str
+        :param ip: The IP address of the caller, whose rate limit is applied if given.
+        :type ip: str, optional
+        :return: The hashed password in the native bcrypt format.
+        :rtype: str
+        :raises ValueError: If the password is not a non-empty string.
+        :raises HashingUnavailableError: If the caller is rate limited or the hashing queue is full.
+        """
+        self.limit(ip=ip)
+        return self.__run(PasswordEncoder.encode_password, password, self.salt_rounds)
+
+    def check_password(self, password, hashed_password_str, ip=None, username=None):
+        """
+        Verify a password against a hashed password in a worker process.
+
+        :param password: The password to be verified.
+        :type password: str
+        :param hashed_password_str: The hashed password to verify against, in the native bcrypt format or Base64-encoded.
+        :type hashed_password_str: str
+        :param ip: The IP address of the caller, whose rate limit is applied if given.
+        :type ip: str, optional
+        :param username: The username being verified, whose rate limit is applied if given.
+        :type username: str, optional
+        :return: True if the password matches the hashed password, False otherwise.
+        :rtype: bool
+        :raises ValueError: If the hashed password is neither a native nor a valid Base64-encoded bcrypt hash.
+        :raises HashingUnavailableError: If the caller is rate limited or the hashing queue is full.
+        """
+        self.limit(ip=ip, username=username)
+        return self.__run(PasswordEncoder.check_password, password, hashed_password_str)
+
+    def needs_rehash(self, hashed_password_str):
+        """
+        Check whether a verified password should be rehashed because the configured number of salt rounds changed.
+
+        :param hashed_password_str: The hashed password.
+        :type hashed_password_str: str
+        :return: True if rehashing on login is enabled and the hash uses a different number of salt rounds.
+        :rtype: bool
+        """
+        if not self.rehash_on_login:
+            return False
+        try:
+            return PasswordEncoder.get_salt_rounds(hashed_password_str) != self.salt_rounds
+        except ValueError:
+            return False
+
+    def rehash_in_background(self, password, on_rehashed):
+        """
+        Encode a verified password again with the configured number of salt rounds, without waiting for the result.
+
+        The rehash is skipped if the hashing queue is full, it will be attempted again on the next login.
+
+        :param password: The verified password.
+        :type password: str
+        :param on_rehashed: A callable that receives the new hashed password, e.g. to store it.
+        :type on_rehashed: callable
+        """
+        def store(future):
+            try:
+                on_rehashed(future.result())
+            except Exception as e:
+                logging.error(f"Failed to rehash a password: {e}")
+
+        try:
+            self.__submit(PasswordEncoder.encode_password, password, self.salt_rounds).add_done_callback(store)
+        except HashingOverloadError:
+            logging.info("Skipped rehashing a password because the hashing queue is full")
+
+    def __run(self, function, *args):
+        """
+        Run a hashing function in a worker process and wait for its result.
+
+        :param function: The hashing function.
+        :type function: callable
+        :return: The result of the function.
+        :raises HashingOverloadError: If the hashing queue is full or the result does not arrive in time.
+        """
+        future = self.__submit(function, *args)
+        try:
+            return future.result(timeout=PasswordHashingService.TIMEOUT)
+        except FutureTimeoutError:
+            raise HashingOverloadError("Password hashing timed out.", PasswordHashingService.OVERLOAD_RETRY_AFTER)
+        except BrokenProcessPool as e:
+            self.__reset_executor(e)
+            raise HashingOverloadError(
+                "Password hashing is restarting, please try again later.", PasswordHashingService.OVERLOAD_RETRY_AFTER
+            )
+
+    def __submit(self, function, *args):
+        """
+        Submit a hashing function to the worker processes if the hashing queue is not full.
+
+        :param function: The hashing function.
+        :type function: callable
+        :return: The future of the result.
+        :rtype: Future
+        :raises HashingOverloadError: If the hashing queue is full.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise HashingOverloadError(
+                "Too many password requests, please try again later.", PasswordHashingService.OVERLOAD_RETRY_AFTER
+            )
+        try:
+            future = self.__get_executor().submit(function, *args)
+        except BrokenProcessPool as e:
+            self.__reset_executor(e)
+            self._slots.release()
+            raise HashingOverloadError(
+                "Password hashing is restarting, please try again later.", PasswordHashingService.OVERLOAD_RETRY_AFTER
+            )
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def __reset_executor(self, error):
+        """
+        Discard a broken process pool, so that a new one is started for the next task.
+
+        :param error: The error raised by the broken pool.
+        :type error: BrokenProcessPool
+        """
+        logging.error(f"The password hashing pool is broken, restarting it: {error}")
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def __get_executor(self):
+        """
+        Get the process pool, starting it if it is not running.
+
+        The processes are spawned rather than forked, because the application process runs other threads. Spawned
+        processes import the main module, so scripts that hash passwords must guard their code with
+        `if __name__ == '__main__'`.
+
+        :return: The process pool.
+        :rtype: ProcessPoolExecutor
+        """
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
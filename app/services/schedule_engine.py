@@ -0,0 +1,77 @@
+from model.dosage_rule_model import DosageRule
+from model.timesheet_model import Recurrence
+from datetime import date, datetime, timedelta
+from typing import List
+
+class ScheduleEngine:
+    """
+    A deterministic engine that expands dosage rules into the intake dates of a timesheet.
+
+    The engine does not call OpenAI, so the dates of a medication can be built for any period without generating them
+    token by token.
+    """
+    DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+    @staticmethod
+    def expand(rule: DosageRule, start_date, end_date) -> List[str]:
+        """
+        Build the intake dates of a medication for a period.
+
+        The course starts on the start date and ends on the end date, or earlier if the rule limits the course length.
+
+        :param rule: The dosage rule of the medication.
+        :type rule: DosageRule
+        :param start_date: The first day of the period, as a date or a 'YYYY-MM-DD' string.
+        :type start_date: date or str
+        :param end_date: The last day of the period, as a date or a 'YYYY-MM-DD' string.
+        :type end_date: date or str
+        :return: The intake dates in '%Y-%m-%dT%H:%M:%S' format, in chronological order.
+        :rtype: list of str
+        :raises ValueError: If a date string is not in 'YYYY-MM-DD' format.
+        """
+        return ScheduleEngine.recurrence(rule, start_date, end_date).expand()
+
+    @staticmethod
+    def recurrence(rule: DosageRule, start_date, end_date) -> Recurrence:
+        """
+        Build the compact recurrence of a medication for a period.
+
+        The course starts on the start date and ends on the end date, or earlier if the rule limits the course length.
+
+        :param rule: The dosage rule of the medication.
+        :type rule: DosageRule
+        :param start_date: The first day of the period, as a date or a 'YYYY-MM-DD' string.
+        :type start_date: date or str
+        :param end_date: The last day of the period, as a date or a 'YYYY-MM-DD' string.
+        :type end_date: date or str
+        :return: The recurrence of the intakes.
+        :rtype: Recurrence
+        :raises ValueError: If a date string is not in 'YYYY-MM-DD' format.
+        """
+        start_date = ScheduleEngine.to_date(start_date)
+        end_date = ScheduleEngine.to_date(end_date)
+        if rule.max_course_days is not None:
+            end_date = min(end_date, start_date + timedelta(days=rule.max_course_days - 1))
+        return Recurrence(
+            start_date=start_date.isoformat(),
+            end_date=end_date.isoformat(),
+            times_of_day=list(rule.times_of_day),
+            interval_days=rule.interval_days
+        )
+
+    @staticmethod
+    def to_date(value) -> date:
+        """
+        Convert a date, datetime or date string to a date.
+
+        :param value: The value to convert, as a date, a datetime or a string starting with 'YYYY-MM-DD'.
+        :type value: date or datetime or str
+        :return: The date.
+        :rtype: date
+        :raises ValueError: If a string is not in 'YYYY-MM-DD' format.
+        """
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, date):
+            return value
+        return datetime.strptime(value[:10], '%Y-%m-%d').date()
@@ -0,0 +1,145 @@
+from db.timesheet_jobs import TimesheetJobs
+from model.timesheet_job_model import TimesheetJobModel
+import threading
+import hashlib
+import logging
+import json
+
+class TimesheetJobService:
+    """
+    A service class that runs slow timesheet generation work in background worker threads.
+
+    Jobs are persisted in the timesheet_jobs collection, so queued jobs survive restarts and can be picked up by any
+    worker process. Job handlers are registered per job kind and are called with the claimed job. Workers only claim
+    jobs of the kinds that have a registered handler. The application starts them at startup, so that pending jobs and
+    jobs whose lease expired are resumed after a restart; otherwise they are started when the first job is queued.
+    """
+    WORKER_COUNT = 2
+    POLL_INTERVAL = 2.0
+    LEASE_SECONDS = 300
+    MAX_ATTEMPTS = 3
+
+    def __init__(self):
+        """
+        Initialize the TimesheetJobService instance.
+
+        The worker threads are not started until `start` is called or the first job is queued.
+        """
+        self._handlers = {}
+        self._workers = []
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def register_handler(self, kind, handler):
+        """
+        Register the handler that runs jobs of the given kind.
+
+        :param kind: The kind of job the handler runs.
+        :type kind: str
+        :param handler: A callable that receives the claimed job and returns the job result as a dictionary.
+        :type handler: callable
+        """
+        self._handlers[kind] = handler
+
+    def start(self, worker_count=WORKER_COUNT):
+        """
+        Start the worker threads if they are not running yet.
+
+        :param worker_count: The number of worker threads to start.
+        :type worker_count: int
+        """
+        with self._lock:
+            if self._workers:
+                return
+            self._stopped.clear()
+            for index in range(worker_count):
+                worker = threading.Thread(target=self.__run_worker, name=f"timesheet-job-worker-{index}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+        logging.info(f"Started {worker_count} timesheet job workers")
+
+    def stop(self):
+        """
+        Stop the worker threads after they finish their current job.
+        """
+        with self._lock:
+            self._stopped.set()
+            self._wakeup.set()
+            for worker in self._workers:
+                worker.join()
+            self._workers = []
+
+    def enqueue(self, user_id, kind, payload):
+        """
+        Queue a job for the given user, reusing an identical pending job if there is one.
+
+        :param user_id: The ID of the user the job runs for.
+        :type user_id: str
+        :param kind: The kind of the job.
+        :type kind: str
+        :param payload: The JSON-serializable input data of the job.
+        :type payload: dict
+        :return: The queued job.
+        :rtype: TimesheetJobModel
+        :raises ValueError: If there is no handler registered for the job kind.
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for timesheet job kind '{kind}'.")
+        dedup_key = hashlib.sha256(
+            json.dumps({'user_id': user_id, 'kind': kind, 'payload': payload}, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+        job, created = TimesheetJobs.enqueue(
+            TimesheetJobModel(user_id=user_id, kind=kind, payload=payload, dedup_key=dedup_key)
+        )
+        self.start()
+        if created:
+            self._wakeup.set()
+        return job
+
+    def get_job(self, id):
+        """
+        Get a job by its ID.
+
+        :param id: The ID of the job.
+        :type id: str
+        :return: The job model instance if found, otherwise None.
+        :rtype: TimesheetJobModel or None
+        :raises ValueError: If the provided ID is not a valid ObjectId format.
+        """
+        return TimesheetJobs.find(id)
+
+    def __run_worker(self):
+        """
+        Claim and run jobs until the service is stopped, sleeping while the queue is empty.
+        """
+        while not self._stopped.is_set():
+            try:
+                job = TimesheetJobs.claim_next(list(self._handlers), TimesheetJobService.LEASE_SECONDS)
+            except Exception as e:
+                logging.error(f"Failed to claim a timesheet job: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(TimesheetJobService.POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+            self.__run_job(job)
+
+    def __run_job(self, job: TimesheetJobModel):
+        """
+        Run a claimed job and store its result or error.
+
+        :param job: The claimed job.
+        :type job: TimesheetJobModel
+        """
+        if job.attempts > TimesheetJobService.MAX_ATTEMPTS:
+            TimesheetJobs.fail(
+                job.get_id(), job.attempts, f"Job was abandoned after {TimesheetJobService.MAX_ATTEMPTS} attempts."
+            )
+            return
+        try:
+            result = self._handlers[job.kind](job)
+            TimesheetJobs.complete(job.get_id(), job.attempts, result)
+        except Exception as e:
+            logging.error(f"Timesheet job {job.get_id()} failed: {e}")
+            TimesheetJobs.fail(job.get_id(), job.attempts, str(e))
@@ -0,0 +1,117 @@
+from db.lru_cache import LRUCache
+from db.timesheet_responses import TimesheetResponses
+import threading
+import hashlib
+import logging
+import json
+
+class TimesheetResponseCache:
+    """
+    A two-level, content-addressed cache of parsed timesheets generated by OpenAI.
+
+    Timesheets are looked up in an in-process LRU cache first and in the timesheet_responses collection second. The
+    cache key is a hash of the prompt version, the model name, the canonicalized medication data and the date range,
+    so identical generation requests share one cached timesheet regardless of medication order.
+
+    Cached timesheets are shared between callers and must not be modified. The cache counters are served by
+    `GET /api/metrics/timesheet-cache`.
+    """
+    MEMORY_MAX_SIZE = 256
+    MEMORY_TTL = 3600
+
+    def __init__(self, memory_max_size=MEMORY_MAX_SIZE, memory_ttl=MEMORY_TTL):
+        """
+        Initialize the TimesheetResponseCache instance.
+
+        :param memory_max_size: The maximum number of timesheets kept in memory.
+        :type memory_max_size: int
+        :param memory_ttl: The number of seconds after which a timesheet kept in memory expires.
+        :type memory_ttl: float
+        """
+        self._memory = LRUCache(memory_max_size, memory_ttl)
+        self.stored_hits = 0
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(prompt_version, model, medications, start_date_str, end_date_str):
+        """
+        Build the cache key for a timesheet generation request.
+
+        :param prompt_version: The version of the prompt used to generate the timesheet.
+        :type prompt_version: int or str
+        :param model: The name of the chat model used to generate the timesheet.
+        :type model: str
+        :param medications: The medication data sent to the model.
+        :type medications: list of dict
+        :param start_date_str: The start date of the timesheet.
+        :type start_date_str: str
+        :param end_date_str: The end date of the timesheet.
+        :type end_date_str: str
+        :return: A SHA-256 hex digest identifying the request.
+        :rtype: str
+        """
+        canonical_medications = sorted(
+            ({key: value.strip() if isinstance(value, str) else value for key, value in med.items()} for med in medications),
+            key=lambda med: json.dumps(med, sort_keys=True)
+        )
+        canonical_request = json.dumps({
+            'prompt_version': prompt_version,
+            'model': model,
+            'medications': canonical_medications,
+            'start_date': start_date_str,
+            'end_date': end_date_str
+        }, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Get a cached timesheet.
+
+        :param key: The cache key built with `make_key`.
+        :type key: str
+        :return: The cached timesheet, or None if it is not cached.
+        :rtype: dict or None
+        """
+        timesheet = self._memory.get(key)
+        if timesheet is not None:
+            return timesheet
+        try:
+            timesheet = TimesheetResponses.find(key)
+        except Exception as e:
+            logging.error(f"Failed to read the cached timesheet response: {e}")
+            return None
+        if timesheet is not None:
+            with self._stats_lock:
+                self.stored_hits += 1
+            self._memory.put(key, timesheet)
+        return timesheet
+
+    def put(self, key, timesheet):
+        """
+        Cache a timesheet in memory and in the database.
+
+        :param key: The cache key built with `make_key`.
+        :type key: str
+        :param timesheet: The parsed timesheet.
+        :type timesheet: dict
+        """
+        self._memory.put(key, timesheet)
+        try:
+            TimesheetResponses.add(key, timesheet)
+        except Exception as e:
+            logging.error(f"Failed to store the timesheet response in the cache: {e}")
+
+    def stats(self):
+        """
+        Get the cache counters.
+
+        :return: The in-memory cache counters and the number of hits served from the database.
+        :rtype: dict
+        """
+        stats = self._memory.stats()
+        with self._stats_lock:
+            stats['stored_hits'] = self.stored_hits
+        return stats
+
+
+timesheet_response_cache = TimesheetResponseCache()
@@ -1,28 +1,110 @@
 from .openai_service import OpenAIService
+from .timesheet_response_cache import timesheet_response_cache, TimesheetResponseCache
+from .schedule_engine import ScheduleEngine
+from .json_stream_parser import JSONArrayStreamParser
+from model.dosage_rule_model import DosageRule
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
 import json
 import requests.exceptions
 import logging
 
+# Bounds the number of concurrent OpenAI requests of all timesheet generations in the process
+MAX_CONCURRENT_REQUESTS = 4
+_request_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS, thread_name_prefix="timesheet-openai")
+
 class TimesheetService:
     """
     A service class for building a timesheet based on medication information using OpenAI's API.
     
     This service takes medication data along with a start and end date to generate a schedule (timesheet) for when the medications should be taken.
+    Generated timesheets are cached by a content hash of the input, so identical requests are not sent to OpenAI again.
+
+    When every medication has a structured dosage rule, the dates are built locally by the schedule engine and OpenAI
+    is only asked for the advice text.
+
+    Otherwise, by default, the dates of each medication without a dosage rule are generated separately for each
+    calendar month of the timesheet, and the advice for all medications is generated by a final, separate request. The
+    requests are sent concurrently, so the generation takes about as long as the slowest request instead of one
+    request whose output grows with the number of medications and days.
     """
-    def __init__(self):
+    # Increment when a prompt changes so that responses generated with the old prompt are not reused
+    PROMPT_VERSION = 1
+    TIMESHEET_PROMPT = (
+        "You are an assistant that will receive a list of medications, you should use the medication information to build a timesheet for how a user should take the medications."
+        "The information will contain start and end dates for the period during which the medications should be taken and a list of medications with information for dosage, contents, side effects, objective."
+        "For each create a timesheet based on the dosage information for the medication - do not exceed the start and end date provided, if in the medication information there is a period that should not be exceeded- do not exceed this one as well, "
+        "if there is a specific schema for taking the medication buld the schedule based on it and do not exceed the days even if the start and end date for the timesheet have wider range. "
+        "Consider the person taking the medication as an adult less than 65 years old"
+        "Keep in mind that most people are awake from 08:00 until about 22:00 and make the schedule accordingly unless the medication should be taken during sleep hours or at exact time intervals."
+        "Pay special attention to the dosage for each medication, at what time it should be taken, should it be taken without or with food, should it be taken with fluids or not."
+        "Pay attention to how to combine those medications and add any relevant information to the advise property for each medication where needed."
+        "Return the timesheet with the following fields as json: "
+        "The top level field should me called 'medications' and should contain the same medications as the provided for each of them the following fields should be present:"
+        "id, name, dates, dosage, advise."
+        "Each of those fields should be free text."
+        "For each medication the returned object should contain only those five properties."
+        "The id - should contain the same id as provided in the information and should match the medication."
+        "The name - should contain the same name as provided in the information and should match the medication."
+        "The dates field should be a list of dates with times when the medication should be taken in the provided period. The format should always be '%Y-%m-%dT%H:%M:%S'. Do not skip dates and times even if the period is long"
+        "The dosage should be free text with information on how and how many dosages should be taken from this medication."
+        "The advise should be free text with information for the medication in case there are some specifics when taking it."
+        "The returned value should be a valid json format with no new lines or any text before or after the json output.\n"
+    )
+    ADVICE_PROMPT_VERSION = 1
+    CHUNK_PROMPT_VERSION = 1
+    CHUNK_PROMPT = (
+        "You are an assistant that will receive a medication with information for dosage schedule and objective, you should build the dates when a user should take the medication."
+        "The information will contain the start and end dates of the whole period during which the medication is taken, timesheet_start_date and timesheet_end_date, "
+        "and the start and end dates of the part of the period you should return the dates for, start_date and end_date."
+        "Build the schedule for the whole period and return only the dates between start_date and end_date - if in the medication information there is a period that should not be exceeded, count it from timesheet_start_date and do not exceed it, "
+        "if there is a specific schema for taking the medication build the schedule based on it and do not exceed the days even if the period has a wider range. "
+        "Consider the person taking the medication as an adult less than 65 years old."
+        "Keep in mind that most people are awake from 08:00 until about 22:00 and make the schedule accordingly unless the medication should be taken during sleep hours or at exact time intervals."
+        "Return the schedule with the following fields as json: "
+        "The top level field should be called 'medications' and should contain the provided medication with the following fields: id, dates, dosage."
+        "The id - should contain the same id as provided in the information."
+        "The dates field should be a list of dates with times when the medication should be taken between start_date and end_date. The format should always be '%Y-%m-%dT%H:%M:%S'. Do not skip dates and times."
+        "The dosage should be free text with information on how and how many dosages should be taken from this medication."
+        "The returned value should be a valid json format with no new lines or any text before or after the json output.\n"
+    )
+    ADVICE_PROMPT = (
+        "You are an assistant that will receive a list of medications a user takes together, with information for dosage schedule, objective and a structured dosage rule."
+        "The dosage rule contains the dosage per intake, the times of day of the intakes, the interval in days between the days the medication is taken, whether it is taken 'with' or 'without' food or regardless of food ('any') and the maximum course length in days."
+        "The dates when the medications are taken are already scheduled according to the dosage rules, do not return them."
+        "Consider the person taking the medication as an adult less than 65 years old."
+        "For each medication write advice on how it should be taken - should it be taken without or with food, should it be taken with fluids or not, what to do in case of side effects."
+        "Pay attention to how to combine those medications and add any relevant information to the advise property for each medication where needed."
+        "Return the advice with the following fields as json: "
+        "The top level field should be called 'medications' and should contain the same medications as the provided, for each of them the following fields should be present: id, advise."
+        "The id - should contain the same id as provided in the information and should match the medication."
+        "The advise should be free text with information for the medication in case there are some specifics when taking it."
+        "The returned value should be a valid json format with no new lines or any text before or after the json output.\n"
+    )
+
+    def __init__(self, fan_out=True):
         """
         Initialize the TimesheetService instance.
 
         This method creates an instance of OpenAIService to be used for generating timesheets.
+
+        :param fan_out: Whether timesheets of medications without dosage rules are generated with concurrent requests
+            per medication and month instead of one request for all medications.
+        :type fan_out: bool
         """
         # Instantiate OpenAIService once to avoid creating multiple instances
         self.openai_service = OpenAIService()
+        self.fan_out = fan_out
         
     def build_timesheet(self, medications, start_date_str, end_date_str):
         """
         Build a timesheet for taking medications within a specified time frame.
 
         This method uses OpenAI's API to generate a timesheet for a list of medications, considering dosage, timing, and any specific requirements.
+        If every medication has a 'dosage_rule', the dates are built by the schedule engine and only the advice is generated by OpenAI.
+        Otherwise, unless `fan_out` is disabled, the dates are generated by concurrent requests per medication and month.
+        If a timesheet was already generated for the same medications and date range it is returned from the cache.
+        The returned timesheet may be shared with other callers and must not be modified.
 
         :param medications: A list of medications with relevant information (e.g., dosage, contents, side effects, objective).
         :type medications: list
@@ -36,28 +118,12 @@ class TimesheetService:
         :raises ConnectionError: If a network error occurs while contacting OpenAIService.
         :raises IOError: For any other errors that occur while processing the request.
         """
+        if medications and all(med.get("dosage_rule") for med in medications):
+            return self.__build_timesheet_from_rules(medications, start_date_str, end_date_str)
+        if self.fan_out:
+            return self.__build_timesheet_in_chunks(medications, start_date_str, end_date_str)
         
-        prompt = (
-            "You are an assistant that will receive a list of medications, you should use the medication information to build a timesheet for how a user should take the medications."
-            "The information will contain start and end dates for the period during which the medications should be taken and a list of medications with information for dosage, contents, side effects, objective."
-            "For each create a timesheet based on the dosage information for the medication - do not exceed the start and end date provided, if in the medication information there is a period that should not be exceeded- do not exceed this one as well, "
-            "if there is a specific schema for taking the medication buld the schedule based on it and do not exceed the days even if the start and end date for the timesheet have wider range. "
-            "Consider the person taking the medication as an adult less than 65 years old"
-            "Keep in mind that most people are awake from 08:00 until about 22:00 and make the schedule accordingly unless the medication should be taken during sleep hours or at exact time intervals."
-            "Pay special attention to the dosage for each medication, at what time it should be taken, should it be taken without or with food, should it be taken with fluids or not."
-            "Pay attention to how to combine those medications and add any relevant information to the advise property for each medication where needed."
-            "Return the timesheet with the following fields as json: "
-            "The top level field should me called 'medications' and should contain the same medications as the provided for each of them the following fields should be present:"
-            "id, name, dates, dosage, advise."
-            "Each of those fields should be free text."
-            "For each medication the returned object should contain only those five properties."
-            "The id - should contain the same id as provided in the information and should match the medication."
-            "The name - should contain the same name as provided in the information and should match the medication."
-            "The dates field should be a list of dates with times when the medication should be taken in the provided period. The format should always be '%Y-%m-%dT%H:%M:%S'. Do not skip dates and times even if the period is long"
-            "The dosage should be free text with information on how and how many dosages should be taken from this medication."
-            "The advise should be free text with information for the medication in case there are some specifics when taking it."
-            "The returned value should be a valid json format with no new lines or any text before or after the json output.\n"
-        )
+        prompt = TimesheetService.TIMESHEET_PROMPT
         
         # prompt = (
         #     "You are an assistant that will receive a list of medications, you should use the medication information to build a timesheet for how a user should take the medications."
@@ -131,14 +197,287 @@ class TimesheetService:
         # }
         
         
+        cache_key = TimesheetResponseCache.make_key(
+            TimesheetService.PROMPT_VERSION, OpenAIService.MODEL, medications, start_date_str, end_date_str
+        )
+        cached_timesheet = timesheet_response_cache.get(cache_key)
+        if cached_timesheet is not None:
+            return cached_timesheet
+
+        timesheet = self.__run_json(prompt, data)
+        timesheet_response_cache.put(cache_key, timesheet)
+        return timesheet
+
+    def stream_timesheet(self, medications, start_date_str, end_date_str):
+        """
+        Build a timesheet for taking medications within a specified time frame, yielding each medication entry as
+        soon as it is complete.
+
+        If every medication has a 'dosage_rule', the entries are built by the schedule engine after the advice has been
+        generated. Otherwise the response to the single timesheet prompt is streamed from OpenAI and parsed
+        incrementally. A timesheet found in the cache is yielded at once, and a streamed timesheet is cached once it is
+        complete.
+
+        :param medications: A list of medications with relevant information (e.g., dosage, contents, side effects, objective).
+        :type medications: list
+        :param start_date_str: The start date of the period for taking the medications (in YYYY-MM-DD format).
+        :type start_date_str: str
+        :param end_date_str: The end date of the period for taking the medications (in YYYY-MM-DD format).
+        :type end_date_str: str
+        :return: A generator of dictionaries with fields: id, name, dates, dosage, advise.
+        :rtype: Iterator[dict]
+        :raises ValueError: If the response from OpenAIService is not valid JSON.
+        :raises ConnectionError: If a network error occurs while contacting OpenAIService.
+        :raises IOError: For any other errors that occur while processing the request.
+        """
+        if medications and all(med.get("dosage_rule") for med in medications):
+            advice = self.build_advice(medications)
+            for med in medications:
+                yield self.build_entry(med, start_date_str, end_date_str, advice.get(str(med["id"]), ""))
+            return
+
+        cache_key = TimesheetResponseCache.make_key(
+            TimesheetService.PROMPT_VERSION, OpenAIService.MODEL, medications, start_date_str, end_date_str
+        )
+        cached_timesheet = timesheet_response_cache.get(cache_key)
+        if cached_timesheet is not None:
+            yield from (med for med in cached_timesheet["medications"] if med)
+            return
+
+        data = {
+            "medications": medications,
+            "start_date": start_date_str,
+            "end_date": end_date_str
+        }
+        timesheet_medications = []
+        for med in self.__stream_json_items(TimesheetService.TIMESHEET_PROMPT, data, "medications"):
+            timesheet_medications.append(med)
+            yield med
+        timesheet_response_cache.put(cache_key, {"medications": timesheet_medications})
+
+    def build_advice(self, medications):
+        """
+        Generate the advice text for each medication of a timesheet.
+
+        :param medications: A list of medications with their ID, name, dosage schedule, objective and dosage rule.
+        :type medications: list
+        :return: A dictionary mapping each medication ID to its advice.
+        :rtype: dict
+        :raises ValueError: If the response from OpenAIService is not valid JSON or if it is missing required fields.
+        :raises ConnectionError: If a network error occurs while contacting OpenAIService.
+        :raises IOError: For any other errors that occur while processing the request.
+        """
+        cache_key = TimesheetResponseCache.make_key(
+            f"advice-{TimesheetService.ADVICE_PROMPT_VERSION}", OpenAIService.MODEL, medications, None, None
+        )
+        advice = timesheet_response_cache.get(cache_key)
+        if advice is None:
+            advice = self.__run_json(TimesheetService.ADVICE_PROMPT, {"medications": medications})
+            timesheet_response_cache.put(cache_key, advice)
+        return {str(med.get("id")): med.get("advise", "") for med in advice.get("medications", []) if med}
+
+    def __build_timesheet_from_rules(self, medications, start_date_str, end_date_str):
+        """
+        Build a timesheet whose dates are expanded from the dosage rules of the medications.
+
+        :param medications: A list of medications, each with a 'dosage_rule'.
+        :type medications: list
+        :param start_date_str: The start date of the period for taking the medications (in YYYY-MM-DD format).
+        :type start_date_str: str
+        :param end_date_str: The end date of the period for taking the medications (in YYYY-MM-DD format).
+        :type end_date_str: str
+        :return: A dictionary containing the timesheet with fields: id, name, dates, dosage, advise.
+        :rtype: dict
+        """
+        advice = self.build_advice(medications)
+        timesheet_medications = [
+            self.build_entry(med, start_date_str, end_date_str, advice.get(str(med["id"]), "")) for med in medications
+        ]
+        return {"medications": timesheet_medications}
+
+    def __build_timesheet_in_chunks(self, medications, start_date_str, end_date_str):
+        """
+        Build a timesheet with concurrent requests for each medication without a dosage rule and each month of the
+        timesheet, and one request for the advice of all medications.
+
+        The entries of medications with a dosage rule are built by the schedule engine.
+
+        :param medications: A list of medications with their ID, name, dosage schedule, objective and dosage rule.
+        :type medications: list
+        :param start_date_str: The start date of the period for taking the medications (in YYYY-MM-DD format).
+        :type start_date_str: str
+        :param end_date_str: The end date of the period for taking the medications (in YYYY-MM-DD format).
+        :type end_date_str: str
+        :return: A dictionary containing the timesheet with fields: id, name, dates, dosage, advise.
+        :rtype: dict
+        :raises ValueError: If a response from OpenAIService is not valid JSON.
+        :raises ConnectionError: If a network error occurs while contacting OpenAIService.
+        :raises IOError: For any other errors that occur while processing the requests.
+        """
+        months = TimesheetService.__split_by_month(start_date_str, end_date_str)
+        advice_future = _request_executor.submit(self.build_advice, medications)
+        chunk_futures = {
+            str(med["id"]): [
+                _request_executor.submit(self.__build_chunk, med, start_date_str, end_date_str, month_start, month_end)
+                for month_start, month_end in months
+            ]
+            for med in medications if not med.get("dosage_rule")
+        }
+
+        advice = advice_future.result()
+        timesheet_medications = []
+        for med in medications:
+            med_id = str(med["id"])
+            advise = advice.get(med_id, "")
+            if med_id not in chunk_futures:
+                timesheet_medications.append(self.build_entry(med, start_date_str, end_date_str, advise))
+                continue
+            dates = []
+            dosage = ""
+            for future in chunk_futures[med_id]:
+                chunk = future.result()
+                dates.extend(chunk["dates"])
+                dosage = dosage or chunk["dosage"]
+            timesheet_medications.append({
+                "id": med["id"], "name": med["name"], "dates": dates, "dosage": dosage, "advise": advise
+            })
+        return {"medications": timesheet_medications}
+
+    def __build_chunk(self, medication, start_date_str, end_date_str, chunk_start_str, chunk_end_str):
+        """
+        Generate the dates of a medication in a part of the timesheet period.
+
+        :param medication: The medication with its ID, name, dosage schedule and objective.
+        :type medication: dict
+        :param start_date_str: The start date of the timesheet (in YYYY-MM-DD format).
+        :type start_date_str: str
+        :param end_date_str: The end date of the timesheet (in YYYY-MM-DD format).
+        :type end_date_str: str
+        :param chunk_start_str: The first day of the part of the period (in YYYY-MM-DD format).
+        :type chunk_start_str: str
+        :param chunk_end_str: The last day of the part of the period (in YYYY-MM-DD format).
+        :type chunk_end_str: str
+        :return: A dictionary with the sorted dates in the part of the period and the dosage of the medication.
+        :rtype: dict
+        """
+        cache_key = TimesheetResponseCache.make_key(
+            f"chunk-{TimesheetService.CHUNK_PROMPT_VERSION}-{start_date_str}-{end_date_str}", OpenAIService.MODEL,
+            [medication], chunk_start_str, chunk_end_str
+        )
+        chunk = timesheet_response_cache.get(cache_key)
+        if chunk is None:
+            chunk = self.__run_json(TimesheetService.CHUNK_PROMPT, {
+                "medications": [medication],
+                "timesheet_start_date": start_date_str,
+                "timesheet_end_date": end_date_str,
+                "start_date": chunk_start_str,
+                "end_date": chunk_end_str
+            })
+            timesheet_response_cache.put(cache_key, chunk)
+
+        entry = next((med for med in chunk.get("medications", []) if med), {})
+        # The model may return dates of neighbouring chunks, which are returned by their own requests
+        dates = {
+            str(date_str) for date_str in entry.get("dates") or []
+            if chunk_start_str <= str(date_str)[:10] <= chunk_end_str
+        }
+        return {"dates": sorted(dates), "dosage": entry.get("dosage") or ""}
+
+    @staticmethod
+    def __split_by_month(start_date_str, end_date_str):
+        """
+        Split a period into the parts that fall into each calendar month.
+
+        :param start_date_str: The first day of the period (in YYYY-MM-DD format).
+        :type start_date_str: str
+        :param end_date_str: The last day of the period (in YYYY-MM-DD format).
+        :type end_date_str: str
+        :return: The first and last day of each part (in YYYY-MM-DD format).
+        :rtype: list of tuple
+        """
+        start, end = date.fromisoformat(start_date_str), date.fromisoformat(end_date_str)
+        months = []
+        while start <= end:
+            next_month = (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+            month_end = min(next_month - timedelta(days=1), end)
+            months.append((start.isoformat(), month_end.isoformat()))
+            start = next_month
+        return months
+
+    def build_entry(self, medication, start_date_str, end_date_str, advise):
+        """
+        Build the timesheet entry of a medication with a dosage rule, without contacting OpenAI.
+
+        :param medication: The medication with its ID, name and 'dosage_rule'.
+        :type medication: dict
+        :param start_date_str: The start date of the period for taking the medication (in YYYY-MM-DD format).
+        :type start_date_str: str
+        :param end_date_str: The end date of the period for taking the medication (in YYYY-MM-DD format).
+        :type end_date_str: str
+        :param advise: The advice for the medication, see `build_advice`.
+        :type advise: str
+        :return: A dictionary with fields: id, name, dates, dosage, advise.
+        :rtype: dict
+        """
+        rule = DosageRule(**medication["dosage_rule"])
+        return {
+            "id": medication["id"],
+            "name": medication["name"],
+            "dates": ScheduleEngine.expand(rule, start_date_str, end_date_str),
+            "dosage": rule.dosage,
+            "advise": advise
+        }
+
+    def __stream_json_items(self, prompt, data, key):
+        """
+        Send data to OpenAI and parse the items of an array in the JSON response while it is streamed.
+
+        :param prompt: The system prompt.
+        :type prompt: str
+        :param data: The JSON-serializable data sent as the user message.
+        :type data: dict
+        :param key: The top-level key of the array in the response.
+        :type key: str
+        :return: A generator of the array items, each yielded as soon as it is complete.
+        :rtype: Iterator[dict]
+        :raises ValueError: If the response from OpenAIService is not valid JSON.
+        :raises ConnectionError: If a network error occurs while contacting OpenAIService.
+        :raises IOError: For any other errors that occur while processing the request.
+        """
+        parser = JSONArrayStreamParser(key)
+        try:
+            for text in self.openai_service.stream(prompt, json.dumps(data)):
+                yield from (item for item in parser.feed(text) if item)
+            parser.close()
+        except requests.exceptions.RequestException as e:
+            raise ConnectionError(f"A network error occurred while contacting OpenAIService: {str(e)}")
+        except ValueError as e:
+            logging.error(f"Streamed JSON parsing error: {str(e)}")
+            raise ValueError("The response from OpenAIService is not a valid JSON: " + str(e))
+        except Exception as e:
+            raise IOError(f"An error occurred while processing the request: {str(e)}")
+
+    def __run_json(self, prompt, data):
+        """
+        Send data to OpenAI and parse the JSON response.
+
+        :param prompt: The system prompt.
+        :type prompt: str
+        :param data: The JSON-serializable data sent as the user message.
+        :type data: dict
+        :return: The parsed response.
+        :rtype: dict
+        :raises ValueError: If the response from OpenAIService is not valid JSON.
+        :raises ConnectionError: If a network error occurs while contacting OpenAIService.
+        :raises IOError: For any other errors that occur while processing the request.
+        """
         data_json = json.dumps(data)
         response = ""
 
         try:
             response = self.openai_service.run(prompt, data_json)
             
-            timesheet = json.loads(response)
-            return timesheet
+            return json.loads(response)
         except json.JSONDecodeError as e:
             logging.error(f"JSON decoding error: {str(e)}. Response: {response}")
             raise ValueError("The response from OpenAIService is not a valid JSON. Instead it was: " + response)
@@ -0,0 +1,72 @@
+from collections import OrderedDict
+import threading
+import math
+import time
+
+class TokenBucketLimiter:
+    """
+    A thread-safe rate limiter with a token bucket per key, e.g. per username or per IP address.
+
+    Each bucket holds up to `capacity` tokens and is refilled at `refill_rate` tokens per second. An action is allowed
+    if a token can be taken from the bucket of its key. The buckets of the least recently used keys are dropped when
+    there are more than `max_keys`, which only makes the limiter more permissive for those keys.
+    """
+    DEFAULT_MAX_KEYS = 10000
+
+    def __init__(self, capacity, refill_rate, max_keys=DEFAULT_MAX_KEYS):
+        """
+        Initialize the TokenBucketLimiter instance.
+
+        :param capacity: The maximum number of tokens of a bucket, i.e. the allowed burst.
+        :type capacity: float
+        :param refill_rate: The number of tokens added to a bucket per second.
+        :type refill_rate: float
+        :param max_keys: The maximum number of buckets kept.
+        :type max_keys: int
+        :raises ValueError: If capacity, refill_rate or max_keys is not positive.
+        """
+        if capacity <= 0 or refill_rate <= 0:
+            raise ValueError("capacity and refill_rate must be positive numbers.")
+        if not isinstance(max_keys, int) or max_keys <= 0:
+            raise ValueError("max_keys must be a positive integer.")
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, key):
+        """
+        Take a token from the bucket of a key.
+
+        :param key: The key of the bucket.
+        :type key: str
+        :return: 0 if a token was taken, otherwise the number of seconds until the next token is available.
+        :rtype: int
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated_at) * self.refill_rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                retry_after = 0
+            else:
+                self._buckets[key] = (tokens, now)
+                retry_after = max(1, math.ceil((1 - tokens) / self.refill_rate))
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return retry_after
+
+    def refund(self, key):
+        """
+        Give back a token taken from the bucket of a key, e.g. when another limit rejected the action.
+
+        :param key: The key of the bucket.
+        :type key: str
+        """
+        with self._lock:
+            if key in self._buckets:
+                tokens, updated_at = self._buckets[key]
+                self._buckets[key] = (min(self.capacity, tokens + 1), updated_at)
@@ -0,0 +1,111 @@
+"""
+Tests of `JSONArrayStreamParser`, the incremental parser of the streamed timesheet responses.
+
+Usage::
+
+    python -m pytest tests
+"""
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.json_stream_parser import JSONArrayStreamParser
+
+RESPONSE = {
+    "medications": [
+        {"id": "1", "dosage": "1 tablet", "dates": ["2024-01-01", "2024-01-02"], "advise": "Take \"with\" food."},
+        {"id": "2", "dosage": "5 ml", "dates": [], "advise": "Avoid {braces} and [brackets]\\n."}
+    ]
+}
+
+def parse(pieces, key="medications"):
+    """
+    Feed pieces of JSON text to a parser and close it.
+
+    :param pieces: The pieces of the JSON text.
+    :type pieces: iterable of str
+    :param key: The top-level key of the array whose items are emitted.
+    :type key: str
+    :return: The emitted items and the number of the piece after which each item was emitted.
+    :rtype: tuple
+    """
+    parser = JSONArrayStreamParser(key)
+    items = []
+    emitted_after = []
+    for index, piece in enumerate(pieces):
+        for item in parser.feed(piece):
+            items.append(item)
+            emitted_after.append(index)
+    parser.close()
+    return items, emitted_after
+
+class JSONArrayStreamParserTest(unittest.TestCase):
+
+    def test_every_split_point(self):
+        text = json.dumps(RESPONSE)
+        for split in range(len(text) + 1):
+            with self.subTest(split=split):
+                items, _ = parse([text[:split], text[split:]])
+                self.assertEqual(items, RESPONSE["medications"])
+
+    def test_one_character_at_a_time(self):
+        text = json.dumps(RESPONSE, indent=2)
+        items, emitted_after = parse(text)
+        self.assertEqual(items, RESPONSE["medications"])
+        # Each item is emitted as soon as its closing brace is received
+        for item, index in zip(items, emitted_after):
+            self.assertEqual(text[index], '}')
+        self.assertLess(emitted_after[0], text.index('"id": "2"'))
+
+    def test_escapes(self):
+        text = json.dumps({"medications": [{"id": "a\"}]", "advise": "\\\"{[", "unicode": "é\\u00e9"}]})
+        items, _ = parse(text)
+        self.assertEqual(items, [{"id": "a\"}]", "advise": "\\\"{[", "unicode": "é\\u00e9"}])
+
+    def test_nested_arrays(self):
+        response = {"medications": [{"id": "1", "schedule": [[1, 2], [3, [4]]], "meta": {"dates": [{"day": 1}]}}]}
+        items, _ = parse(json.dumps(response))
+        self.assertEqual(items, response["medications"])
+
+    def test_decoy_keys(self):
+        text = json.dumps({
+            "note": "medications",
+            "other": {"medications": [{"id": "nested"}]},
+            "list": [{"medications": [{"id": "in list"}]}],
+            "medications": [{"id": "1"}],
+            "trailer": {"medications": [{"id": "after"}]}
+        })
+        items, _ = parse(text)
+        self.assertEqual(items, [{"id": "1"}])
+
+    def test_later_array_with_the_same_key_is_ignored(self):
+        items, _ = parse('{"medications": [{"id": "1"}], "medications": [{"id": "2"}]}')
+        self.assertEqual(items, [{"id": "1"}])
+
+    def test_incomplete_text(self):
+        parser = JSONArrayStreamParser("medications")
+        self.assertEqual(parser.feed('{"medications": [{"id": "1"}, {"id": '), [{"id": "1"}])
+        with self.assertRaises(ValueError):
+            parser.close()
+
+    def test_missing_array(self):
+        parser = JSONArrayStreamParser("medications")
+        parser.feed('{"other": []}')
+        with self.assertRaises(ValueError):
+            parser.close()
+
+    def test_invalid_item(self):
+        parser = JSONArrayStreamParser("medications")
+        with self.assertRaises(ValueError):
+            parser.feed('{"medications": [{"id": 1,}]}')
+
+    def test_unexpected_closing_bracket(self):
+        parser = JSONArrayStreamParser("medications")
+        with self.assertRaises(ValueError):
+            parser.feed(']')
+
+if __name__ == '__main__':
+    unittest.main()
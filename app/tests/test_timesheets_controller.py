@@ -0,0 +1,79 @@
+"""
+Tests of the request validation of `TimesheetsController`, which answers before any database or OpenAI call.
+
+Usage::
+
+    python -m pytest tests
+"""
+from unittest import mock
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from controllers.timesheets_controller import TimesheetsController
+
+class StreamTimesheetValidationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.controller = TimesheetsController(mock.Mock(), mock.Mock(), mock.Mock())
+
+    def stream(self, body):
+        with self.app.test_request_context('/timesheet/stream', method='POST', json=body):
+            return self.controller.stream_timesheet()
+
+    def test_medication_id_that_is_not_an_object_id(self):
+        response = self.stream({
+            'medication_ids': ['not-an-object-id'], 'start_date': '2024-01-01', 'end_date': '2024-01-31'
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('medication_ids', response.get_json()['error'])
+        self.controller.timesheet_service.stream_timesheet.assert_not_called()
+
+    def test_medication_id_that_is_not_a_string(self):
+        response = self.stream({'medication_ids': [42], 'start_date': '2024-01-01', 'end_date': '2024-01-31'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_missing_field(self):
+        response = self.stream({'medication_ids': ['6642f0a1c2b1a2d3e4f5a6b7'], 'start_date': '2024-01-01'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['error'], 'Missing required field: end_date')
+
+    def test_invalid_date(self):
+        response = self.stream({
+            'medication_ids': ['6642f0a1c2b1a2d3e4f5a6b7'], 'start_date': '2024-13-01', 'end_date': '2024-01-31'
+        })
+        self.assertEqual(response.status_code, 400)
+
+class EditTimesheetValidationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.controller = TimesheetsController(mock.Mock(), mock.Mock(), mock.Mock())
+
+    def edit(self, version):
+        body = {
+            'medication_ids': ['6642f0a1c2b1a2d3e4f5a6b7'],
+            'start_date': '2024-01-01',
+            'end_date': '2024-01-31',
+            'version': version
+        }
+        with self.app.test_request_context('/timesheet/6642f0a1c2b1a2d3e4f5a6b8', method='PUT', json=body):
+            with mock.patch('controllers.timesheets_controller.Timesheets') as timesheets:
+                response = self.controller.edit_timesheet('6642f0a1c2b1a2d3e4f5a6b8')
+                timesheets.find.assert_not_called()
+        return response
+
+    def test_version_that_is_not_an_integer(self):
+        for version in ['3', 3.0, True, None, [3]]:
+            with self.subTest(version=version):
+                response = self.edit(version)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.get_json()['error'], 'version must be an integer.')
+        self.controller.job_service.enqueue.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,5 @@
 import axios from 'axios';
-import {TimeSheet, TimesheetBe} from '../models/timesheet_model'
+import {Medication, MedicationBe, TimeSheet, TimesheetBe} from '../models/timesheet_model'
 
 export const fetchTimesheets = async () => {
   const response = await axios.get('/api/timesheets/timesheets', { withCredentials: true });
@@ -11,25 +11,125 @@ export const fetchTimesheet = async () => {
   return new TimeSheet(response.data);
 };
 
+const JOB_POLL_INTERVAL = 1000;
+
+// Timesheets are generated in background jobs: wait for the job and return the ID of its timesheet
+const waitForTimesheetJob = async (job: { job_id: string }): Promise<string> => {
+  for (;;) {
+    const response = await axios.get(`/api/timesheets/jobs/${job.job_id}`, { withCredentials: true });
+    if (response.data.status === 'completed') {
+      return response.data.result.timesheet_id;
+    }
+    if (response.data.status === 'failed') {
+      throw new Error(response.data.error || 'The timesheet could not be generated.');
+    }
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL));
+  }
+};
+
+export const fetchTimesheetById = async (id: string) => {
+  const response = await axios.get(`/api/timesheets/timesheet/${id}`, { withCredentials: true });
+  return new TimeSheet(response.data);
+};
+
 export const createTimesheet = async (data: { medication_ids: string[], start_date: string, end_date: string }) => {
   const response = await axios.post('/api/timesheets/timesheet', data, {
     withCredentials: true, // Include credentials for CORS
   });
-  return response.data;
+  return fetchTimesheetById(await waitForTimesheetJob(response.data));
 };
 
 export const deleteTimesheet = async (id: string) => {
   await axios.delete(`/api/timesheets/timesheet/${id}`, { withCredentials: true });
 };
 
-export const updateTimesheet = async (data: { medication_ids: string[], start_date: string, end_date: string }) => {
-  const response = await axios.put('/api/timesheets/timesheet', data, {
+export const updateTimesheet = async (
+  id: string,
+  data: { medication_ids: string[], start_date: string, end_date: string, version?: number },
+) => {
+  const response = await axios.put(`/api/timesheets/timesheet/${id}`, data, {
     withCredentials: true,
   });
-  return new TimeSheet(response.data);
+  return fetchTimesheetById(await waitForTimesheetJob(response.data));
 };
 
 export const fetchActiveTimesheet = async () => {
     const response = await axios.get('/api/timesheets/timesheet/active', { withCredentials: true });
     return new TimeSheet(response.data);
 };
+
+// Dispatch the events of a 'text/event-stream' chunk, returning the incomplete event left at its end
+const dispatchServerSentEvents = (text: string, dispatch: (event: string, data: string) => void) => {
+  const blocks = text.split('\n\n');
+  const rest = blocks.pop() ?? '';
+  for (const block of blocks) {
+    let event = 'message';
+    const data: string[] = [];
+    for (const line of block.split('\n')) {
+      if (line.startsWith('event: ')) {
+        event = line.slice('event: '.length);
+      } else if (line.startsWith('data: ')) {
+        data.push(line.slice('data: '.length));
+      }
+    }
+    dispatch(event, data.join('\n'));
+  }
+  return rest;
+};
+
+// The timesheet is streamed from a POST request, so it is read with fetch rather than EventSource
+export const streamTimesheet = (
+  data: { medication_ids: string[], start_date: string, end_date: string },
+  handlers: {
+    onMedication: (medication: Medication) => void,
+    onTimesheet: (timesheetId: string) => void,
+    onError: (error: string) => void,
+  },
+) => {
+  const controller = new AbortController();
+  let finished = false;
+  const dispatch = (event: string, eventData: string) => {
+    if (event === 'medication') {
+      handlers.onMedication(new Medication(JSON.parse(eventData) as MedicationBe));
+    } else if (event === 'timesheet') {
+      finished = true;
+      handlers.onTimesheet(JSON.parse(eventData).timesheet_id);
+    } else if (event === 'error') {
+      finished = true;
+      handlers.onError(JSON.parse(eventData).error);
+    }
+  };
+  const read = async () => {
+    const response = await fetch('/api/timesheets/timesheet/stream', {
+      method: 'POST',
+      credentials: 'include',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(data),
+      signal: controller.signal,
+    });
+    if (!response.ok || !response.body) {
+      const body = await response.json().catch(() => ({}));
+      throw new Error(body.error ?? 'The timesheet could not be generated.');
+    }
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let pending = '';
+    for (;;) {
+      const { done, value } = await reader.read();
+      if (done) {
+        break;
+      }
+      pending = dispatchServerSentEvents(pending + decoder.decode(value, { stream: true }), dispatch);
+    }
+    dispatchServerSentEvents(pending + decoder.decode() + '\n\n', dispatch);
+    if (!finished) {
+      throw new Error('The timesheet stream was interrupted.');
+    }
+  };
+  read().catch((error: Error) => {
+    if (!controller.signal.aborted) {
+      handlers.onError(error.message);
+    }
+  });
+  return controller;
+};